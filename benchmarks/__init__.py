@@ -0,0 +1,10 @@
+"""
+Local load-test and benchmark suite.
+
+    python -m benchmarks.dataset --movies 1000000 --users 10000 --db data/bench.db
+    python -m benchmarks.load --db data/bench.db --out bench_output.json
+    python -m benchmarks.regression bench_output.json
+
+`load` drives the ASGI app in-process (or a running uvicorn with --url) and
+`regression` compares its p95 latencies with benchmarks/baseline.json.
+"""
@@ -0,0 +1,56 @@
+import argparse
+import timeit
+
+from benchmarks.dataset import generate_movies
+from src.compression import CODINGS, compressor
+from src.serialization import MOVIE_FIELDS, movies_to_json
+
+# Bytes saved against CPU spent for one list response body (GET /movies/?size=N), per coding
+# and level, with the same stream objects the middleware uses.
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 6, 11), "zstd": (1, 3, 9)}
+
+
+def page_body(size: int) -> bytes:
+    rows = [tuple(dict(movie, id=i + 1)[name] for name in MOVIE_FIELDS) for i, movie in enumerate(generate_movies(size))]
+    return movies_to_json(rows)
+
+
+def measure(size: int, number: int) -> list[dict]:
+    body = page_body(size)
+    results = []
+    for coding, levels in LEVELS.items():
+        if coding not in CODINGS:
+            continue
+        for level in levels:
+            compressed = compressor(coding, level).finish(body)
+            seconds = min(timeit.repeat(lambda: compressor(coding, level).finish(body), number=number, repeat=5)) / number
+            results.append({
+                "size": size,
+                "coding": coding,
+                "level": level,
+                "bytes_in": len(body),
+                "bytes_out": len(compressed),
+                "saved_pct": round(100 * (1 - len(compressed) / len(body)), 1),
+                "cpu_us": round(seconds * 1e6, 1),
+                "saved_bytes_per_cpu_us": round((len(body) - len(compressed)) / (seconds * 1e6), 1),
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compression ratio and CPU cost of one page of movies")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args(argv)
+    print(f"{'page size':>9} {'coding':>6} {'level':>5} {'bytes in':>9} {'bytes out':>9} {'saved':>6} {'cpu µs':>8} {'saved B/µs':>10}")
+    for size in args.sizes:
+        for result in measure(size, args.number):
+            print(
+                f"{result['size']:>9} {result['coding']:>6} {result['level']:>5} {result['bytes_in']:>9} {result['bytes_out']:>9} "
+                f"{result['saved_pct']:>5}% {result['cpu_us']:>8} {result['saved_bytes_per_cpu_us']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
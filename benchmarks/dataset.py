@@ -0,0 +1,92 @@
+import argparse
+import random
+import time
+from typing import Iterator
+
+from sqlalchemy import insert
+from sqlmodel import Session, create_engine
+
+from src.database import db_path
+from src.migrations import run_migrations
+from src.models.tables import Movie, User
+from src.security import get_password_hash
+
+# Deterministic synthetic catalog: the same seed and sizes always produce the same rows,
+# so benchmark runs on different machines or commits are comparable.
+
+BENCH_PASSWORD = "benchmark-password"
+ADMIN_USERNAME = "bench_admin"
+
+CATEGORIES = [
+    "Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family",
+    "Fantasy", "History", "Horror", "Musical", "Mystery", "Romance", "Science Fiction",
+    "Thriller", "War", "Western",
+]
+WORDS = (
+    "lost city night river shadow empire storm last journey secret winter garden silent "
+    "broken golden island dream fire queen stranger house road memory ocean mountain "
+    "midnight hunter star kingdom letter summer promise ghost machine voyage legacy "
+    "detective family war love escape return frontier signal harbour orbit"
+).split()
+
+
+def generate_movies(count: int, seed: int = 42) -> Iterator[dict]:
+    rng = random.Random(seed)
+    for _ in range(count):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        overview = " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 40))).capitalize() + "."
+        yield {
+            "title": title[:60],
+            "overview": overview,
+            "year": rng.randint(1920, 2025),
+            "rating": round(rng.uniform(1, 10), 1),
+            "category": rng.choice(CATEGORIES),
+        }
+
+
+def generate_users(count: int, password_hash: str) -> Iterator[dict]:
+    # One shared hash: hashing 10k passwords with argon2 would dominate the setup time
+    yield {"username": ADMIN_USERNAME, "password": password_hash, "role": "admin"}
+    for i in range(count - 1):
+        yield {"username": f"bench_user_{i:07d}", "password": password_hash, "role": "client"}
+
+
+def insert_chunked(session: Session, table, rows: Iterator[dict], chunk_size: int) -> int:
+    total, chunk = 0, []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            session.exec(insert(table), params=chunk)
+            session.commit()
+            total, chunk = total + len(chunk), []
+    if chunk:
+        session.exec(insert(table), params=chunk)
+        session.commit()
+        total += len(chunk)
+    return total
+
+
+def populate(db_url: str, movies: int, users: int, seed: int = 42, chunk_size: int = 5000) -> dict:
+    """Creates the schema at `db_url` and fills it with `movies` movies and `users` users."""
+    engine = create_engine(db_url)
+    run_migrations(engine)
+    started = time.perf_counter()
+    with Session(engine) as session:
+        inserted_movies = insert_chunked(session, Movie, generate_movies(movies, seed), chunk_size)
+        inserted_users = insert_chunked(session, User, generate_users(users, get_password_hash(BENCH_PASSWORD)), chunk_size) if users else 0
+    engine.dispose()
+    return {"movies": inserted_movies, "users": inserted_users, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill a SQLite database with a synthetic catalog")
+    parser.add_argument("--db", default=str(db_path), help="SQLite file to create or extend")
+    parser.add_argument("--movies", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    print(populate(f"sqlite:///{args.db}", args.movies, args.users, args.seed))
+
+
+if __name__ == "__main__":
+    main()
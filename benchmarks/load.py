@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Callable, Union
+
+import httpx
+from sqlalchemy import func
+from sqlmodel import Session, create_engine, select
+
+from benchmarks.dataset import ADMIN_USERNAME, BENCH_PASSWORD, CATEGORIES, WORDS
+from src.database import db_path
+from src.models.tables import Movie
+
+# Async load driver: runs every route of movie_router and auth_router with a fixed number of
+# concurrent clients and reports throughput and p50/p95/p99 latency per route.
+
+
+@dataclass
+class Context:
+    rng: random.Random
+    movie_count: int
+    created_ids: list = field(default_factory=list)
+    counter: int = 0
+
+    def movie_id(self) -> int:
+        return self.rng.randint(1, max(self.movie_count, 1))
+
+    def next_number(self) -> int:
+        self.counter += 1
+        return self.counter
+
+
+def _movie_body(ctx: Context) -> dict:
+    return {
+        "title": f"Load {ctx.rng.choice(WORDS)} {ctx.next_number()}",
+        "overview": " ".join(ctx.rng.choice(WORDS) for _ in range(20)),
+        "year": ctx.rng.randint(1950, 2025),
+        "rating": round(ctx.rng.uniform(1, 10), 1),
+        "category": ctx.rng.choice(CATEGORIES),
+    }
+
+def _bulk_body(ctx: Context) -> bytes:
+    return "\n".join(json.dumps(_movie_body(ctx)) for _ in range(100)).encode()
+
+def _created_id(ctx: Context) -> int:
+    return ctx.created_ids.pop() if ctx.created_ids else ctx.movie_id()
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[Context], tuple]
+    # Heavy routes (full export, argon2) get fewer requests than the rest
+    max_requests: Union[int, None] = None
+    needs_auth: bool = False
+
+
+SCENARIOS = [
+    Scenario("GET /movies/", lambda ctx: ("GET", "/movies/", {"params": {"page": ctx.rng.randint(1, 50), "size": 20}})),
+    Scenario("GET /movies/ (cursor)", lambda ctx: ("GET", "/movies/", {"params": {"size": 20, "sort": ctx.rng.choice(["year", "rating", "title"])}})),
+    Scenario("GET /movies/ (filtered)", lambda ctx: ("GET", "/movies/", {"params": {"size": 20, "category": ctx.rng.choice(CATEGORIES), "min_rating": 7, "sort": "year"}})),
+    Scenario("GET /movies/{id}", lambda ctx: ("GET", f"/movies/{ctx.movie_id()}", {})),
+    Scenario("GET /movies/batch", lambda ctx: ("GET", "/movies/batch", {"params": {"ids": ",".join(str(ctx.movie_id()) for _ in range(50))}})),
+    Scenario("POST /movies/batch", lambda ctx: ("POST", "/movies/batch", {"json": {"ids": [ctx.movie_id() for _ in range(500)]}}), max_requests=50),
+    # Against --url, build the index first (python -m src.similarity) or the first requests get 503
+    Scenario("GET /movies/{id}/similar", lambda ctx: ("GET", f"/movies/{ctx.movie_id()}/similar", {})),
+    Scenario("GET /movies/changes", lambda ctx: ("GET", "/movies/changes", {"params": {"since": ctx.movie_id(), "limit": 100}})),
+    # A short stream: the backlog after a recent cursor, then the stream ends
+    Scenario("GET /movies/changes/stream", lambda ctx: ("GET", "/movies/changes/stream", {"params": {"since": max(ctx.movie_count - 50, 0), "max_seconds": 0.05}}), max_requests=20),
+    Scenario("GET /movies/by_category", lambda ctx: ("GET", "/movies/by_category", {"params": {"category": ctx.rng.choice(CATEGORIES)[:5]}}), max_requests=50),
+    Scenario("GET /movies/stats", lambda ctx: ("GET", "/movies/stats", {"params": {"category": ctx.rng.choice(CATEGORIES)} if ctx.rng.random() < 0.5 else {}})),
+    Scenario("GET /movies/search", lambda ctx: ("GET", "/movies/search", {"params": {"q": " ".join(ctx.rng.sample(WORDS, 2))}})),
+    Scenario("GET /movies/get_file", lambda ctx: ("GET", "/movies/get_file", {})),
+    Scenario("GET /movies/export", lambda ctx: ("GET", "/movies/export", {}), max_requests=2),
+    Scenario("POST /movies/", lambda ctx: ("POST", "/movies/", {"json": _movie_body(ctx)})),
+    Scenario("POST /movies/bulk", lambda ctx: ("POST", "/movies/bulk", {"content": _bulk_body(ctx)}), max_requests=20),
+    Scenario("PUT /movies/{id}", lambda ctx: ("PUT", f"/movies/{ctx.movie_id()}", {"json": {"rating": round(ctx.rng.uniform(1, 10), 1)}})),
+    Scenario("DELETE /movies/{id}", lambda ctx: ("DELETE", f"/movies/{_created_id(ctx)}", {})),
+    Scenario("POST /auth/register", lambda ctx: ("POST", "/auth/register", {"json": {"username": f"load_user_{time.time_ns()}_{ctx.next_number()}", "password": BENCH_PASSWORD}}), max_requests=50),
+    Scenario("POST /auth/login", lambda ctx: ("POST", "/auth/login", {"data": {"username": ADMIN_USERNAME, "password": BENCH_PASSWORD}}), max_requests=50),
+    Scenario("GET /auth/profile", lambda ctx: ("GET", "/auth/profile", {}), needs_auth=True),
+    Scenario("GET /auth/dashboard", lambda ctx: ("GET", "/auth/dashboard", {}), needs_auth=True),
+    Scenario("POST /auth/dashboard/stats/check", lambda ctx: ("POST", "/auth/dashboard/stats/check", {"params": {"repair": "false"}}), max_requests=5, needs_auth=True),
+    Scenario("POST /auth/dashboard/changes/compact", lambda ctx: ("POST", "/auth/dashboard/changes/compact", {}), max_requests=5, needs_auth=True),
+    Scenario("GET /auth/dashboard/queries", lambda ctx: ("GET", "/auth/dashboard/queries", {"params": {"limit": 20}}), needs_auth=True),
+    # Enqueue only: the benchmark runs without the lifespan, so no worker picks the jobs up
+    Scenario("POST /auth/dashboard/jobs", lambda ctx: ("POST", "/auth/dashboard/jobs", {"json": {"type": "optimize", "dedup_key": "optimize"}}), max_requests=20, needs_auth=True),
+    Scenario("GET /auth/dashboard/jobs", lambda ctx: ("GET", "/auth/dashboard/jobs", {}), needs_auth=True),
+    Scenario("GET /auth/dashboard/jobs/{id}", lambda ctx: ("GET", "/auth/dashboard/jobs/1", {}), needs_auth=True),
+]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, ctx: Context, requests: int, concurrency: int) -> dict:
+    total = min(requests, scenario.max_requests or requests)
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = scenario.build(ctx)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+            if scenario.name == "POST /movies/" and response.status_code == 201:
+                ctx.created_ids.append(response.json()["id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": sum(count for code, count in statuses.items() if code >= 500),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+    }
+
+
+def asgi_client(db: str) -> httpx.AsyncClient:
+    """In-process client for src.main:app, with the session dependencies pointed at `db`."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from src.config import settings
+    from src.changes import run_with_connection
+    from src.database import get_async_session, get_session, sqlite_pragmas
+    from src.similarity import build_index, read_documents
+    from src.main import app
+
+    # The benchmark measures the routes, not the per-client limits: every request comes from one client
+    settings.RATE_LIMITS = {}
+    engine = sqlite_pragmas(create_engine(f"sqlite:///{db}", connect_args={"check_same_thread": False}))
+    # ... and similarity lookups, not the first build of the index
+    settings.SIMILARITY_INDEX_DIR = str(Path(db).with_suffix(".similarity"))
+    build_index(Path(settings.SIMILARITY_INDEX_DIR), run_with_connection(engine, read_documents))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db}")
+    sqlite_pragmas(async_engine.sync_engine)
+
+    def get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=120)
+
+
+def count_movies(db: str) -> int:
+    engine = create_engine(f"sqlite:///{db}")
+    with Session(engine) as session:
+        count = session.exec(select(func.count()).select_from(Movie)).one()
+    engine.dispose()
+    return count
+
+
+async def run(client: httpx.AsyncClient, movie_count: int, requests: int, concurrency: int, seed: int = 42, only: Union[list, None] = None) -> dict:
+    ctx = Context(rng=random.Random(seed), movie_count=movie_count)
+    login = await client.post("/auth/login", data={"username": ADMIN_USERNAME, "password": BENCH_PASSWORD})
+    results = {}
+    for scenario in SCENARIOS:
+        if only and scenario.name not in only:
+            continue
+        client.cookies = login.cookies if scenario.needs_auth else httpx.Cookies()
+        results[scenario.name] = await run_scenario(client, scenario, ctx, requests, concurrency)
+    return {
+        "meta": {"movies": movie_count, "requests": requests, "concurrency": concurrency, "seed": seed},
+        "routes": results,
+    }
+
+
+def print_report(report: dict):
+    print(f"{'route':32} {'req':>6} {'err':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, row in report["routes"].items():
+        print(f"{name:32} {row['requests']:>6} {row['errors']:>5} {row['throughput_rps']:>9} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test every movie and auth route")
+    parser.add_argument("--db", default=str(db_path), help="Database seeded with benchmarks.dataset (in-process mode)")
+    parser.add_argument("--url", help="Base URL of a running server (e.g. http://127.0.0.1:8000) instead of the in-process app")
+    parser.add_argument("--movies", type=int, help="Catalog size when using --url (default: counted from --db)")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    movie_count = args.movies if args.movies is not None else count_movies(args.db)
+    client = httpx.AsyncClient(base_url=args.url, timeout=120) if args.url else asgi_client(args.db)
+
+    async def go():
+        async with client:
+            return await run(client, movie_count, args.requests, args.concurrency, args.seed)
+
+    report = asyncio.run(go())
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump(report, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from sqlmodel import Session, create_engine, select
+
+from benchmarks.dataset import populate
+from src.dependencies import MovieFilterParams, PaginationParams
+from src.models.tables import Movie as MovieDB
+from src.reads import fetch, movie_by_id, movie_page, movies_matching
+from src.search import build_match, match_statement
+
+# CPU time and memory per request of the movie reads, in a session per request like the API:
+# ORM instances (select(Movie), identity map) against the read path of src/reads.py (column
+# rows from precompiled statements). Only the database work; serialization is benchmarks/serialization.py.
+
+
+def orm_queries() -> dict:
+    match = build_match("drama", column="category")
+
+    def by_id(session: Session):
+        return session.exec(select(MovieDB).where(MovieDB.id == 42)).first()
+
+    def page(session: Session):
+        pagination, filters = PaginationParams(page=3, size=20, sort="year"), MovieFilterParams(category="Drama")
+        return session.exec(pagination.apply(filters.apply(select(MovieDB), MovieDB), MovieDB)).all()
+
+    def by_category(session: Session):
+        return session.exec(match_statement(match, select(MovieDB)).order_by(MovieDB.id)).all()
+
+    return {"by_id": by_id, "page": page, "by_category": by_category}
+
+
+def row_queries() -> dict:
+    match = build_match("drama", column="category")
+
+    def by_id(session: Session):
+        return fetch(session, movie_by_id(42))
+
+    def page(session: Session):
+        pagination, filters = PaginationParams(page=3, size=20, sort="year"), MovieFilterParams(category="Drama")
+        return fetch(session, movie_page(pagination, filters))
+
+    def by_category(session: Session):
+        return fetch(session, movies_matching(match))
+
+    return {"by_id": by_id, "page": page, "by_category": by_category}
+
+
+def request(engine, query):
+    with Session(engine) as session:
+        return query(session)
+
+
+def cpu_us(engine, query, number: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.process_time()
+        for _ in range(number):
+            request(engine, query)
+        best = min(best, (time.process_time() - started) / number * 1e6)
+    return best
+
+
+def peak_kib(engine, query) -> float:
+    """Most memory held at once during one request, over what was held before it."""
+    request(engine, query)  # warm: statement caches, pool connection
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        request(engine, query)
+        return (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _ids(result) -> list[int]:
+    return [movie.id for movie in (result if isinstance(result, list) else [result])]
+
+
+def measure(db: Path, movies: int, number: int) -> list[dict]:
+    populate(f"sqlite:///{db}", movies, users=0)
+    engine = create_engine(f"sqlite:///{db}")
+    results = []
+    orm, rows = orm_queries(), row_queries()
+    for name in orm:
+        assert _ids(request(engine, orm[name])) == _ids(request(engine, rows[name]))
+        orm_us, rows_us = cpu_us(engine, orm[name], number), cpu_us(engine, rows[name], number)
+        results.append({
+            "query": name,
+            "orm_us": round(orm_us, 1),
+            "rows_us": round(rows_us, 1),
+            "speedup": round(orm_us / rows_us, 1),
+            "orm_kib": round(peak_kib(engine, orm[name]), 1),
+            "rows_kib": round(peak_kib(engine, rows[name]), 1),
+        })
+    engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CPU and memory per request: ORM reads vs the row read path")
+    parser.add_argument("--movies", type=int, default=10_000)
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args(argv)
+    print(f"{'query':>11} {'ORM µs':>8} {'rows µs':>8} {'speedup':>8} {'ORM KiB':>8} {'rows KiB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for result in measure(Path(tmp) / "reads.db", args.movies, args.number):
+            print(
+                f"{result['query']:>11} {result['orm_us']:>8} {result['rows_us']:>8} {result['speedup']:>7}x"
+                f" {result['orm_kib']:>8} {result['rows_kib']:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Compares a benchmarks.load report with the committed baseline: a route fails when its p95
+# exceeds the baseline by more than `threshold` (relative) and `min_slack_ms` (absolute, so
+# sub-millisecond routes do not fail on scheduler noise). A route measured without a baseline
+# entry fails too, and so does a baseline route the report did not measure: a new scenario
+# lands together with its baseline (`--update`).
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+
+def find_regressions(report: dict, baseline: dict) -> list[dict]:
+    threshold = baseline.get("threshold", 0.25)
+    min_slack_ms = baseline.get("min_slack_ms", 2.0)
+    regressions = [
+        {"route": name, "p95_ms": row["p95_ms"], "limit_ms": None, "errors": row["errors"], "reason": "not in the baseline"}
+        for name, row in report["routes"].items() if name not in baseline["routes"]
+    ]
+    for name, expected in baseline["routes"].items():
+        measured = report["routes"].get(name)
+        if measured is None:
+            regressions.append({"route": name, "p95_ms": None, "limit_ms": expected["p95_ms"], "errors": None, "reason": "not measured"})
+            continue
+        limit = max(expected["p95_ms"] * (1 + threshold), expected["p95_ms"] + min_slack_ms)
+        if measured["p95_ms"] > limit or measured["errors"] > expected.get("errors", 0):
+            regressions.append({"route": name, "p95_ms": measured["p95_ms"], "limit_ms": round(limit, 2), "errors": measured["errors"], "reason": "slower"})
+    return regressions
+
+
+def make_baseline(report: dict, threshold=None) -> dict:
+    return {
+        "meta": report["meta"],
+        "threshold": 0.25 if threshold is None else threshold,
+        "min_slack_ms": 2.0,
+        "routes": {
+            name: {"p95_ms": row["p95_ms"], "errors": row["errors"]}
+            for name, row in report["routes"].items()
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fail when a route got slower than the baseline allows")
+    parser.add_argument("report", help="JSON written by python -m benchmarks.load --out")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--threshold", type=float, help="Override the relative p95 threshold of the baseline")
+    parser.add_argument("--update", action="store_true", help="Write the report as the new baseline instead of checking it")
+    args = parser.parse_args(argv)
+
+    report = json.loads(Path(args.report).read_text())
+    if args.update:
+        Path(args.baseline).write_text(json.dumps(make_baseline(report, args.threshold), indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text())
+    if args.threshold is not None:
+        baseline["threshold"] = args.threshold
+
+    regressions = find_regressions(report, baseline)
+    for regression in regressions:
+        if regression["reason"] == "slower":
+            print(f"REGRESSION {regression['route']}: p95 {regression['p95_ms']} ms > {regression['limit_ms']} ms (errors: {regression['errors']})")
+        else:
+            print(f"REGRESSION {regression['route']}: {regression['reason']}")
+    if not regressions:
+        print(f"OK: {len(baseline['routes'])} routes within {baseline.get('threshold', 0.25):.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import argparse
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from benchmarks.dataset import generate_movies
+from src.models.movie_model import Movie as MovieResponse
+from src.models.tables import Movie as MovieDB
+from src.serialization import MOVIE_FIELDS, movies_to_json
+
+# Microbenchmark of one list response body: the default FastAPI path (validate ORM objects into
+# list[Movie], jsonable_encoder, json.dumps) against the FAST_JSON path (column tuples -> orjson).
+
+LIST_ADAPTER = TypeAdapter(list[MovieResponse])
+
+
+def default_path(objects: list) -> bytes:
+    validated = LIST_ADAPTER.validate_python(objects, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated), separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(rows: list) -> bytes:
+    return movies_to_json(rows)
+
+
+def measure(size: int, number: int) -> dict:
+    data = [dict(movie, id=i + 1) for i, movie in enumerate(generate_movies(size))]
+    objects = [MovieDB(**movie) for movie in data]
+    rows = [tuple(movie[name] for name in MOVIE_FIELDS) for movie in data]
+    assert json.loads(default_path(objects)) == json.loads(fast_path(rows))
+
+    default_us = min(timeit.repeat(lambda: default_path(objects), number=number, repeat=5)) / number * 1e6
+    fast_us = min(timeit.repeat(lambda: fast_path(rows), number=number, repeat=5)) / number * 1e6
+    return {"size": size, "default_us": round(default_us, 1), "fast_us": round(fast_us, 1), "speedup": round(default_us / fast_us, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serialization cost of one page of movies")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args(argv)
+    print(f"{'page size':>9} {'default µs':>11} {'fast µs':>9} {'speedup':>8}")
+    for size in args.sizes:
+        result = measure(size, args.number)
+        print(f"{result['size']:>9} {result['default_us']:>11} {result['fast_us']:>9} {result['speedup']:>7}x")
+
+
+if __name__ == "__main__":
+    main()
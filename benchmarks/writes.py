@@ -0,0 +1,61 @@
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from sqlmodel import Session, create_engine
+
+from benchmarks.dataset import generate_movies
+from src import writes
+from src.database import WriteQueue, sqlite_pragmas
+from src.migrations import run_migrations
+from src.models.tables import Movie
+
+# Sustained insert throughput by number of concurrent writers: one ORM transaction per row
+# (add, commit, refresh) against the group-commit queue of src/database.py.
+
+
+def per_request_commit(engine, movie: dict):
+    with Session(engine) as session:
+        row = Movie(**movie)
+        session.add(row)
+        session.commit()
+        session.refresh(row)
+
+
+def measure(db: Path, concurrency: int, count: int) -> dict:
+    engine = sqlite_pragmas(create_engine(f"sqlite:///{db}", connect_args={"check_same_thread": False}, pool_size=concurrency + 1))
+    run_migrations(engine)
+    movies = list(generate_movies(count))
+    writer = WriteQueue(engine)
+    results = {"concurrency": concurrency}
+    with ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        list(pool.map(partial(per_request_commit, engine), movies))
+        results["per_request_rps"] = round(count / (time.perf_counter() - started))
+
+        started = time.perf_counter()
+        list(pool.map(lambda movie: writer.submit(partial(writes.insert_movie, values=movie)).result(), movies))
+        results["group_commit_rps"] = round(count / (time.perf_counter() - started))
+    results["rows_per_batch"] = round(writer.writes / max(writer.batches, 1), 1)
+    writer.shutdown()
+    engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Insert throughput: per-request commit vs group commit")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--rows", type=int, default=2000, help="Rows inserted by each variant per concurrency level")
+    args = parser.parse_args(argv)
+    print(f"{'writers':>7} {'per-request rows/s':>19} {'group commit rows/s':>20} {'rows/batch':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrency in args.concurrency:
+            result = measure(Path(tmp) / f"writes_{concurrency}.db", concurrency, args.rows)
+            print(f"{concurrency:>7} {result['per_request_rps']:>19} {result['group_commit_rps']:>20} {result['rows_per_batch']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Union
+
+from fastapi import HTTPException, status
+from fastapi.requests import Request
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+from src.cache import BoundedTTLMap
+from src.config import settings
+from src.security import decode_username
+
+# Admission control in front of the app: a global cap on requests being served with a bounded,
+# deadline-limited wait queue (503 + Retry-After beyond it), and per-client token buckets per
+# route (429 + Retry-After). Shedding early keeps the latency of admitted requests bounded
+# instead of letting everything queue behind the threadpool. State is per worker process.
+
+
+class ConcurrencyLimiter:
+    """
+    At most ADMISSION_MAX_CONCURRENCY requests run; up to ADMISSION_QUEUE_SIZE more wait, in
+    arrival order, for ADMISSION_QUEUE_TIMEOUT_MS at most. Only used from the event loop.
+    """
+    def __init__(self):
+        self.active = 0
+        self.waiters: deque = deque()
+        self.rejected = {"queue_full": 0, "deadline": 0}
+
+    async def acquire(self) -> bool:
+        if self.active < settings.ADMISSION_MAX_CONCURRENCY and not self.waiters:
+            self.active += 1
+            return True
+        if len(self.waiters) >= settings.ADMISSION_QUEUE_SIZE:
+            self.rejected["queue_full"] += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            # release() hands its slot straight to the first waiter, so `active` is already counted
+            await asyncio.wait_for(future, settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected["deadline"] += 1
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot arrived as the client went away
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def release(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def reset(self):
+        self.active = 0
+        self.waiters.clear()
+        self.rejected = {"queue_full": 0, "deadline": 0}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    capacity: float  # burst
+    period: float  # seconds to refill `capacity` tokens
+
+    @classmethod
+    def parse(cls, text: str) -> "RateLimit":
+        """'10/60' = 10 requests per 60 seconds, all of them usable in a burst."""
+        capacity, _, period = text.partition("/")
+        return cls(float(capacity), float(period or 1))
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+class RateLimiter:
+    """
+    Token buckets per (rule, client). Rules come from RATE_LIMITS: "METHOD /route/template" or
+    "*" (every other route) -> "requests/seconds". A bucket left idle until it is full again
+    expires, which is the same as keeping it.
+    """
+    def __init__(self):
+        self.buckets = BoundedTTLMap(max_entries=settings.RATE_LIMIT_MAX_CLIENTS)
+        self.limited = 0
+        self._source: Union[dict, None] = None
+        self._rules: dict[str, RateLimit] = {}
+
+    @property
+    def rules(self) -> dict[str, RateLimit]:
+        if settings.RATE_LIMITS is not self._source:
+            self._source = settings.RATE_LIMITS
+            self._rules = {name: RateLimit.parse(value) for name, value in settings.RATE_LIMITS.items()}
+        return self._rules
+
+    def rule_for(self, scope) -> Union[tuple[str, RateLimit], None]:
+        rules = self.rules
+        if not rules:
+            return None
+        # The router has not matched yet: find the route template the same way it will
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                name = f"{scope['method']} {route.path}"
+                if name in rules:
+                    return name, rules[name]
+                break
+        return ("*", rules["*"]) if "*" in rules else None
+
+    def take(self, rule: str, limit: RateLimit, client: str) -> float:
+        """Takes a token; returns 0 when allowed, else the seconds until one is available."""
+        now = time.time()
+        tokens, updated_at = self.buckets.get((rule, client)) or (limit.capacity, now)
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+        if tokens < 1:
+            self.limited += 1
+            self.buckets.set((rule, client), (tokens, now), expires_at=now + (limit.capacity - tokens) / limit.rate)
+            return (1 - tokens) / limit.rate
+        tokens -= 1
+        self.buckets.set((rule, client), (tokens, now), expires_at=now + (limit.capacity - tokens) / limit.rate)
+        return 0.0
+
+    def reset(self):
+        self.buckets.clear()
+        self.limited = 0
+
+
+def client_key(request: Request) -> str:
+    """The authenticated user when the request carries a valid token, else the client IP."""
+    token = request.cookies.get("access_token")
+    if token:
+        try:
+            return f"user:{decode_username(token)}"
+        except HTTPException:
+            pass
+    # nginx sets X-Real-IP; without the proxy the socket peer is the client
+    ip = request.headers.get("x-real-ip") or (request.client.host if request.client else "unknown")
+    return f"ip:{ip}"
+
+
+concurrency_limiter = ConcurrencyLimiter()
+rate_limiter = RateLimiter()
+
+
+def reset_admission():
+    concurrency_limiter.reset()
+    rate_limiter.reset()
+
+
+def _retry_after(seconds: float) -> str:
+    return str(max(1, int(seconds + 0.999)))
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware: rate limits first (cheap to reject), then the concurrency cap."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in settings.ADMISSION_EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        rule = rate_limiter.rule_for(scope)
+        if rule is not None:
+            wait = rate_limiter.take(*rule, client_key(Request(scope)))
+            if wait:
+                response = JSONResponse(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    content={"detail": "Too many requests, retry later"},
+                    headers={"Retry-After": _retry_after(wait)},
+                )
+                return await response(scope, receive, send)
+
+        if settings.ADMISSION_MAX_CONCURRENCY <= 0:
+            return await self.app(scope, receive, send)
+        if not await concurrency_limiter.acquire():
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": "Server overloaded, retry shortly"},
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_limiter.release()
@@ -0,0 +1,232 @@
+import codecs
+import csv
+import io
+import json
+from collections import deque
+from typing import AsyncIterator, Iterable, Literal, Union
+
+from fastapi import Request
+from pydantic import ValidationError
+from sqlalchemy import Engine, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config import settings
+from src.models.movie_model import MovieCreate
+from src.models.tables import Movie as MovieDB
+
+# Streaming import/export of the catalog. Import reads the request body chunk by chunk,
+# validates each record with MovieCreate and inserts them with one executemany per chunk;
+# export streams rows from a yield_per cursor. Memory stays bounded by the chunk size.
+
+BulkFormat = Literal["ndjson", "csv"]
+EXPORT_COLUMNS = ("id", "title", "overview", "year", "rating", "category")
+EXPORT_STATEMENT = select(*(getattr(MovieDB, name) for name in EXPORT_COLUMNS)).order_by(MovieDB.id)
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def resolve_format(format: Union[str, None], content_type: Union[str, None]) -> str:
+    if format:
+        return format
+    if content_type and content_type.split(";")[0].strip() in ("text/csv", "application/csv"):
+        return "csv"
+    return "ndjson"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Union[str, None]]:
+    """
+    Splits a byte stream into decoded lines without holding more than one line in memory.
+    A line longer than BULK_MAX_RECORD_SIZE is dropped as it streams in and yields None.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    limit = settings.BULK_MAX_RECORD_SIZE
+    pending, overflow = "", False
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if overflow or len(line) > limit:
+                overflow = False
+                yield None
+            else:
+                yield line.rstrip("\r")
+        if len(pending) > limit:
+            # The rest of this line is dropped up to its newline
+            pending, overflow = "", True
+    pending += decoder.decode(b"", final=True)
+    if overflow or len(pending) > limit:
+        yield None
+    elif pending:
+        yield pending.rstrip("\r")
+
+
+def _ends_quoted(line: str, quoted: bool) -> bool:
+    """
+    Whether a CSV line ends inside a quoted field, given whether it starts inside one. Same rules
+    as the csv module: a quote only opens a field at its start, "" inside one is a literal quote,
+    and anywhere else a quote is an ordinary character.
+    """
+    position, length = 0, len(line)
+    while position < length:
+        if quoted:
+            end = line.find('"', position)
+            if end < 0:
+                return True
+            if line.startswith('"', end + 1):
+                position = end + 2
+                continue
+            quoted = False
+            position = end + 1
+        elif line.startswith('"', position):
+            quoted = True
+            position += 1
+            continue
+        # Outside quotes: skip to the next field
+        position = line.find(",", position)
+        if position < 0:
+            return False
+        position += 1
+    return quoted
+
+
+async def iter_records(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[tuple[int, Union[dict, str]]]:
+    """
+    Yields (row_number, record) per input record; record is an error message when the
+    line itself cannot be parsed. Blank lines are skipped.
+    """
+    lines = iter_lines(chunks)
+    too_long = f"Record longer than {settings.BULK_MAX_RECORD_SIZE} characters"
+    if format == "ndjson":
+        number = 0
+        async for line in lines:
+            number += 1
+            if line is None:
+                yield number, too_long
+                continue
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield number, f"Invalid JSON: {exc}"
+                continue
+            yield number, record if isinstance(record, dict) else "Each line must be a JSON object"
+        return
+
+    # One reader for the whole body, fed one complete record at a time: a quoted field may
+    # span lines, so lines are collected until the record ends outside quotes
+    feed: deque[str] = deque()
+    reader = csv.reader(iter(feed.popleft, None))
+    header, number = None, 0
+    record: list[str] = []
+    size, quoted = 0, False
+    async for line in lines:
+        if line is None or size + len(line) > settings.BULK_MAX_RECORD_SIZE:
+            number += 1
+            yield number, too_long
+            record, size, quoted = [], 0, False  # the next line starts a new record
+            continue
+        record.append(line)
+        size += len(line) + 1
+        quoted = _ends_quoted(line, quoted)
+        if quoted:
+            continue
+        text = "\n".join(record)
+        record, size = [], 0
+        if not text.strip():
+            continue
+        feed.append(text)
+        values = next(reader)
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        number += 1
+        if len(values) != len(header):
+            yield number, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells fall back to the MovieCreate defaults
+        yield number, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield number + 1, "Unterminated quoted field"
+
+
+class BulkReport:
+    """Counts of an import plus the first BULK_MAX_REPORTED_ERRORS row errors."""
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+
+    def add_error(self, row: int, errors: list):
+        self.failed += 1
+        if len(self.errors) < settings.BULK_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "errors": errors})
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def iter_valid_chunks(request: Request, format: str, report: BulkReport) -> AsyncIterator[list[dict]]:
+    """Validated rows of the request body, in lists of BULK_CHUNK_SIZE; invalid rows go to the report."""
+    chunk: list[dict] = []
+    async for number, record in iter_records(request.stream(), format):
+        if isinstance(record, str):
+            report.add_error(number, [{"loc": [], "msg": record}])
+            continue
+        try:
+            movie = MovieCreate.model_validate(record)
+        except ValidationError as exc:
+            report.add_error(number, [{"loc": list(error["loc"]), "msg": error["msg"]} for error in exc.errors()])
+            continue
+        chunk.append(movie.model_dump())
+        if len(chunk) >= settings.BULK_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---- Export ----
+
+def export_header(format: str) -> bytes:
+    if format == "csv":
+        return encode_rows([EXPORT_COLUMNS], "csv")
+    return b""
+
+def encode_rows(rows: Iterable[tuple], format: str) -> bytes:
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+    ).encode("utf-8")
+
+def export_filename(format: str) -> str:
+    return f'attachment; filename="movies.{format}"'
+
+
+def iter_export(bind: Engine, format: str):
+    """
+    Streams the whole table with a server-side cursor, BULK_CHUNK_SIZE rows per chunk.
+    Opens its own session: the request's one is closed before the body is streamed.
+    """
+    yield export_header(format)
+    with Session(bind) as session:
+        result = session.execute(EXPORT_STATEMENT.execution_options(yield_per=settings.BULK_CHUNK_SIZE))
+        for rows in result.partitions():
+            yield encode_rows(rows, format)
+
+async def aiter_export(bind: AsyncEngine, format: str):
+    """Async twin of iter_export for DB_MODE="async"."""
+    yield export_header(format)
+    async with AsyncSession(bind) as session:
+        result = await session.stream(EXPORT_STATEMENT.execution_options(yield_per=settings.BULK_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield encode_rows(rows, format)
@@ -0,0 +1,319 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Union
+from urllib.parse import urlencode
+
+from fastapi.requests import Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+from src.config import settings
+from src.search import search_terms
+from src.versioning import is_fresh
+
+# Tags name what a cached response depends on, so a write drops only the entries it can change:
+#   movie:<id>            a response that contains that movie
+#   movies:list           a page of GET /movies/ (offsets shift on every insert/delete)
+#   sort:<field>          a page of GET /movies/ ordered by that field
+#   filter:<field>        a page of GET /movies/ filtered on that field
+#   search                a page of GET /movies/search
+#   category-query:<q>    a GET /movies/by_category result for the normalised query q
+LIST_TAG = "movies:list"
+SEARCH_TAG = "search"
+BATCH_TAG = "movies:batch:missing"
+CATEGORY_QUERY_PREFIX = "category-query:"
+SORT_FIELDS = ("title", "year", "rating")
+TEXT_FIELDS = ("title", "overview", "category")
+# query parameter of GET /movies/ -> movie field it filters on
+FILTER_PARAMS = {"year_from": "year", "year_to": "year", "min_rating": "rating", "category": "category"}
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    headers: list
+    media_type: Union[str, None]
+    tags: frozenset
+    expires_at: float
+    size: int
+
+    @property
+    def etag(self) -> Union[str, None]:
+        return next((value.decode("latin-1") for name, value in self.headers if name == b"etag"), None)
+
+
+@dataclass
+class CachePolicy:
+    ttl: Union[float, None]
+    tags: Callable[[Request, object], Iterable[str]]
+
+
+class ResponseCache:
+    """
+    Bounded LRU + TTL cache of serialized responses, limited both in entries and in bytes.
+    Entries carry tags; writes invalidate by tag instead of flushing everything.
+    """
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        # Bumped on every invalidation: a response computed across one is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Union[CacheEntry, None]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, entry: CacheEntry, generation: int):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += entry.size
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tags(self, tags: Iterable[str]):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def tags_with_prefix(self, prefix: str) -> list[str]:
+        with self._lock:
+            return [tag for tag in self._tags if tag.startswith(prefix)]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class BoundedTTLMap:
+    """
+    Thread-safe LRU map whose entries expire at their own deadline (a time.time() timestamp).
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[object, tuple[object, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+)
+
+
+def cache_key(request: Request) -> str:
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+
+def cache_response(tags: Callable[[Request, object], Iterable[str]], ttl: Union[float, None] = None):
+    """
+    Opts an endpoint into the response cache (the router must use CachedRoute).
+    `tags(request, payload)` gets the decoded JSON body and returns the tags of the entry.
+    """
+    def decorator(endpoint):
+        endpoint.__response_cache__ = CachePolicy(ttl=ttl, tags=tags)
+        return endpoint
+    return decorator
+
+
+class CachedRoute(APIRoute):
+    """
+    APIRoute that serves endpoints marked with @cache_response from response_cache.
+    Only 200 responses are stored; a hit skips dependencies, the handler and serialization.
+    """
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        policy: Union[CachePolicy, None] = getattr(self.endpoint, "__response_cache__", None)
+        if policy is None or not settings.RESPONSE_CACHE_ENABLED:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            key = cache_key(request)
+            entry = response_cache.get(key)
+            if entry is not None:
+                etag = entry.etag
+                if etag is not None and is_fresh(request, etag):
+                    response = Response(status_code=304)
+                    response.raw_headers = [(name, value) for name, value in entry.headers if name not in (b"content-length", b"content-type")]
+                    response.headers["X-Cache"] = "HIT"
+                    return response
+                response = Response(content=entry.body, media_type=entry.media_type)
+                response.raw_headers = list(entry.headers)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            generation = response_cache.generation
+            response = await handler(request)
+            if response.status_code == 200 and hasattr(response, "body"):
+                tags = frozenset(policy.tags(request, json.loads(response.body)))
+                headers = [(name, value) for name, value in response.raw_headers if name != b"set-cookie"]
+                ttl = policy.ttl if policy.ttl is not None else response_cache.ttl
+                entry = CacheEntry(
+                    body=response.body,
+                    headers=headers,
+                    media_type=response.media_type,
+                    tags=tags,
+                    expires_at=time.monotonic() + ttl,
+                    size=len(response.body) + len(key),
+                )
+                response_cache.set(key, entry, generation)
+                response.headers["X-Cache"] = "MISS"
+            return response
+
+        return cached_handler
+
+
+# ---- Tags of the movie read endpoints ----
+
+def movie_tags(request: Request, payload) -> list[str]:
+    return [f"movie:{request.path_params['id']}"]
+
+def movie_batch_tags(request: Request, payload) -> list[str]:
+    # Missing ids too: creating one of them must drop the cached "missing" (a bulk import
+    # creates ids nobody names in advance, so it drops every batch with a missing id)
+    tags = [f"movie:{movie['id']}" for movie in payload["movies"]] + [f"movie:{id}" for id in payload["missing"]]
+    return tags + [BATCH_TAG] if payload["missing"] else tags
+
+def movie_list_tags(request: Request, payload) -> list[str]:
+    sort = request.query_params.get("sort", "id")
+    # A filtered page can gain a movie whose filtered field changed, not only lose one it lists
+    filters = {field for param, field in FILTER_PARAMS.items() if param in request.query_params}
+    return [LIST_TAG, f"sort:{sort}"] + [f"filter:{field}" for field in sorted(filters)] + [f"movie:{movie['id']}" for movie in payload]
+
+def movie_search_tags(request: Request, payload) -> list[str]:
+    return [SEARCH_TAG] + [f"movie:{movie['id']}" for movie in payload]
+
+def movie_category_tags(request: Request, payload) -> list[str]:
+    query = " ".join(search_terms(request.query_params.get("category", "")))
+    return [CATEGORY_QUERY_PREFIX + query] + [f"movie:{movie['id']}" for movie in payload]
+
+
+def _category_matches(query: str, category: str) -> bool:
+    """Same rule as the FTS prefix match of /by_category: every query word prefixes a category word."""
+    words = search_terms(category)
+    return all(any(word.startswith(term) for word in words) for term in query.split())
+
+
+def invalidate_movie_write(before: Union[dict, None], after: Union[dict, None]):
+    """
+    Drops the cached responses a movie write can change. `before`/`after` are the row
+    before and after the write (None for a create/delete respectively).
+    """
+    movie = after or before
+    tags = {f"movie:{movie['id']}"}
+    if before is None or after is None:
+        # Inserts and deletes shift every page and may enter any search result
+        tags |= {LIST_TAG, SEARCH_TAG}
+    else:
+        changed = {field for field in after if after[field] != before.get(field)}
+        tags |= {f"sort:{field}" for field in SORT_FIELDS if field in changed}
+        tags |= {f"filter:{field}" for field in FILTER_PARAMS.values() if field in changed}
+        if changed & set(TEXT_FIELDS):
+            tags.add(SEARCH_TAG)
+
+    categories = {row["category"] for row in (before, after) if row is not None}
+    if before is not None and after is not None and before["category"] == after["category"]:
+        categories = set()
+    for tag in response_cache.tags_with_prefix(CATEGORY_QUERY_PREFIX):
+        query = tag[len(CATEGORY_QUERY_PREFIX):]
+        if any(_category_matches(query, category) for category in categories):
+            tags.add(tag)
+    response_cache.invalidate_tags(tags)
+
+
+def invalidate_movie_bulk_insert():
+    """New rows can enter any list, search page, category result or batch that missed them, but no cached single movie."""
+    response_cache.invalidate_tags([LIST_TAG, SEARCH_TAG, BATCH_TAG] + response_cache.tags_with_prefix(CATEGORY_QUERY_PREFIX))
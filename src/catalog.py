@@ -0,0 +1,179 @@
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Union
+
+import anyio.to_thread
+from fastapi import HTTPException, status
+from sqlalchemy import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.changes import CHANGES_TABLE, CursorTooOld, arun_with_connection, check_cursor, latest_seq, run_with_connection
+from src.config import settings
+from src.serialization import MOVIE_FIELDS
+
+if TYPE_CHECKING:
+    from src.columnar import ColumnarCatalog, MovieRow
+
+# In-memory snapshot of the catalog for GET /movies/ and GET /movies/by_category
+# (CATALOG_SNAPSHOT=true): the filters, sorts and pages run on NumPy columns (src/columnar.py)
+# instead of SQLite. It is loaded at startup and follows the change log (src/changes.py): the
+# write handlers apply their own change right away, and reads pick up what other workers, bulk
+# imports or raw SQL wrote once the snapshot is CATALOG_SNAPSHOT_MAX_LAG_SECONDS old. On an
+# AsyncEngine only the reads run on the event loop; building and updating the columns run in a
+# worker thread.
+
+_COLUMNS = ", ".join((*MOVIE_FIELDS, "version"))
+
+
+def read_catalog(conn: Connection) -> tuple[int, list[tuple]]:
+    # seq first: a write between the two reads is applied again later, which is harmless
+    seq = latest_seq(conn)
+    return seq, conn.exec_driver_sql(f"SELECT {_COLUMNS} FROM movie ORDER BY id").all()
+
+
+def read_catalog_changes(conn: Connection, since: int) -> tuple[int, list[tuple]]:
+    """(latest seq, [(movie id, current row or None)]) for the movies changed after `since`, once each."""
+    check_cursor(conn, since)
+    seq = latest_seq(conn)
+    rows = conn.exec_driver_sql(
+        f"SELECT c.movie_id, {', '.join(f'm.{name}' for name in (*MOVIE_FIELDS, 'version'))} "
+        f"FROM (SELECT DISTINCT movie_id FROM {CHANGES_TABLE} WHERE seq > ? AND seq <= ?) c "
+        f"LEFT JOIN movie m ON m.id = c.movie_id",
+        (since, seq),
+    ).all()
+    return seq, [(movie_id, None if row[0] is None else tuple(row)) for movie_id, *row in rows]
+
+
+class CatalogStore:
+    """The snapshot of one engine in this process."""
+    def __init__(self):
+        self.snapshot: Union["ColumnarCatalog", None] = None
+        self.lock = threading.Lock()
+        self.synced_at = 0.0
+        self.loads = 0
+
+    def due(self) -> bool:
+        return self.snapshot is None or time.monotonic() - self.synced_at >= settings.CATALOG_SNAPSHOT_MAX_LAG_SECONDS
+
+    def refresh(self, conn: Connection, force: bool = False):
+        """Loads the snapshot, or applies the change log since it was last synced when due (or forced)."""
+        if self.snapshot is None:
+            return self.load(conn)
+        if not (force or self.due()):
+            return
+        while True:
+            since = self.snapshot.seq
+            try:
+                seq, changes = read_catalog_changes(conn, since)
+            except CursorTooOld:
+                return self.load(conn)  # compaction outran the snapshot
+            if self.apply(since, seq, changes):
+                return
+
+    async def arefresh(self, bind: AsyncEngine, force: bool = False):
+        """refresh for AsyncEngine binds."""
+        if self.snapshot is None:
+            return await self.aload(bind)
+        if not (force or self.due()):
+            return
+        while True:
+            since = self.snapshot.seq
+            try:
+                seq, changes = await arun_with_connection(bind, read_catalog_changes, since)
+            except CursorTooOld:
+                return await self.aload(bind)
+            if await anyio.to_thread.run_sync(self.apply, since, seq, changes):
+                return
+
+    def apply(self, since: int, seq: int, changes: list[tuple]) -> bool:
+        """False when another request applied a part of the log meanwhile: read on from where it got."""
+        with self.lock:
+            if self.snapshot.seq != since:
+                return False
+            self.snapshot.apply(seq, changes)
+            self.synced_at = time.monotonic()
+            return True
+
+    def load(self, conn: Connection):
+        self.install(*read_catalog(conn))
+
+    async def aload(self, bind: AsyncEngine):
+        await anyio.to_thread.run_sync(self.install, *await arun_with_connection(bind, read_catalog))
+
+    def install(self, seq: int, rows: list[tuple]):
+        from src.columnar import ColumnarCatalog  # numpy: only with CATALOG_SNAPSHOT
+        snapshot = ColumnarCatalog(seq, rows)
+        with self.lock:
+            if self.snapshot is None or self.snapshot.seq <= snapshot.seq:
+                self.snapshot = snapshot
+                self.synced_at = time.monotonic()
+                self.loads += 1
+
+    def follow(self, session: Session):
+        if self.due():
+            self.refresh(session.connection())
+
+    async def afollow(self, session: AsyncSession):
+        if self.due():
+            await self.arefresh(session.bind)
+
+    def page(self, pagination, filters) -> list["MovieRow"]:
+        with self.lock:
+            try:
+                return self.snapshot.page(filters.params(), pagination.sort, pagination.order, pagination.after, pagination.offset, pagination.size)
+            except TypeError:  # a cursor key of another type than the sort column
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    def matching_category(self, text: str) -> list["MovieRow"]:
+        with self.lock:
+            return self.snapshot.matching_category(text)
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"movies": 0, "bytes": 0, "loads": self.loads}
+        return {"movies": len(snapshot), "bytes": snapshot.nbytes, "loads": self.loads}
+
+
+_stores_lock = threading.Lock()
+_stores: "weakref.WeakKeyDictionary[Union[Engine, AsyncEngine], CatalogStore]" = weakref.WeakKeyDictionary()
+
+
+def catalog_store(bind: Union[Engine, AsyncEngine]) -> CatalogStore:
+    with _stores_lock:
+        if bind not in _stores:
+            _stores[bind] = CatalogStore()
+        return _stores[bind]
+
+
+async def preload_catalog(bind: Union[Engine, AsyncEngine]):
+    """Loads the snapshot of `bind` at startup, so no request waits for it."""
+    store = catalog_store(bind)
+    if isinstance(bind, AsyncEngine):
+        await store.aload(bind)
+    else:
+        run_with_connection(bind, store.load)
+
+
+def update_catalog(bind: Engine, conn: Connection):
+    """After a write: applies it to the snapshot of this process, if there is one."""
+    store = _stores.get(bind)
+    if store is not None and store.snapshot is not None:
+        store.refresh(conn, force=True)
+
+
+async def aupdate_catalog(session: AsyncSession):
+    store = _stores.get(session.bind)
+    if store is not None and store.snapshot is not None:
+        await store.arefresh(session.bind, force=True)
+
+
+def catalog_stats() -> dict:
+    totals = {"movies": 0, "bytes": 0, "loads": 0}
+    for store in list(_stores.values()):
+        for name, value in store.stats().items():
+            totals[name] += value
+    return totals
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Union
+from fastapi import HTTPException, status
+from sqlalchemy import DDL, Connection, Engine, event, inspect
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.config import settings
+from src.models.tables import Movie
+from src.serialization import MOVIE_FIELDS
+
+# Change feed behind GET /movies/changes: an append-only log with one entry per insert, update
+# and delete of a movie (a tombstone), written by triggers so every write path records itself
+# (the group-commit handlers, bulk import, raw SQL). A mirror keeps the `seq` of the last entry
+# it applied and asks for what came after, so a sync costs O(changes), not O(catalog).
+#
+# Compaction drops entries superseded by a newer one for the same movie (always safe: the newer
+# one is further along every cursor) and tombstones past their retention. Dropping tombstones
+# moves the snapshot boundary: a cursor below it may have missed a delete and must resync from
+# since=0, which lists every live movie because each one keeps its latest entry.
+CHANGES_TABLE = "movie_change"
+BOUNDARY_TABLE = "movie_change_boundary"
+
+CHANGES_DDL = [
+    # AUTOINCREMENT: a seq is never handed out twice, even after the newest entries are compacted
+    f"""CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        movie_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        deleted BOOLEAN NOT NULL DEFAULT 0,
+        changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_movie_change_movie_id_seq ON {CHANGES_TABLE} (movie_id, seq)",
+    f"""CREATE TABLE IF NOT EXISTS {BOUNDARY_TABLE} (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS movie_change_ai AFTER INSERT ON movie BEGIN
+        INSERT INTO {CHANGES_TABLE}(movie_id, version) VALUES (new.id, new.version);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS movie_change_au AFTER UPDATE OF title, overview, year, rating, category ON movie BEGIN
+        INSERT INTO {CHANGES_TABLE}(movie_id, version) VALUES (new.id, new.version);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS movie_change_ad AFTER DELETE ON movie BEGIN
+        INSERT INTO {CHANGES_TABLE}(movie_id, version, deleted) VALUES (old.id, old.version, 1);
+    END""",
+]
+
+for statement in CHANGES_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement))
+
+_MOVIE_COLUMNS = ", ".join(f"m.{name}" for name in MOVIE_FIELDS)
+
+
+class CursorTooOld(Exception):
+    """The cursor is below the snapshot boundary: deletes it should see were compacted away."""
+    def __init__(self, boundary: int):
+        super().__init__(f"cursor is older than the snapshot boundary {boundary}")
+        self.boundary = boundary
+
+
+def ensure_change_log(conn: Connection):
+    """Creates the log on a database that predates it, with one entry per existing movie."""
+    is_new = not inspect(conn).has_table(CHANGES_TABLE)
+    for statement in CHANGES_DDL:
+        conn.exec_driver_sql(statement)
+    if is_new:
+        conn.exec_driver_sql(f"INSERT INTO {CHANGES_TABLE}(movie_id, version) SELECT id, version FROM movie ORDER BY id")
+
+
+def snapshot_boundary(conn: Connection) -> int:
+    return conn.exec_driver_sql(f"SELECT seq FROM {BOUNDARY_TABLE} WHERE id = 1").scalar() or 0
+
+
+def latest_seq(conn: Connection) -> int:
+    return conn.exec_driver_sql(f"SELECT max(seq) FROM {CHANGES_TABLE}").scalar() or 0
+
+
+def check_cursor(conn: Connection, since: int) -> int:
+    """`since` when the log can still be followed from it (0 is always a full snapshot)."""
+    if since > 0:
+        boundary = snapshot_boundary(conn)
+        if since < boundary:
+            raise CursorTooOld(boundary)
+    return since
+
+
+def stream_cursor(conn: Connection, since: Union[int, None]) -> int:
+    """Where a stream starts: at `since`, or at the end of the log for live changes only."""
+    return latest_seq(conn) if since is None else check_cursor(conn, since)
+
+
+def read_changes(conn: Connection, since: int, limit: int) -> dict:
+    """
+    The entries after `since`, oldest first, with the movie as it is now (null once deleted).
+    A movie changed several times since the cursor can appear more than once until compaction.
+    """
+    check_cursor(conn, since)
+    rows = conn.exec_driver_sql(
+        f"SELECT c.seq, c.movie_id, m.id IS NULL, {_MOVIE_COLUMNS} FROM {CHANGES_TABLE} c "
+        f"LEFT JOIN movie m ON m.id = c.movie_id WHERE c.seq > ? ORDER BY c.seq LIMIT ?",
+        (since, limit + 1),
+    ).all()
+    has_more = len(rows) > limit
+    changes = [
+        {"seq": seq, "id": movie_id, "deleted": bool(deleted), "movie": None if deleted else dict(zip(MOVIE_FIELDS, movie))}
+        for seq, movie_id, deleted, *movie in rows[:limit]
+    ]
+    return {"changes": changes, "next_cursor": changes[-1]["seq"] if changes else since, "has_more": has_more}
+
+
+def cursor_gone(exc: CursorTooOld) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_410_GONE,
+        detail=f"The change log was compacted past this cursor (boundary {exc.boundary}): resync from since=0",
+    )
+
+
+def run_with_connection(bind: Engine, fn: Callable[..., Any], *args) -> Any:
+    """fn(conn, *args) on a connection of its own, for streams that outlive the request's session."""
+    with bind.connect() as conn:
+        return fn(conn, *args)
+
+
+async def arun_with_connection(bind: AsyncEngine, fn: Callable[..., Any], *args) -> Any:
+    """Async twin of run_with_connection for DB_MODE="async"."""
+    async with bind.connect() as conn:
+        return await conn.run_sync(fn, *args)
+
+
+def compact_changes(conn: Connection, tombstone_retention_seconds: float) -> dict:
+    """Drops superseded entries and expired tombstones; returns the counts and the new boundary."""
+    superseded = conn.exec_driver_sql(
+        f"DELETE FROM {CHANGES_TABLE} WHERE seq < "
+        f"(SELECT max(newer.seq) FROM {CHANGES_TABLE} newer WHERE newer.movie_id = {CHANGES_TABLE}.movie_id)"
+    ).rowcount
+    boundary = snapshot_boundary(conn)
+    expired = conn.exec_driver_sql(
+        f"SELECT max(seq) FROM {CHANGES_TABLE} WHERE deleted AND changed_at <= datetime('now', ?)",
+        (f"-{tombstone_retention_seconds} seconds",),
+    ).scalar()
+    tombstones = 0
+    if expired is not None and expired > boundary:
+        tombstones = conn.exec_driver_sql(f"DELETE FROM {CHANGES_TABLE} WHERE deleted AND seq <= ?", (expired,)).rowcount
+        boundary = expired
+        conn.exec_driver_sql(
+            f"INSERT INTO {BOUNDARY_TABLE}(id, seq) VALUES (1, ?) ON CONFLICT(id) DO UPDATE SET seq = excluded.seq", (boundary,)
+        )
+    return {"superseded": superseded, "tombstones": tombstones, "boundary": boundary}
+
+
+def sse_event(change: dict) -> str:
+    # `id` lets EventSource resume with Last-Event-ID after a reconnect
+    return f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change, separators=(',', ':'))}\n\n"
+
+
+async def stream_changes(
+    read_page: Callable[[int, int], Awaitable[dict]],
+    since: int,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    max_seconds: float,
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of the log after `since`: the backlog first, then new entries as they
+    appear, for `max_seconds`. `read_page(since, limit)` is read_changes on a connection of its
+    own; the log is polled (one indexed range query per poll), so every worker's writes show up.
+    """
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline and not await is_disconnected():
+        page = await read_page(since, settings.CHANGES_STREAM_PAGE_SIZE)
+        for change in page["changes"]:
+            yield sse_event(change)
+        since = page["next_cursor"]
+        if page["changes"]:
+            last_sent = time.monotonic()
+        if page["has_more"]:
+            continue
+        if time.monotonic() - last_sent >= settings.CHANGES_STREAM_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"  # a comment line: keeps proxies from closing an idle stream
+            last_sent = time.monotonic()
+        await asyncio.sleep(max(0.0, min(settings.CHANGES_STREAM_POLL_SECONDS, deadline - time.monotonic())))
+
+
+def resume_cursor(last_event_id: Union[str, None], since: Union[int, None]) -> Union[int, None]:
+    """An EventSource reconnecting sends the id of the last event it got: resume after it."""
+    return int(last_event_id) if last_event_id is not None and last_event_id.isdigit() else since
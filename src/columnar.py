@@ -0,0 +1,178 @@
+from collections import namedtuple
+from typing import Iterable, Sequence, Union
+
+import numpy as np
+
+from src.search import search_terms
+from src.serialization import MOVIE_FIELDS
+
+# The column store behind CATALOG_SNAPSHOT (the lifecycle is in src/catalog.py): one array per
+# column, indexed by movie id, so a lookup is an index, sort=id is the array order and a delete
+# clears one `live` flag. year, rating and version are NumPy arrays, category is dictionary-encoded
+# (int codes into `categories`), title and overview are object arrays. Filters are boolean masks
+# over the whole catalog; a top-N sort partitions on the sort key before sorting the candidates.
+
+MovieRow = namedtuple("MovieRow", (*MOVIE_FIELDS, "version"))
+
+SORT_KEYS = ("id", "title", "year", "rating")
+_INITIAL_CAPACITY = 1024
+
+
+class ColumnarCatalog:
+    """
+    Every movie as of change-log `seq`. `rows` are (id, title, overview, year, rating, category,
+    version) tuples. Not thread-safe: src/catalog.py serializes queries and updates.
+    """
+    def __init__(self, seq: int, rows: Sequence[tuple]):
+        self.seq = seq
+        self.categories: list[str] = []
+        self._codes: dict[str, int] = {}
+        self._title_order: Union[tuple, None] = None  # (rank per id, sorted distinct titles)
+        capacity = max(_INITIAL_CAPACITY, (max((row[0] for row in rows), default=0) + 1))
+        self._allocate(capacity)
+        for row in rows:
+            self._set(row)
+
+    def _allocate(self, capacity: int):
+        self.live = np.zeros(capacity, dtype=bool)
+        self.year = np.zeros(capacity, dtype=np.int64)
+        self.rating = np.zeros(capacity, dtype=np.float64)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        self.version = np.zeros(capacity, dtype=np.int64)
+        self.title = np.empty(capacity, dtype=object)
+        self.overview = np.empty(capacity, dtype=object)
+        self.ids = np.arange(capacity)
+
+    def _grow(self, id: int):
+        old = (self.live, self.year, self.rating, self.category, self.version, self.title, self.overview)
+        capacity = len(self.live)
+        while capacity <= id:
+            capacity *= 2
+        self._allocate(capacity)
+        for new, column in zip((self.live, self.year, self.rating, self.category, self.version, self.title, self.overview), old):
+            new[:len(column)] = column
+
+    def _code(self, category: str) -> int:
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def _set(self, row: tuple):
+        id, title, overview, year, rating, category, version = row
+        if id >= len(self.live):
+            self._grow(id)
+        if self.title[id] != title or not self.live[id]:
+            self._title_order = None
+        self.live[id] = True
+        self.title[id] = title
+        self.overview[id] = overview
+        self.year[id] = year
+        self.rating[id] = rating
+        self.category[id] = self._code(category)
+        self.version[id] = version
+
+    def apply(self, seq: int, changes: Iterable[tuple[int, Union[tuple, None]]]):
+        """(movie id, row or None once deleted) for every movie changed up to `seq`."""
+        for id, row in changes:
+            if row is not None:
+                self._set(row)
+            elif id < len(self.live) and self.live[id]:
+                self.live[id] = False
+                self.title[id] = self.overview[id] = None
+                self._title_order = None
+        self.seq = seq
+
+    def __len__(self) -> int:
+        return int(self.live.sum())
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.live, self.year, self.rating, self.category, self.version, self.title, self.overview)
+        return sum(array.nbytes for array in arrays)
+
+    def _title_ranks(self) -> tuple:
+        """Rank of each title among the distinct titles (equal titles share one), rebuilt after title changes."""
+        if self._title_order is None:
+            ids = np.flatnonzero(self.live)
+            distinct, inverse = np.unique(self.title[ids], return_inverse=True)
+            ranks = np.zeros(len(self.live), dtype=np.int64)
+            ranks[ids] = inverse
+            self._title_order = (ranks, distinct)
+        return self._title_order
+
+    def _sort_key(self, sort: str, after_key) -> tuple:
+        """(numeric key per id, the cursor key on the same scale)."""
+        if sort == "title":
+            ranks, distinct = self._title_ranks()
+            if after_key is None:
+                return ranks, None
+            position = int(np.searchsorted(distinct, after_key))
+            exact = position < len(distinct) and distinct[position] == after_key
+            # A title that is gone sorts between the ranks around it
+            return ranks, position if exact else position - 0.5
+        return getattr(self, sort), after_key
+
+    def page(self, filters: dict, sort: str, order: str, after: Union[tuple, None], offset: int, limit: int) -> list[MovieRow]:
+        """GET /movies/: `filters` and the pagination as in src/dependencies.py, same rows in the same order."""
+        mask = self.live.copy()
+        if "category" in filters:
+            code = self._codes.get(filters["category"])
+            if code is None:
+                return []
+            mask &= self.category == code
+        if "year_from" in filters:
+            mask &= self.year >= filters["year_from"]
+        if "year_to" in filters:
+            mask &= self.year <= filters["year_to"]
+        if "min_rating" in filters:
+            mask &= self.rating >= filters["min_rating"]
+
+        ids = self.ids
+        keys, after_key = (ids, None) if sort == "id" else self._sort_key(sort, None if after is None else after[0])
+        if after is not None:
+            after_id = after[1]
+            if sort == "id":
+                mask &= ids > after_id if order == "asc" else ids < after_id
+            elif order == "asc":
+                mask &= (keys > after_key) | ((keys == after_key) & (ids > after_id))
+            else:
+                mask &= (keys < after_key) | ((keys == after_key) & (ids < after_id))
+
+        selected = np.flatnonzero(mask)
+        end = offset + limit
+        if sort == "id":
+            # The arrays are in id order already
+            return self.rows((selected if order == "asc" else selected[::-1])[offset:end])
+        selected_keys = keys[selected]
+        if order == "desc":
+            selected_keys = -selected_keys
+        if end < len(selected):
+            # Top-N: only the rows up to the N-th key (and its ties) need sorting
+            nth = np.partition(selected_keys, end - 1)[end - 1]
+            candidates = selected_keys <= nth
+            selected, selected_keys = selected[candidates], selected_keys[candidates]
+        ordering = np.lexsort((selected if order == "asc" else -selected, selected_keys))
+        return self.rows(selected[ordering][offset:end])
+
+    def matching_category(self, text: str) -> list[MovieRow]:
+        """GET /movies/by_category: every term of `text` is a prefix of a word of the category, by id."""
+        terms = search_terms(text)
+        if not terms:
+            return []
+        codes = [
+            code for category, code in self._codes.items()
+            if all(any(word.startswith(term) for word in search_terms(category)) for term in terms)
+        ]
+        return self.rows(np.flatnonzero(self.live & np.isin(self.category, codes)))
+
+    def rows(self, ids: np.ndarray) -> list[MovieRow]:
+        categories = self.categories
+        return [
+            MovieRow(id, title, overview, year, rating, categories[code], version)
+            for id, title, overview, year, rating, code, version in zip(
+                ids.tolist(), self.title[ids].tolist(), self.overview[ids].tolist(), self.year[ids].tolist(),
+                self.rating[ids].tolist(), self.category[ids].tolist(), self.version[ids].tolist(),
+            )
+        ]
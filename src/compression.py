@@ -0,0 +1,170 @@
+import zlib
+from collections import defaultdict
+from typing import Union
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from src.config import settings
+from src.files import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # optional: the coding is simply not offered
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Response compression for JSON lists, exports and other text bodies. Negotiates br, zstd or
+# gzip from Accept-Encoding, leaves alone small bodies, other content types, ranges and bodies
+# that already carry a Content-Encoding (precompressed static files, PDFs), and compresses
+# streamed responses chunk by chunk, flushing each one so the client sees rows as they come.
+# A strong ETag names the identity bytes, so it is made weak on the bodies compressed here:
+# If-None-Match still matches it, If-Range (strong comparison) no longer splices identity
+# ranges into compressed ones.
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+# Content-Encoding -> (stream class, its level setting); only codings whose module is installed
+CODINGS = {"gzip": (GzipStream, "COMPRESSION_GZIP_LEVEL")}
+if brotli is not None:
+    CODINGS["br"] = (BrotliStream, "COMPRESSION_BROTLI_QUALITY")
+if zstandard is not None:
+    CODINGS["zstd"] = (ZstdStream, "COMPRESSION_ZSTD_LEVEL")
+
+
+def compressor(coding: str, level: Union[int, None] = None):
+    stream_class, setting = CODINGS[coding]
+    return stream_class(getattr(settings, setting) if level is None else level)
+
+
+def choose_coding(accept_encoding: Union[str, None]) -> Union[str, None]:
+    """First coding of COMPRESSION_ENCODINGS (server preference) that the client accepts."""
+    accepted = accepted_encodings(accept_encoding)
+    return next((coding for coding in settings.COMPRESSION_ENCODINGS if coding in accepted and coding in CODINGS), None)
+
+
+def is_compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in settings.COMPRESSION_CONTENT_TYPES:
+        return False
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    return "no-transform" not in headers.get("cache-control", "")
+
+
+def weaken_etag(headers: MutableHeaders):
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+# Bytes before and after compression, per coding, for /metrics
+compression_stats: dict = defaultdict(lambda: {"in": 0, "out": 0})
+
+
+# A body of known length up to this size is compressed in one piece even when it arrives in
+# chunks (http_error_handler re-chunks every response): better ratio and a Content-Length
+BUFFER_MAX_SIZE = 1024 * 1024
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware; the body is compressed on the way out, after the response cache."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+        coding = choose_coding(Headers(scope=scope).get("accept-encoding"))
+        start_message = None
+        stream = None
+        buffer: Union[list, None] = None
+
+        async def send_compressed(message):
+            nonlocal start_message, stream, buffer
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if message["status"] in (204, 206, 304) or not is_compressible(headers):
+                    if message["status"] == 304 and coding is not None and "content-encoding" not in headers:
+                        weaken_etag(MutableHeaders(raw=message["headers"]))  # as on the 200 it revalidates
+                    start_message = False  # pass through
+                    return await send(message)
+                start_message = message  # held until the first body chunk says how big it is
+                return
+
+            if message["type"] != "http.response.body" or start_message is False:
+                return await send(message)
+
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if stream is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                # Also on identity responses, so a shared cache never hands them to every client
+                headers.add_vary_header("Accept-Encoding")
+                length = headers.get("content-length")
+                size = int(length) if length is not None else (None if more_body else len(body))
+                if coding is None or (size is not None and size < settings.COMPRESSION_MIN_SIZE):
+                    await send(start_message)
+                    start_message = False
+                    return await send(message)
+                headers["Content-Encoding"] = coding
+                weaken_etag(headers)
+                stream = compressor(coding)
+                if more_body and size is not None and size <= BUFFER_MAX_SIZE:
+                    buffer = []
+
+            if buffer is not None:
+                buffer.append(body)
+                if more_body:
+                    return
+                body, buffer = b"".join(buffer), None
+
+            compressed = stream.compress(body) if more_body else stream.finish(body)
+            stats = compression_stats[coding]
+            stats["in"] += len(body)
+            stats["out"] += len(compressed)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                start_message = None
+            if compressed or not more_body:
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
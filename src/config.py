@@ -1,3 +1,4 @@
+from typing import Literal, Union
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -8,6 +9,124 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Database engine: "sync" serves every request from the threadpool with a blocking Session,
+    # "async" uses an aiosqlite AsyncSession and async handlers on the event loop.
+    DB_MODE: Literal["sync", "async"] = "sync"
+    # Logs every SQL statement to stdout: debugging only, far too slow for production
+    SQL_ECHO: bool = False
+    # Statement profiler (GET /auth/dashboard/queries): fraction of statements timed (0 = off),
+    # the slow threshold that logs a query and captures its EXPLAIN QUERY PLAN, and how many
+    # normalised statements and recent slow queries are kept
+    QUERY_PROFILER_SAMPLE_RATE: float = 0.1
+    QUERY_PROFILER_SLOW_MS: float = 100
+    QUERY_PROFILER_MAX_STATEMENTS: int = 200
+    QUERY_PROFILER_SLOW_LOG_SIZE: int = 100
+    # orjson responses, and read endpoints that dump column rows straight to bytes
+    FAST_JSON: bool = False
+
+    # In-process cache of serialized responses for the movie read endpoints (per worker)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: float = 60
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10_000
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # Authenticated hot path: verified JWTs (kept until their own `exp`) and user records
+    TOKEN_CACHE_MAX_ENTRIES: int = 10_000
+    USER_CACHE_MAX_ENTRIES: int = 10_000
+    USER_CACHE_TTL_SECONDS: float = 60
+
+    # argon2 cost; hashes made with other values are upgraded on the next successful login
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    # Process pool for hashing: None = one worker per core, 0 = hash inline in the request thread.
+    # At most workers + queue size operations are admitted, the rest get 503 + Retry-After.
+    PASSWORD_HASH_WORKERS: Union[int, None] = None
+    PASSWORD_HASH_QUEUE_SIZE: int = 8
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 1
+
+    # POST /movies/bulk and GET /movies/export: rows per transaction / per streamed chunk
+    BULK_CHUNK_SIZE: int = 1000
+    BULK_MAX_REPORTED_ERRORS: int = 1000
+    # Longest import record (characters): a longer one is reported as a failed row, not buffered
+    BULK_MAX_RECORD_SIZE: int = 1_048_576
+
+    # GET/POST /movies/batch: most ids one request may ask for
+    BATCH_MAX_IDS: int = 1000
+
+    # Response compression: codings in order of preference (only those installed are offered),
+    # bodies below the size threshold and other content types are sent as they are
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: list[str] = ["zstd", "br", "gzip"]
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_CONTENT_TYPES: list[str] = [
+        "application/json", "application/x-ndjson", "text/csv", "text/html", "text/plain",
+        "text/css", "text/javascript", "application/javascript", "image/svg+xml", "application/xml",
+    ]
+    COMPRESSION_GZIP_LEVEL: int = 4
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    # Change feed: how often an SSE stream polls the log, the comment it sends when idle, entries
+    # per poll, and how long tombstones survive compaction (a mirror must sync within that time
+    # or resync fully)
+    CHANGES_STREAM_POLL_SECONDS: float = 1
+    CHANGES_STREAM_HEARTBEAT_SECONDS: float = 15
+    CHANGES_STREAM_PAGE_SIZE: int = 500
+    # A stream ends after this long; EventSource reconnects with Last-Event-ID and loses nothing,
+    # and long-lived connections get spread over the workers again
+    CHANGES_STREAM_MAX_SECONDS: float = 300
+    CHANGES_TOMBSTONE_RETENTION_SECONDS: float = 7 * 24 * 3600
+
+    # GET /movies/{id}/similar: TF-IDF neighbours precomputed per movie, in memory-mapped files under
+    # this directory (shared by the workers through the page cache), rebuilt in the background
+    SIMILARITY_INDEX_DIR: str = "./data/similarity"
+    SIMILARITY_TOP_K: int = 20
+    SIMILARITY_REBUILD_SECONDS: float = 3600
+
+    # GET /movies/ and GET /movies/by_category from NumPy columns in memory instead of SQLite
+    # (needs numpy). Other workers' writes show up once the snapshot is this many seconds old.
+    CATALOG_SNAPSHOT: bool = False
+    CATALOG_SNAPSHOT_MAX_LAG_SECONDS: float = 1
+
+    # Background jobs (src/jobs.py): the lifespan starts one worker process per database, which runs
+    # due jobs on JOBS_WORKER_THREADS threads, at most JOBS_CONCURRENCY[type] (default 1) of a type
+    # at once, and retries a failed job with exponential backoff up to JOBS_MAX_ATTEMPTS times. A job
+    # still marked running after JOBS_LEASE_SECONDS that no worker is running is queued again
+    JOBS_WORKER_ENABLED: bool = True
+    JOBS_WORKER_THREADS: int = 2
+    JOBS_CONCURRENCY: dict[str, int] = {}
+    JOBS_POLL_SECONDS: float = 1
+    JOBS_MAX_ATTEMPTS: int = 5
+    JOBS_RETRY_BASE_SECONDS: float = 5
+    JOBS_RETRY_MAX_SECONDS: float = 600
+    JOBS_RETENTION_SECONDS: float = 7 * 24 * 3600
+    JOBS_LEASE_SECONDS: float = 300
+
+    # SQLite connection pragmas: WAL lets readers run next to the writer, NORMAL syncs the WAL
+    # at checkpoints instead of on every commit, busy_timeout makes other processes wait for the lock
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Group commit of POST/PUT/DELETE /movies: writes queued while the previous batch commits share
+    # the next transaction. A window > 0 also waits that long for more (bigger batches under heavy
+    # write load, at the cost of latency for a lone write).
+    WRITE_BATCH_WINDOW_MS: float = 0
+    WRITE_BATCH_MAX_SIZE: int = 256
+
+    # Admission control (per worker): requests served at once (0 = no cap), requests allowed to wait
+    # for a slot and for how long, before 503 + Retry-After. Exempt paths are never queued or limited.
+    ADMISSION_MAX_CONCURRENCY: int = 64
+    ADMISSION_QUEUE_SIZE: int = 256
+    ADMISSION_QUEUE_TIMEOUT_MS: float = 1000
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+    ADMISSION_EXEMPT_PATHS: list[str] = ["/metrics", "/movies/changes/stream"]
+    # Token buckets per client (user, else X-Real-IP): "METHOD /route" or "*" -> "requests/seconds"
+    RATE_LIMITS: dict[str, str] = {"POST /auth/login": "10/60", "POST /auth/register": "5/60"}
+    RATE_LIMIT_MAX_CLIENTS: int = 100_000
+
+    # Import of src.main plus lifespan startup on an existing database, checked by the test suite
+    COLD_START_BUDGET_MS: int = 2500
+
     model_config = SettingsConfigDict(env_file=".env")
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
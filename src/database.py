@@ -1,6 +1,17 @@
-from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Connection, Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from concurrent.futures import Future
 from pathlib import Path
-from src.models import tables
+from typing import Any, Callable, Union
+from src.config import settings
+import asyncio
+import queue
+import threading
+import time
+import weakref
+from src.metrics import mark_threadpool_start
 import os
 
 
@@ -13,8 +24,23 @@ if not DB_DIR.exists():
 sqlite_file_name = "database_fast_api.db"
 db_path = DB_DIR / sqlite_file_name
 sqlite_url = f"sqlite:///{db_path}"
+async_sqlite_url = f"sqlite+aiosqlite:///{db_path}"
+
+def sqlite_pragmas(bind: Engine) -> Engine:
+    """Sets the WAL / synchronous / busy_timeout pragmas on every new connection of `bind`."""
+    @event.listens_for(bind, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")  # ignored by in-memory databases
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.close()
+    return bind
+
 # Motor de SQL
-engine = create_engine(sqlite_url, echo=True)
+engine = sqlite_pragmas(create_engine(sqlite_url, echo=settings.SQL_ECHO))
+# The async engine is only built when DB_MODE="async" asks for it (aiosqlite is imported on creation)
+_async_engine: Union[AsyncEngine, None] = None
 '''
 #Esta parte es para una bbdd fuera de Docker compose.
 BASE_DIR = Path(__file__).resolve().parent
@@ -25,11 +51,211 @@ sqlite_url = f"sqlite:///{db_path}"
 engine = create_engine(sqlite_url, echo=True)
 '''
 
-# This function will make the database tables
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-
 # A Session is the unit of work for all interactions with the database.
 def get_session():
+    mark_threadpool_start()
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Returns the aiosqlite engine, creating it on first use.
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(async_sqlite_url, echo=settings.SQL_ECHO)
+        sqlite_pragmas(_async_engine.sync_engine)
+    return _async_engine
+
+# Async unit of work: handlers await every query on the event loop instead of holding a threadpool slot.
+async def get_async_session():
+    async with AsyncSession(get_async_engine()) as session:
+        yield session
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+# ---- Group commit ----
+# SQLite has one writer at a time and every commit is a sync to disk. Instead of one transaction
+# per request, writes are queued and a single writer per engine runs everything that queued up
+# (while the previous batch committed, plus WRITE_BATCH_WINDOW_MS) in one BEGIN IMMEDIATE ... COMMIT. Each write is a function of a
+# Connection run inside its own SAVEPOINT, so a failing write is rolled back alone and its
+# caller gets the exception while the rest of the batch commits.
+# Callers only get their result after the COMMIT, so a returned write is durable.
+
+WriteOp = Callable[[Connection], Any]
+
+
+def _run_batch(conn: Connection, ops: list[WriteOp]) -> list[tuple[bool, Any]]:
+    """Runs `ops` in one transaction; returns (ok, result or exception) per op."""
+    # The driver's implicit transactions are switched off so BEGIN/SAVEPOINT are ours to issue
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        outcomes = []
+        for op in ops:
+            conn.exec_driver_sql("SAVEPOINT write_op")
+            try:
+                outcomes.append((True, op(conn)))
+            except Exception as exc:
+                conn.exec_driver_sql("ROLLBACK TO write_op")
+                outcomes.append((False, exc))
+            conn.exec_driver_sql("RELEASE write_op")
+        conn.exec_driver_sql("COMMIT")
+    except BaseException:
+        try:
+            conn.exec_driver_sql("ROLLBACK")
+        except Exception:
+            pass  # SQLite may already have rolled back (e.g. a failed COMMIT); keep the original error
+        raise
+    return outcomes
+
+
+class WriteQueue:
+    """Writer thread of a sync engine; `submit` returns a Future with the op's result."""
+    idle_seconds = 5.0
+
+    def __init__(self, bind: Engine):
+        self.bind = bind
+        self.pending: queue.SimpleQueue = queue.SimpleQueue()
+        self.batches = 0
+        self.writes = 0
+        self._thread: Union[threading.Thread, None] = None
+        self._lock = threading.Lock()
+
+    def submit(self, op: WriteOp) -> Future:
+        future: Future = Future()
+        self.pending.put((op, future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+        return future
+
+    def _next_batch(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + settings.WRITE_BATCH_WINDOW_MS / 1000
+        while len(batch) < settings.WRITE_BATCH_MAX_SIZE:
+            try:
+                # Whatever queued up during the previous commit is taken without waiting
+                item = self.pending.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item[0] is None:  # shutdown: commit this batch first
+                self.pending.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self.pending.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                # Idle: the thread ends, and the next submit starts a new one
+                with self._lock:
+                    if self.pending.empty():
+                        self._thread = None
+                        return
+                continue
+            if first[0] is None:  # shutdown
+                return
+            batch = self._next_batch(first)
+            try:
+                with self.bind.connect() as conn:
+                    outcomes = _run_batch(conn, [op for op, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.writes += len(batch)
+            for (_, future), (ok, value) in zip(batch, outcomes):
+                future.set_result(value) if ok else future.set_exception(value)
+
+    def shutdown(self):
+        """Stops the writer after the writes already queued."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self.pending.put((None, None))
+            thread.join(timeout=5)
+
+
+class AsyncWriteQueue:
+    """
+    Writer of an async engine on one event loop. The writer task only lives while writes are
+    queued; each batch runs on an AsyncConnection through run_sync.
+    """
+    def __init__(self, bind: AsyncEngine):
+        self.bind = bind
+        self.pending: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.writes = 0
+        self._task: Union[asyncio.Task, None] = None
+
+    async def submit(self, op: WriteOp) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.put_nowait((op, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _next_batch(self) -> list:
+        if settings.WRITE_BATCH_WINDOW_MS > 0:
+            await asyncio.sleep(settings.WRITE_BATCH_WINDOW_MS / 1000)
+        batch = []
+        while len(batch) < settings.WRITE_BATCH_MAX_SIZE and not self.pending.empty():
+            batch.append(self.pending.get_nowait())
+        return batch
+
+    async def _run(self):
+        while not self.pending.empty():
+            batch = await self._next_batch()
+            try:
+                async with self.bind.connect() as conn:
+                    outcomes = await conn.run_sync(_run_batch, [op for op, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.writes += len(batch)
+            for (_, future), (ok, value) in zip(batch, outcomes):
+                if not future.done():  # the caller may have been cancelled
+                    future.set_result(value) if ok else future.set_exception(value)
+
+
+_write_queues: "weakref.WeakKeyDictionary[Engine, WriteQueue]" = weakref.WeakKeyDictionary()
+_write_queues_lock = threading.Lock()
+# event loop -> {async engine: queue}; a queue cannot outlive the loop its futures belong to
+_async_write_queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def write_queue(bind: Engine) -> WriteQueue:
+    with _write_queues_lock:
+        if bind not in _write_queues:
+            _write_queues[bind] = WriteQueue(bind)
+        return _write_queues[bind]
+
+def async_write_queue(bind: AsyncEngine) -> AsyncWriteQueue:
+    queues = _async_write_queues.setdefault(asyncio.get_running_loop(), {})
+    if bind not in queues:
+        queues[bind] = AsyncWriteQueue(bind)
+    return queues[bind]
+
+def shutdown_write_queues():
+    with _write_queues_lock:
+        for writer in _write_queues.values():
+            writer.shutdown()
+        _write_queues.clear()
+
+def write_queue_stats() -> dict:
+    """Committed batches and writes of every queue in this process (writes / batches = batch size)."""
+    queues = list(_write_queues.values()) + [writer for queues in list(_async_write_queues.values()) for writer in queues.values()]
+    return {"batches": sum(writer.batches for writer in queues), "writes": sum(writer.writes for writer in queues)}
@@ -1,16 +1,194 @@
-from fastapi import Query
-from typing import Annotated
+import base64
+import json
+import math
+from fastapi import HTTPException, Query, status
+from src.config import settings
+from sqlalchemy import bindparam, func, literal_column, tuple_
+from typing import Annotated, Any, Literal, Sequence, Union
+
+
+def encode_cursor(sort: str, order: str, key: Any, id: int) -> str:
+    """Opaque keyset token: the (sort_key, id) of the last row served."""
+    raw = json.dumps([sort, order, key, id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+# Cursor keys are bound to SQL as they come: each must have the type of its sort column
+CURSOR_KEY_TYPES = {"id": (int,), "year": (int,), "rating": (int, float), "title": (str,)}
+_SQLITE_INTEGER = 2 ** 63
+
+def _cursor_value(value: Any, types: tuple) -> bool:
+    if isinstance(value, bool) or not isinstance(value, types):
+        return False
+    if isinstance(value, int):
+        return -_SQLITE_INTEGER <= value < _SQLITE_INTEGER
+    return not isinstance(value, float) or math.isfinite(value)
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        sort, order, key, id = json.loads(raw)
+        valid = sort in CURSOR_KEY_TYPES and _cursor_value(key, CURSOR_KEY_TYPES[sort]) and _cursor_value(id, (int,))
+    except (ValueError, TypeError):
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return sort, order, key, id
+
 
 class PaginationParams:
     """
     Dependency to handle pagination parameters.
     Automatically calculates the offset for database queries.
+    With a `cursor` (the X-Next-Cursor of the previous page) it seeks on (sort_key, id) instead,
+    so deep pages cost the same as the first one.
     """
     def __init__(
         self,
         page: Annotated[int, Query(gt=0, description="Number of page from 1")] = 1,
         size: Annotated[int, Query(gt=0, le=100, description="Number of items per page")] = 10,
+        cursor: Annotated[Union[str, None], Query(description="X-Next-Cursor of the previous page; replaces page")] = None,
+        sort: Annotated[Literal["id", "title", "year", "rating"], Query(description="Sort key")] = "id",
+        order: Annotated[Literal["asc", "desc"], Query(description="Sort direction")] = "asc",
     ):
         self.page = page
         self.size = size
-        self.offset = (page - 1) * size
\ No newline at end of file
+        self.offset = (page - 1) * size
+        self.sort = sort
+        self.order = order
+        self.after = None
+        if cursor is not None:
+            cursor_sort, cursor_order, key, id = decode_cursor(cursor)
+            if (cursor_sort, cursor_order) != (sort, order):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match sort order")
+            self.after = (key, id)
+            self.offset = 0
+
+    def shape(self) -> tuple:
+        """What apply() adds apart from the parameter values: one statement serves every page of a shape."""
+        return self.sort, self.order, self.after is not None
+
+    def params(self) -> dict:
+        """Values of the named parameters of apply()."""
+        params = {"offset": self.offset, "limit": self.size}
+        if self.after is not None:
+            params["after_key"], params["after_id"] = self.after
+        return params
+
+    def apply(self, statement, model):
+        """Adds ORDER BY (sort_key, id), the seek predicate (or OFFSET) and LIMIT to a select on `model`."""
+        params = self.params()
+        key_column, id_column = getattr(model, self.sort), model.id
+        if self.sort == "id":
+            columns = (id_column,)
+            after = None if self.after is None else (bindparam("after_id", params["after_id"]),)
+        else:
+            columns = (key_column, id_column)
+            after = None if self.after is None else (bindparam("after_key", params["after_key"]), bindparam("after_id", params["after_id"]))
+        if after is not None:
+            seek = tuple_(*columns) if len(columns) > 1 else columns[0]
+            value = tuple_(*after) if len(after) > 1 else after[0]
+            statement = statement.where(seek > value if self.order == "asc" else seek < value)
+        if self.order == "desc":
+            columns = tuple(column.desc() for column in columns)
+        return statement.order_by(*columns).offset(bindparam("offset", params["offset"])).limit(bindparam("limit", params["limit"]))
+
+    def next_cursor(self, rows: Sequence) -> Union[str, None]:
+        """Token for the page after `rows`, or None when this was the last page."""
+        if len(rows) < self.size:
+            return None
+        last = rows[-1]
+        return encode_cursor(self.sort, self.order, getattr(last, self.sort), last.id)
+
+
+def batch_ids(ids: Sequence[int]) -> list[int]:
+    """Distinct ids in request order, within BATCH_MAX_IDS."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No ids given")
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {settings.BATCH_MAX_IDS} ids per request")
+    if any(id <= 0 for id in ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ids must be positive")
+    if any(id >= _SQLITE_INTEGER for id in ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Ids must be below {_SQLITE_INTEGER}")
+    return ids
+
+
+class BatchIdsParams:
+    """
+    Dependency for GET /movies/batch: `ids=3,1,2`, or the parameter repeated (`ids=3&ids=1`).
+    """
+    def __init__(
+        self,
+        ids: Annotated[list[str], Query(description="Movie ids, comma-separated; results keep this order")],
+    ):
+        try:
+            parsed = [int(part) for value in ids for part in value.split(",") if part.strip()]
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ids must be integers")
+        self.ids = batch_ids(parsed)
+
+
+class SearchParams:
+    """
+    Dependency for full-text search: the query text and its page.
+    """
+    def __init__(
+        self,
+        q: Annotated[str, Query(min_length=2, max_length=100, description="Words to search in title, overview and category")],
+        page: Annotated[int, Query(gt=0, description="Number of page from 1")] = 1,
+        size: Annotated[int, Query(gt=0, le=100, description="Number of items per page")] = 10,
+    ):
+        self.q = q
+        self.page = page
+        self.size = size
+        self.offset = (page - 1) * size
+
+
+# SQLite has no statistics for a range like `rating >= ?` and guesses it keeps most rows, so
+# with ORDER BY id it would rather walk the whole table in rowid order than use the index.
+# likelihood() marks the range as selective, which is what a client filter usually is.
+RANGE_LIKELIHOOD = literal_column("0.1")
+
+def _selective(predicate):
+    return func.likelihood(predicate, RANGE_LIKELIHOOD)
+
+
+class MovieFilterParams:
+    """
+    Dependency for the filters of GET /movies/. Every combination is served by one of the
+    (category, sort_key, id) / (sort_key, id) indexes of the movie table.
+    """
+    def __init__(
+        self,
+        year_from: Annotated[Union[int, None], Query(description="Only movies released in or after this year")] = None,
+        year_to: Annotated[Union[int, None], Query(description="Only movies released in or before this year")] = None,
+        min_rating: Annotated[Union[float, None], Query(ge=0, le=10, description="Only movies rated at least this")] = None,
+        category: Annotated[Union[str, None], Query(min_length=1, max_length=20, description="Exact category")] = None,
+    ):
+        if year_from is not None and year_to is not None and year_from > year_to:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="year_from is after year_to")
+        self.year_from = year_from
+        self.year_to = year_to
+        self.min_rating = min_rating
+        self.category = category
+
+    def params(self) -> dict:
+        """The filters that are set; their names are the parameters of apply()."""
+        values = {"category": self.category, "year_from": self.year_from, "year_to": self.year_to, "min_rating": self.min_rating}
+        return {name: value for name, value in values.items() if value is not None}
+
+    def shape(self) -> tuple:
+        return tuple(self.params())
+
+    def apply(self, statement, model):
+        params = self.params()
+        if "category" in params:
+            statement = statement.where(model.category == bindparam("category", params["category"]))
+        if "year_from" in params:
+            statement = statement.where(_selective(model.year >= bindparam("year_from", params["year_from"])))
+        if "year_to" in params:
+            statement = statement.where(_selective(model.year <= bindparam("year_to", params["year_to"])))
+        if "min_rating" in params:
+            statement = statement.where(_selective(model.rating >= bindparam("min_rating", params["min_rating"])))
+        return statement
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import stat
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Union
+
+import anyio
+from fastapi import HTTPException, status
+from fastapi.requests import Request
+from fastapi.responses import PlainTextResponse, Response
+
+# File delivery for /movies/get_file and /static: strong ETags and Last-Modified computed once per
+# file version, 304 for conditional requests, single byte ranges (206/416), precompressed .br/.gz
+# siblings chosen by Accept-Encoding, and Cache-Control by kind of asset.
+
+STATIC_DIR = Path(__file__).parent / "static"
+# Output of `python -m src.static_build`: content-addressed copies of src/static plus manifest.json
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+
+# Fingerprinted names change with their content, so clients may keep them forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Anything else is revalidated on every use, which costs a 304 when nothing changed
+REVALIDATE = "no-cache"
+
+# Content-Encoding -> suffix of the precompressed sibling, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    path: str
+    size: int
+    mtime_ns: int
+    etag: str
+    last_modified: str
+
+
+# path -> FileInfo of its current version; one entry per file on disk
+_file_infos: dict[str, FileInfo] = {}
+
+
+def _content_etag(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def file_info(path: Union[str, Path]) -> Union[FileInfo, None]:
+    """
+    Validators of a regular file, or None if there is none. The content hash is only
+    recomputed when the size or mtime changed, so a request costs one stat().
+    """
+    path = str(path)
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    info = _file_infos.get(path)
+    if info is None or (info.size, info.mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns):
+        info = FileInfo(
+            path=path,
+            size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+            etag=_content_etag(path),
+            last_modified=formatdate(stat_result.st_mtime, usegmt=True),
+        )
+        _file_infos[path] = info
+    return info
+
+
+def accepted_encodings(header: Union[str, None]) -> set[str]:
+    """Codings of an Accept-Encoding header that are not refused with q=0."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/"x" matches "x"
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    opaque = etag.removeprefix("W/")
+    return "*" in candidates or any(candidate.removeprefix("W/") == opaque for candidate in candidates)
+
+
+def is_not_modified(request: Request, info: FileInfo) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, info.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return info.mtime_ns // 1_000_000_000 <= since
+    return False
+
+
+def requested_range(request: Request, info: FileInfo) -> Union[tuple[int, int], None]:
+    """
+    (start, end) inclusive of a satisfiable single-range request, None to send the whole file.
+    Raises 416 for a range that starts past the end.
+    """
+    header = request.headers.get("range")
+    if header is None or not header.startswith("bytes="):
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range not in (info.etag, info.last_modified):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None  # multipart/byteranges is not worth it: the whole file is a valid answer
+    first, _, last = spec.partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else info.size - 1
+        else:
+            start, end = max(info.size - int(last), 0), info.size - 1
+    except ValueError:
+        return None
+    if start > end and first and last:
+        return None
+    if start >= info.size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{info.size}"},
+        )
+    return start, min(end, info.size - 1)
+
+
+class FileRangeResponse(Response):
+    """Streams `length` bytes of a file from `start` (the whole file or one range of it)."""
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, start: int, length: int, status_code: int, headers: dict, media_type: str):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({**headers, "Content-Length": str(length)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.length
+            while True:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                more_body = remaining > 0 and len(chunk) > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                if not more_body:
+                    break
+
+
+def file_response(request: Request, path: Union[str, Path], cache_control: str = REVALIDATE) -> Response:
+    """
+    Response for a GET/HEAD of the file at `path`. Blocking (stat and, for a new version,
+    hashing): call it from a sync endpoint or a worker thread.
+    """
+    info = file_info(path)
+    if info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    media_type = guess_type(info.path)[0] or "application/octet-stream"
+    headers = {"Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+    variants = {coding: variant for coding, suffix in PRECOMPRESSED if (variant := file_info(info.path + suffix))}
+    if variants:
+        headers["Vary"] = "Accept-Encoding"
+        # Ranges always address the identity bytes, so a client resuming a download gets one view
+        if "range" not in request.headers:
+            accepted = accepted_encodings(request.headers.get("accept-encoding"))
+            coding = next((coding for coding, _ in PRECOMPRESSED if coding in variants and coding in accepted), None)
+            if coding is not None:
+                info = variants[coding]
+                headers["Content-Encoding"] = coding
+
+    headers["ETag"] = info.etag
+    headers["Last-Modified"] = info.last_modified
+    if is_not_modified(request, info):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = requested_range(request, info)
+    if byte_range is None:
+        return FileRangeResponse(info.path, 0, info.size, status.HTTP_200_OK, headers, media_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    return FileRangeResponse(info.path, start, end - start + 1, status.HTTP_206_PARTIAL_CONTENT, headers, media_type)
+
+
+class StaticAssets:
+    """
+    ASGI app serving a directory through file_response. Files under dist/ are content-addressed
+    by the static build and get IMMUTABLE; everything else is revalidated.
+    """
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory).resolve()
+
+    def _response(self, request: Request, relative: str) -> Response:
+        path = (self.directory / relative).resolve()
+        if not path.is_relative_to(self.directory) or path.suffix in (".br", ".gz") or path == MANIFEST_PATH.resolve():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        immutable = path.is_relative_to(self.directory / DIST_DIR.name)
+        return file_response(request, path, IMMUTABLE if immutable else REVALIDATE)
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if request.method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=status.HTTP_405_METHOD_NOT_ALLOWED, headers={"Allow": "GET, HEAD"})
+        else:
+            relative = scope["path"][len(scope.get("root_path", "")):].lstrip("/")
+            response = await anyio.to_thread.run_sync(self._response, request, relative)
+        await response(scope, receive, send)
+
+
+@lru_cache(maxsize=1)
+def asset_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST_PATH.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def asset_path(name: str) -> str:
+    """Fingerprinted path of a static asset when the build ran, else its plain path."""
+    return asset_manifest().get(name, name)
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Union
+
+from fastapi import HTTPException, status
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+from src.config import settings
+
+# argon2 runs in a dedicated process pool so a burst of logins/registrations burns those cores
+# instead of the request threadpool. Admission is bounded: when every worker is busy and the
+# queue is full, callers get 503 + Retry-After right away instead of piling up.
+
+def argon2_params() -> tuple:
+    return (settings.ARGON2_TIME_COST, settings.ARGON2_MEMORY_COST, settings.ARGON2_PARALLELISM)
+
+@lru_cache(maxsize=8)
+def crypt_context(params: tuple) -> "CryptContext":
+    # passlib is imported here, by the first hash, so the API process starts without it
+    from passlib.context import CryptContext
+    time_cost, memory_cost, parallelism = params
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__rounds=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+# ---- Functions executed inside the worker processes ----
+
+def hash_secret(secret: str, params: tuple) -> str:
+    return crypt_context(params).hash(secret)
+
+def verify_secret(secret: str, hashed: str, params: tuple) -> tuple[bool, Union[str, None]]:
+    """Returns (valid, new_hash). new_hash is set when `hashed` was made with other parameters."""
+    return crypt_context(params).verify_and_update(secret, hashed)
+
+
+class HashingBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, retry shortly",
+            headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+        )
+
+
+class HashingPool:
+    """
+    Process pool for argon2 with a bounded number of admitted jobs (running + queued).
+    With workers=0 the work runs inline in the caller, still behind the same admission bound.
+    """
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.capacity = max(workers, 1) + queue_size
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._executor: Union[ProcessPoolExecutor, None] = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs threads (uvicorn, anyio) is unsafe
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy()
+        try:
+            if self.workers == 0:
+                future: Future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as exc:
+                    future.set_exception(exc)
+            else:
+                future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def in_flight(self) -> int:
+        return self.capacity - self._slots._value
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hashing_pool = HashingPool(
+    workers=settings.PASSWORD_HASH_WORKERS if settings.PASSWORD_HASH_WORKERS is not None else (os.cpu_count() or 1),
+    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+)
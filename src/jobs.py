@@ -0,0 +1,422 @@
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Union
+
+from sqlalchemy import DDL, Connection, Engine, create_engine, event, inspect
+from sqlalchemy.engine import make_url
+
+from src.config import settings
+from src.database import _run_batch, async_write_queue, sqlite_pragmas, write_queue
+from src.models.tables import Movie
+
+# Background jobs for maintenance that must not run inside a request: VACUUM, REINDEX, the
+# statistics check, change-log compaction, similarity rebuilds. Handlers only enqueue a row in
+# the `job` table (through the group-commit writer, so it is durable once they return); one
+# worker process per database, started by the lifespan of src/main.py, runs the jobs on a few
+# threads with a concurrency limit per type and retries failures with exponential backoff.
+# A job that was running when the worker died is picked up again by the next one, and a job
+# left running longer than JOBS_LEASE_SECONDS (its result could not be written) is requeued.
+#
+#   python -m src.jobs              # the worker, when the app runs with JOBS_WORKER_ENABLED=false
+
+JOB_TABLE = "job"
+LOCK_SUFFIX = ".jobs.lock"
+PRUNE_INTERVAL_SECONDS = 3600
+LATENCY_WINDOW = 1000
+RECENT_JOBS = 20
+FINISH_ATTEMPTS = 5
+FINISH_RETRY_SECONDS = 0.2
+
+JOBS_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {JOB_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type VARCHAR NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{{}}',
+        status VARCHAR NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        dedup_key VARCHAR,
+        created_at FLOAT NOT NULL,
+        run_at FLOAT NOT NULL,
+        started_at FLOAT,
+        finished_at FLOAT,
+        error TEXT,
+        result TEXT
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_job_status_run_at ON {JOB_TABLE} (status, run_at)",
+    f"CREATE INDEX IF NOT EXISTS ix_job_finished_at ON {JOB_TABLE} (finished_at)",
+    # At most one pending job per dedup key: enqueueing it again returns the pending one
+    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_job_dedup_key ON {JOB_TABLE} (dedup_key) WHERE status IN ('queued', 'running')",
+]
+
+for statement in JOBS_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement))
+
+_JOB_COLUMNS = ("id", "type", "payload", "status", "attempts", "max_attempts", "dedup_key", "created_at", "run_at", "started_at", "finished_at", "error", "result")
+
+
+def ensure_job_table(conn: Connection):
+    for statement in JOBS_DDL:
+        conn.exec_driver_sql(statement)
+
+
+# ---- Job types ----
+
+def run_write(engine: Engine, op: Callable[[Connection], Any]) -> Any:
+    """op(conn) in a BEGIN IMMEDIATE transaction of its own, like a group-commit batch of one."""
+    with engine.connect() as conn:
+        ok, value = _run_batch(conn, [op])[0]
+    if not ok:
+        raise value
+    return value
+
+
+def _database_bytes(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA page_count").scalar() * conn.exec_driver_sql("PRAGMA page_size").scalar()
+
+
+def vacuum(engine: Engine, payload: dict) -> dict:
+    """Rewrites the database file without its free pages (writes wait for it: run it off-peak)."""
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        before = _database_bytes(conn)
+        conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"bytes_before": before, "bytes_after": _database_bytes(conn)}
+
+
+def optimize(engine: Engine, payload: dict) -> dict:
+    """Refreshes the planner statistics and merges the search index segments (after bulk imports)."""
+    from src.search import FTS_TABLE
+    def op(conn: Connection):
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        return {}
+    return run_write(engine, op)
+
+
+def reindex(engine: Engine, payload: dict) -> dict:
+    """Rebuilds every index and the search index from the rows."""
+    from src.search import FTS_TABLE
+    def op(conn: Connection):
+        conn.exec_driver_sql("REINDEX")
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        return {}
+    return run_write(engine, op)
+
+
+def check_stats(engine: Engine, payload: dict) -> dict:
+    from src.stats import check_catalog_stats
+    repair = payload.get("repair", True)
+    mismatches = run_write(engine, partial(check_catalog_stats, repair=repair))
+    return {"consistent": not mismatches, "repaired": bool(mismatches) and repair, "mismatches": mismatches}
+
+
+def compact_change_log(engine: Engine, payload: dict) -> dict:
+    from src.changes import compact_changes
+    retention = payload.get("retention_seconds", settings.CHANGES_TOMBSTONE_RETENTION_SECONDS)
+    return run_write(engine, partial(compact_changes, tombstone_retention_seconds=retention))
+
+
+def rebuild_similarity(engine: Engine, payload: dict) -> dict:
+    """A new similarity generation; the app workers map it when it is published."""
+    from src.changes import run_with_connection
+    from src.similarity import build_index, build_lock, read_documents
+    directory = Path(settings.SIMILARITY_INDEX_DIR)
+    with build_lock(directory) as acquired:
+        if not acquired:
+            raise RuntimeError("another process is building the similarity index")  # retried later
+        path = build_index(directory, run_with_connection(engine, read_documents))
+    return {"generation": path.name}
+
+
+@dataclass(frozen=True)
+class JobType:
+    run: Callable[[Engine, dict], Any]
+    concurrency: int = 1  # jobs of this type running at once; JOBS_CONCURRENCY overrides it
+
+
+JOB_TYPES: dict[str, JobType] = {
+    "vacuum": JobType(vacuum),
+    "optimize": JobType(optimize),
+    "reindex": JobType(reindex),
+    "check_stats": JobType(check_stats),
+    "compact_changes": JobType(compact_change_log),
+    "rebuild_similarity": JobType(rebuild_similarity),
+}
+
+
+def concurrency_limit(type: str) -> int:
+    return settings.JOBS_CONCURRENCY.get(type, JOB_TYPES[type].concurrency)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter after the `attempts`-th failure."""
+    delay = min(settings.JOBS_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+# ---- Queue ----
+
+def job_dict(row) -> dict:
+    job = dict(zip(_JOB_COLUMNS, row))
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = None if job["result"] is None else json.loads(job["result"])
+    return job
+
+
+def enqueue_job(conn: Connection, type: str, payload: Union[dict, None] = None, delay_seconds: float = 0, dedup_key: Union[str, None] = None) -> dict:
+    """Adds a job (a write op for the group-commit queue); a pending job with the same dedup_key is returned instead."""
+    if type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type {type!r}")
+    now = time.time()
+    row = conn.exec_driver_sql(
+        f"INSERT INTO {JOB_TABLE} (type, payload, max_attempts, dedup_key, created_at, run_at) VALUES (?, ?, ?, ?, ?, ?) "
+        f"ON CONFLICT DO NOTHING RETURNING id, status",
+        (type, json.dumps(payload or {}), settings.JOBS_MAX_ATTEMPTS, dedup_key, now, now + delay_seconds),
+    ).first()
+    if row is not None:
+        return {"id": row[0], "status": row[1], "deduplicated": False}
+    row = conn.exec_driver_sql(
+        f"SELECT id, status FROM {JOB_TABLE} WHERE dedup_key = ? AND status IN ('queued', 'running')", (dedup_key,)
+    ).first()
+    return {"id": row[0], "status": row[1], "deduplicated": True}
+
+
+def read_job(conn: Connection, id: int) -> Union[dict, None]:
+    row = conn.exec_driver_sql(f"SELECT {', '.join(_JOB_COLUMNS)} FROM {JOB_TABLE} WHERE id = ?", (id,)).first()
+    return None if row is None else job_dict(row)
+
+
+def _percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+    rank = lambda fraction: values[min(max(int(round(fraction * len(values) + 0.5)) - 1, 0), len(values) - 1)]
+    return {"p50_ms": round(rank(0.5) * 1000, 1), "p95_ms": round(rank(0.95) * 1000, 1), "max_ms": round(values[-1] * 1000, 1)}
+
+
+def job_stats(conn: Connection) -> dict:
+    """Queue depth per type and status, and the wait and run times of the latest finished jobs."""
+    now = time.time()
+    queue: dict = {}
+    for type, status, count in conn.exec_driver_sql(f"SELECT type, status, count(*) FROM {JOB_TABLE} GROUP BY type, status"):
+        queue.setdefault(type, {"queued": 0, "running": 0, "done": 0, "failed": 0})[status] = count
+    # Due and not started: what the worker is behind by
+    due, oldest = conn.exec_driver_sql(
+        f"SELECT count(*), min(run_at) FROM {JOB_TABLE} WHERE status = 'queued' AND run_at <= ?", (now,)
+    ).first()
+    latency: dict = {}
+    finished = conn.exec_driver_sql(
+        f"SELECT type, run_at, started_at, finished_at FROM {JOB_TABLE} WHERE finished_at IS NOT NULL "
+        f"ORDER BY finished_at DESC LIMIT {LATENCY_WINDOW}"
+    ).all()
+    for type in {row[0] for row in finished}:
+        rows = [row for row in finished if row[0] == type]
+        latency[type] = {
+            "count": len(rows),
+            "wait": _percentiles([started - run_at for _, run_at, started, _ in rows]),
+            "run": _percentiles([done - started for _, _, started, done in rows]),
+        }
+    recent = conn.exec_driver_sql(f"SELECT {', '.join(_JOB_COLUMNS)} FROM {JOB_TABLE} ORDER BY id DESC LIMIT {RECENT_JOBS}").all()
+    return {
+        "depth": due,
+        "oldest_due_seconds": None if oldest is None else round(now - oldest, 3),
+        "queue": queue,
+        "latency": latency,
+        "recent": [job_dict(row) for row in recent],
+    }
+
+
+def enqueue(bind: Engine, type: str, **options) -> dict:
+    return write_queue(bind).submit(partial(enqueue_job, type=type, **options)).result()
+
+
+async def aenqueue(bind, type: str, **options) -> dict:
+    return await async_write_queue(bind).submit(partial(enqueue_job, type=type, **options))
+
+
+# ---- Worker ----
+
+class JobWorker:
+    """Claims due jobs and runs them on up to JOBS_WORKER_THREADS threads."""
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.running: dict[str, int] = {}
+        self.claimed: set[int] = set()  # ids of the jobs running in this worker
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.wake = threading.Event()
+        self.pool = ThreadPoolExecutor(settings.JOBS_WORKER_THREADS, thread_name_prefix="job")
+        self.pruned_at = 0.0
+        self.recovered_at = 0.0
+
+    def recover(self, started_before: Union[float, None] = None) -> int:
+        """
+        Jobs left running by a worker that died, or whose result could not be written: queued
+        again, or failed when out of attempts. `started_before` limits it to expired leases.
+        """
+        def op(conn: Connection):
+            now = time.time()
+            with self.lock:
+                claimed = list(self.claimed)
+            # Not the jobs this worker is still running, however long they take
+            where = f"status = 'running' AND started_at < ? AND id NOT IN ({', '.join('?' * len(claimed))})"
+            params = (now if started_before is None else started_before, *claimed)
+            conn.exec_driver_sql(
+                f"UPDATE {JOB_TABLE} SET status = 'failed', finished_at = ?, error = 'worker stopped during the job' "
+                f"WHERE {where} AND attempts >= max_attempts", (now, *params),
+            )
+            return conn.exec_driver_sql(f"UPDATE {JOB_TABLE} SET status = 'queued', run_at = ? WHERE {where}", (now, *params)).rowcount
+        recovered = run_write(self.engine, op)
+        self.recovered_at = time.monotonic()
+        return recovered
+
+    def claim(self) -> Union[dict, None]:
+        with self.lock:
+            if sum(self.running.values()) >= settings.JOBS_WORKER_THREADS:
+                return None
+            types = [type for type in JOB_TYPES if self.running.get(type, 0) < concurrency_limit(type)]
+        if not types:
+            return None
+        def op(conn: Connection):
+            now = time.time()
+            row = conn.exec_driver_sql(
+                f"UPDATE {JOB_TABLE} SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ("
+                f"SELECT id FROM {JOB_TABLE} WHERE status = 'queued' AND run_at <= ? AND type IN ({', '.join('?' * len(types))}) "
+                f"ORDER BY run_at, id LIMIT 1) RETURNING {', '.join(_JOB_COLUMNS)}",
+                (now, now, *types),
+            ).first()
+            return None if row is None else job_dict(row)
+        job = run_write(self.engine, op)
+        if job is not None:
+            with self.lock:
+                self.running[job["type"]] = self.running.get(job["type"], 0) + 1
+                self.claimed.add(job["id"])
+        return job
+
+    def run(self, job: dict):
+        try:
+            result = JOB_TYPES[job["type"]].run(self.engine, job["payload"])
+            self.finish(job, "done", result=json.dumps(result, default=str))
+        except Exception as exc:
+            if job["attempts"] < job["max_attempts"]:
+                self.finish(job, "queued", error=repr(exc), run_at=time.time() + retry_delay(job["attempts"]))
+            else:
+                self.finish(job, "failed", error=repr(exc))
+        finally:
+            with self.lock:
+                self.running[job["type"]] -= 1
+                self.claimed.discard(job["id"])
+            self.wake.set()
+
+    def finish(self, job: dict, status: str, result: Union[str, None] = None, error: Union[str, None] = None, run_at: Union[float, None] = None):
+        """Writes the outcome, retried with backoff (the database may be locked); past that the lease requeues the job."""
+        def op(conn: Connection):
+            finished_at = None if status == "queued" else time.time()
+            conn.exec_driver_sql(
+                f"UPDATE {JOB_TABLE} SET status = ?, finished_at = ?, result = ?, error = ?, run_at = coalesce(?, run_at) WHERE id = ? AND status = 'running'",
+                (status, finished_at, result, error, run_at, job["id"]),
+            )
+        for attempt in range(FINISH_ATTEMPTS):
+            try:
+                return run_write(self.engine, op)
+            except Exception as exc:
+                if attempt == FINISH_ATTEMPTS - 1:
+                    print(f"Jobs: could not finish job {job['id']}: {exc!r}")
+                    return
+                time.sleep(FINISH_RETRY_SECONDS * 2 ** attempt)
+
+    def prune(self):
+        """Drops finished jobs past JOBS_RETENTION_SECONDS."""
+        cutoff = time.time() - settings.JOBS_RETENTION_SECONDS
+        run_write(self.engine, lambda conn: conn.exec_driver_sql(
+            f"DELETE FROM {JOB_TABLE} WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+        ).rowcount)
+        self.pruned_at = time.monotonic()
+
+    def run_pending(self) -> int:
+        """Starts every job that is due and within its limits; returns how many."""
+        started = 0
+        while (job := self.claim()) is not None:
+            self.pool.submit(self.run, job)
+            started += 1
+        return started
+
+    def serve(self, alive: Callable[[], bool] = lambda: True):
+        self.recover()
+        while not self.stop.is_set() and alive():
+            try:
+                if time.monotonic() - self.pruned_at >= PRUNE_INTERVAL_SECONDS:
+                    self.prune()
+                if time.monotonic() - self.recovered_at >= settings.JOBS_LEASE_SECONDS / 4:
+                    self.recover(started_before=time.time() - settings.JOBS_LEASE_SECONDS)
+                self.run_pending()
+            except Exception as exc:  # e.g. the database is locked: next round
+                print(f"Jobs: {exc!r}")
+            self.wake.wait(settings.JOBS_POLL_SECONDS)
+            self.wake.clear()
+        self.pool.shutdown(wait=True)
+
+
+def worker_lock_path(db_url: str) -> Union[Path, None]:
+    database = make_url(db_url).database
+    return None if not database or database == ":memory:" else Path(f"{database}{LOCK_SUFFIX}")
+
+
+def start_job_worker(db_url: str) -> subprocess.Popen:
+    """The worker process for `db_url`; it stands by while another one serves the database."""
+    return subprocess.Popen([sys.executable, "-m", "src.jobs", "--db-url", db_url, "--parent", str(os.getpid())])
+
+
+def stop_job_worker(process: subprocess.Popen, timeout: float = 10):
+    if process.poll() is None:
+        process.terminate()  # SIGTERM: running jobs finish, queued ones wait for the next worker
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()  # an interrupted job is run again by the next worker
+
+
+def main(argv=None):
+    import fcntl
+    from src.database import sqlite_url
+    parser = argparse.ArgumentParser(description="Run the background jobs of the movie database")
+    parser.add_argument("--db-url", default=sqlite_url)
+    parser.add_argument("--parent", type=int, default=None, help="Exit when this process is gone")
+    args = parser.parse_args(argv)
+
+    engine = sqlite_pragmas(create_engine(args.db_url))
+    worker = JobWorker(engine)
+    signal.signal(signal.SIGTERM, lambda *_: (worker.stop.set(), worker.wake.set()))
+    alive = (lambda: os.getppid() == args.parent) if args.parent else (lambda: True)
+    lock_path = worker_lock_path(args.db_url)
+    lock = open(lock_path, "w") if lock_path else None
+    while lock is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            # Another uvicorn worker's job process serves this database: take over if it goes away
+            if worker.stop.wait(settings.JOBS_POLL_SECONDS) or not alive():
+                return
+    with engine.begin() as conn:
+        if inspect(conn).has_table("movie"):
+            ensure_job_table(conn)
+    print(f"Jobs: worker {os.getpid()} serving {args.db_url}", flush=True)
+    worker.serve(alive)
+
+
+if __name__ == "__main__":
+    main()
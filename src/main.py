@@ -2,29 +2,57 @@
 
 from fastapi import FastAPI,status,HTTPException, Depends
 from fastapi.requests import Request
-from fastapi.responses import Response,JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from src.routers.movie_router import movie_router
-from src.routers.auth_router import auth_router
+from fastapi.responses import Response,JSONResponse,ORJSONResponse,PlainTextResponse
 from typing import Union
 from pathlib import Path
+from functools import lru_cache
 from contextlib import asynccontextmanager
-from src.database import create_db_and_tables
+from src.config import settings
+from src.database import dispose_async_engine, engine, get_async_engine, shutdown_write_queues, sqlite_url, write_queue_stats
+from src.migrations import run_migrations
+from src.hashing import hashing_pool
+from src.cache import response_cache
+from src.metrics import MetricsMiddleware, metrics
+from src.admission import AdmissionMiddleware, concurrency_limiter, rate_limiter
+from src.compression import CompressionMiddleware, compression_stats
+from src.files import StaticAssets, asset_path
+from src.similarity import shutdown_similarity, similarity_footprint
+from src.profiler import query_profiler
+from src.catalog import catalog_stats, preload_catalog
+from src.jobs import start_job_worker, stop_job_worker
 import os
 
+# DB_MODE picks the router flavour: blocking Session handlers or AsyncSession handlers.
+if settings.DB_MODE == "async":
+    from src.routers.async_movie_router import async_movie_router as movie_router
+    from src.routers.async_auth_router import async_auth_router as auth_router
+else:
+    from src.routers.movie_router import movie_router
+    from src.routers.auth_router import auth_router
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Code to run on startup
-    print("Startup: Creating database and tables...")
-    create_db_and_tables()
+    print("Startup: Checking database schema...")
+    if run_migrations() == 0:
+        print("Startup: Schema is up to date.")
+    if settings.CATALOG_SNAPSHOT:
+        await preload_catalog(get_async_engine() if settings.DB_MODE == "async" else engine)
+    # Maintenance jobs run in a process of their own; with several uvicorn workers only one serves the database
+    job_worker = start_job_worker(sqlite_url) if settings.JOBS_WORKER_ENABLED else None
     yield
     # Code to run on shutdown (if any)
+    if job_worker is not None:
+        stop_job_worker(job_worker)
+    shutdown_write_queues()
+    shutdown_similarity()
+    await dispose_async_engine()
+    hashing_pool.shutdown()
     print("Shutdown: Application closing.")
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse if settings.FAST_JSON else JSONResponse)
 app.title = "App Movies"
 app.version = "1.0.0"
 
@@ -32,8 +60,17 @@ app.version = "1.0.0"
 BASE_DIR = Path(__file__).parent # root path #src
 static_path = BASE_DIR / "static"
 templates_path = BASE_DIR / "templates" # src/templates
-app.mount("/static", StaticFiles(directory=static_path),name="static")
-templates = Jinja2Templates(directory=templates_path)
+
+# Templates are rarely rendered, so Jinja2 is only loaded by the first request that needs it
+@lru_cache(maxsize=1)
+def get_templates():
+    from fastapi.templating import Jinja2Templates
+    templates = Jinja2Templates(directory=templates_path)
+    templates.env.globals["asset_path"] = asset_path
+    return templates
+
+# ETag/304, byte ranges, precompressed siblings and immutable caching of the fingerprinted build
+app.mount("/static", StaticAssets(static_path), name="static")
 
 
 ###  Middleware  ###
@@ -50,10 +87,36 @@ async def http_error_handler(request: Request, call_next) -> Union[Response, JSO
             content={"detail": f"Unexpected internal server error: {str(e)}"}
         )
 
+# Compresses what http_error_handler returns, cached responses included
+app.add_middleware(CompressionMiddleware)
+# Around compression: sheds load (503) and rate-limits (429) before any handler runs
+app.add_middleware(AdmissionMiddleware)
+# Outermost layer: times everything below, including shed requests and http_error_handler
+app.add_middleware(MetricsMiddleware)
+
+# Sizes go up and down (a gauge); lookups and removals only ever add up (a counter, for rate())
+RESPONSE_CACHE_SIZES = ("entries", "bytes", "max_bytes")
+
+metrics.register_collector("response_cache", "Response cache entries and bytes, and its byte budget", "gauge", lambda: {(("stat", name),): value for name, value in response_cache.stats().items() if name in RESPONSE_CACHE_SIZES})
+metrics.register_collector("response_cache_events_total", "Response cache hits, misses, evictions, expirations and invalidations", "counter", lambda: {(("event", name),): value for name, value in response_cache.stats().items() if name not in RESPONSE_CACHE_SIZES})
+metrics.register_collector("password_hash_in_flight", "argon2 operations running or queued", "gauge", lambda: {(): hashing_pool.in_flight()})
+metrics.register_collector("db_write_queue", "Group-commit batches and the writes they carried", "counter", lambda: {(("stat", name),): value for name, value in write_queue_stats().items()})
+metrics.register_collector("admission_requests", "Requests running and waiting for an admission slot", "gauge", lambda: {(("state", "active"),): concurrency_limiter.active, (("state", "waiting"),): len(concurrency_limiter.waiters)})
+metrics.register_collector("admission_shed_total", "Requests shed with 503 by reason, and rate-limited with 429", "counter", lambda: {**{(("reason", reason),): count for reason, count in concurrency_limiter.rejected.items()}, (("reason", "rate_limited"),): rate_limiter.limited})
+metrics.register_collector("compression_bytes_total", "Response bytes before (in) and after (out) compression, by coding", "counter", lambda: {(("coding", coding), ("stage", stage)): count for coding, stats in compression_stats.items() for stage, count in stats.items()})
+metrics.register_collector("similarity_index_bytes", "Similarity index: memory-mapped generation files and in-memory updates since the build", "gauge", lambda: {(("part", part),): size for part, size in similarity_footprint().items()})
+metrics.register_collector("db_statements_profiled_total", "SQL statements timed by the profiler, and those over QUERY_PROFILER_SLOW_MS", "counter", lambda: {(("kind", "sampled"),): query_profiler.sampled, (("kind", "slow"),): query_profiler.slow_total})
+metrics.register_collector("catalog_snapshot", "In-memory catalog snapshot: movies, bytes of the columns and full loads", "gauge", lambda: {(("stat", name),): value for name, value in catalog_stats().items()})
+metrics.register_collector("password_hash_rejected_total", "argon2 operations shed with 503", "counter", lambda: {(): hashing_pool.rejected})
+
+@app.get('/metrics', tags=['Home'], include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # HOME Endpoint
 @app.get('/', tags=['Home'])
 def home(request : Request):
-    response = templates.TemplateResponse(
+    response = get_templates().TemplateResponse(
         request=request,
         name= 'index.html', 
         context={'request': request,'message': 'Welcome'})
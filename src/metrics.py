@@ -0,0 +1,195 @@
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Callable, Union
+
+import anyio.to_thread
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request instrumentation for production: a pure ASGI middleware (no BaseHTTPMiddleware task
+# hop) that records per-route latency, in-flight requests, DB queries/time per request and
+# threadpool wait. Results go out as a Server-Timing header and as Prometheus text on /metrics.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """What one request spent, filled in by the SQLAlchemy events and get_session."""
+    __slots__ = ("started", "db_queries", "db_time", "threadpool_wait")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.threadpool_wait: Union[float, None] = None
+
+
+current_request_stats: ContextVar[Union[RequestStats, None]] = ContextVar("current_request_stats", default=None)
+
+
+def mark_threadpool_start():
+    """
+    Called as the first thing a sync session dependency does on its worker thread: the time
+    since the request arrived is how long it waited for a threadpool slot.
+    """
+    stats = current_request_stats.get()
+    if stats is not None and stats.threadpool_wait is None:
+        stats.threadpool_wait = time.perf_counter() - stats.started
+
+
+# Listening on the Engine class covers every engine: the app's, the aiosqlite one and test engines.
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request_stats.get()
+    started = conn.info.pop("query_started", None)
+    if stats is not None and started is not None:
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{str(value)}"' for name, value in labels.items())
+
+
+class MetricsRegistry:
+    """
+    Metrics of this worker process. Only the event loop thread writes to it, so no locks.
+    """
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: dict[tuple, Histogram] = {}
+        self.threadpool_wait: dict[tuple, Histogram] = {}
+        self.requests: dict[tuple, int] = {}
+        self.db_queries: dict[tuple, int] = {}
+        self.db_time: dict[tuple, float] = {}
+        # name -> (help, type, callback returning {labels tuple: value})
+        self.collectors: dict[str, tuple[str, str, Callable[[], dict]]] = {}
+
+    def observe(self, method: str, route: str, status: int, duration: float, stats: RequestStats):
+        key = (method, route)
+        self.latency.setdefault(key, Histogram()).observe(duration)
+        self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+        self.db_queries[key] = self.db_queries.get(key, 0) + stats.db_queries
+        self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_time
+        if stats.threadpool_wait is not None:
+            self.threadpool_wait.setdefault(key, Histogram()).observe(stats.threadpool_wait)
+
+    def register_collector(self, name: str, help: str, type: str, callback: Callable[[], dict]):
+        """Adds a metric read at scrape time; `callback` returns {(("label", value), ...): number}."""
+        self.collectors[name] = (help, type, callback)
+
+    def reset(self):
+        self.latency.clear()
+        self.threadpool_wait.clear()
+        self.requests.clear()
+        self.db_queries.clear()
+        self.db_time.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: list[str] = []
+        self._render_histograms(lines, "http_request_duration_seconds", "Request latency by route", self.latency)
+        self._render_histograms(lines, "threadpool_wait_seconds", "Time until a sync request got a threadpool slot", self.threadpool_wait)
+        lines += ["# HELP http_requests_total Requests by route and status", "# TYPE http_requests_total counter"]
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{{{_labels(method=method, route=route, status=status)}}} {value}")
+        lines += ["# HELP http_requests_in_flight Requests being served", "# TYPE http_requests_in_flight gauge", f"http_requests_in_flight {self.in_flight}"]
+        lines += ["# HELP db_queries_total SQL statements executed by route", "# TYPE db_queries_total counter"]
+        for (method, route), value in sorted(self.db_queries.items()):
+            lines.append(f"db_queries_total{{{_labels(method=method, route=route)}}} {value}")
+        lines += ["# HELP db_time_seconds_total Time spent in SQL statements by route", "# TYPE db_time_seconds_total counter"]
+        for (method, route), value in sorted(self.db_time.items()):
+            lines.append(f"db_time_seconds_total{{{_labels(method=method, route=route)}}} {value:.6f}")
+        for name, (help, type, callback) in self.collectors.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+            for labels, value in callback().items():
+                label_text = _labels(**dict(labels))
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines: list, name: str, help: str, histograms: dict):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for (method, route), histogram in sorted(histograms.items()):
+            labels = _labels(method=method, route=route)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+metrics = MetricsRegistry()
+
+
+def _threadpool_usage() -> dict:
+    try:
+        statistics = anyio.to_thread.current_default_thread_limiter().statistics()
+    except RuntimeError:  # no event loop in this thread
+        return {}
+    return {(("state", "borrowed"),): statistics.borrowed_tokens, (("state", "waiting"),): statistics.tasks_waiting}
+
+metrics.register_collector("threadpool_tokens", "anyio threadpool slots in use and tasks waiting for one", "gauge", _threadpool_usage)
+
+
+def server_timing(duration: float, stats: RequestStats) -> str:
+    parts = [f"app;dur={duration * 1000:.2f}", f'db;dur={stats.db_time * 1000:.2f};desc="{stats.db_queries} queries"']
+    if stats.threadpool_wait is not None:
+        parts.append(f"tp;dur={stats.threadpool_wait * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware feeding `metrics` and adding Server-Timing to every HTTP response."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+        metrics.in_flight += 1
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timing = server_timing(time.perf_counter() - stats.started, stats)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.in_flight -= 1
+            current_request_stats.reset(token)
+            # The router stores the matched APIRoute in the scope: label by template, not raw path.
+            # Mounts (e.g. /static) only leave their prefix in root_path.
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or scope.get("root_path") or "unmatched"
+            metrics.observe(scope["method"], route_path, status_code, time.perf_counter() - stats.started, stats)
@@ -0,0 +1,72 @@
+from typing import Callable
+from sqlalchemy import Connection, Engine, inspect
+from sqlmodel import SQLModel
+from src.database import engine
+from src.models import tables
+from src.changes import ensure_change_log
+from src.search import ensure_search_index
+from src.stats import ensure_catalog_stats
+from src.jobs import ensure_job_table
+
+# Versioned schema changes for databases that already exist (e.g. the one in the Docker volume).
+# PRAGMA user_version stores how many steps a database has run; startup runs the rest in order.
+# Steps only ever get appended, and each one is idempotent: a step interrupted half way is
+# simply run again on the next start.
+
+
+def _create_tables(conn: Connection):
+    # A new database gets the whole current schema here (indexes and FTS triggers included),
+    # which makes the steps below no-ops for it
+    SQLModel.metadata.create_all(conn)
+
+def _create_indexes(*names: str) -> Callable[[Connection], None]:
+    def step(conn: Connection):
+        for index in tables.Movie.__table__.indexes:
+            if index.name in names:
+                index.create(conn, checkfirst=True)
+    return step
+
+def _add_row_versions(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("movie")}
+    if "version" not in columns:
+        conn.exec_driver_sql("ALTER TABLE movie ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    if "updated_at" not in columns:
+        # ADD COLUMN only takes constant defaults: existing rows are stamped once here
+        conn.exec_driver_sql("ALTER TABLE movie ADD COLUMN updated_at DATETIME")
+        conn.exec_driver_sql("UPDATE movie SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+
+
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ("create tables", _create_tables),
+    ("keyset pagination indexes", _create_indexes("ix_movie_title_id", "ix_movie_year_id", "ix_movie_rating_id")),
+    ("full-text search index", ensure_search_index),
+    ("filter indexes", _create_indexes(
+        "ix_movie_category_id", "ix_movie_category_title_id", "ix_movie_category_year_id", "ix_movie_category_rating_id",
+    )),
+    ("catalog statistics", ensure_catalog_stats),
+    ("row versions", _add_row_versions),
+    ("change log", ensure_change_log),
+    ("job queue", ensure_job_table),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def run_migrations(bind: Engine = engine) -> int:
+    """Brings the database of `bind` up to SCHEMA_VERSION; returns how many steps ran."""
+    with bind.connect() as conn:
+        current = schema_version(conn)
+    if current >= SCHEMA_VERSION:
+        # Fast path of every restart: one PRAGMA read, no create_all walking the tables
+        return 0
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        name, step = MIGRATIONS[version - 1]
+        print(f"Migration {version}: {name}")
+        with bind.begin() as conn:
+            step(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+    return SCHEMA_VERSION - current
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Union
+
+class JobRequest(BaseModel):
+    type: str = Field(description="One of the job types of src/jobs.py, e.g. vacuum, optimize, reindex")
+    payload: dict = Field(default_factory=dict)
+    delay_seconds: float = Field(default=0, ge=0)
+    dedup_key: Union[str, None] = Field(default=None, max_length=200, description="Returns the pending job with this key instead of adding another")
@@ -41,4 +41,37 @@ class MovieUpdate(BaseModel):
     overview: str | None = None
     year: int | None = None
     rating: float | None = None
-    category: str | None = None
\ No newline at end of file
+    category: str | None = None
+
+class MovieBatchRequest(BaseModel):
+    ids: list[int] = Field(min_length=1)
+
+class MovieBatch(BaseModel):
+    movies: list[Movie]
+    missing: list[int]
+
+class MovieChange(BaseModel):
+    seq: int
+    id: int
+    deleted: bool
+    movie: Movie | None
+
+class ChangePage(BaseModel):
+    changes: list[MovieChange]
+    next_cursor: int
+    has_more: bool
+
+class CategoryStats(BaseModel):
+    category: str
+    count: int
+    average_rating: float
+
+class YearCount(BaseModel):
+    year: int
+    count: int
+
+class CatalogStats(BaseModel):
+    total: int
+    average_rating: float | None
+    categories: list[CategoryStats]
+    years: list[YearCount]
@@ -1,6 +1,11 @@
+from datetime import datetime, timezone
 from typing import Optional
+from sqlalchemy import Index, literal_column, text
 from sqlmodel import Field, SQLModel # type: ignore
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 # It will create these tables on SQlite
 class Movie(SQLModel, table=True):
     """
@@ -12,6 +17,22 @@ class Movie(SQLModel, table=True):
     year: int
     rating: float
     category: str
+    # Bumped by every UPDATE, Core or ORM; the ETags of src/versioning.py are built from it
+    version: int = Field(default=1, sa_column_kwargs={"server_default": text("1"), "onupdate": literal_column("version") + 1})
+    updated_at: Optional[datetime] = Field(default_factory=utcnow, sa_column_kwargs={"default": utcnow, "onupdate": utcnow})
+
+    # (sort_key, id) indexes back the keyset pagination of GET /movies/, the
+    # (category, sort_key, id) ones its category filter in every sort order.
+    # Existing databases get new indexes from a step in src/migrations.py.
+    __table_args__ = (
+        Index("ix_movie_title_id", "title", "id"),
+        Index("ix_movie_year_id", "year", "id"),
+        Index("ix_movie_rating_id", "rating", "id"),
+        Index("ix_movie_category_id", "category", "id"),
+        Index("ix_movie_category_title_id", "category", "title", "id"),
+        Index("ix_movie_category_year_id", "category", "year", "id"),
+        Index("ix_movie_category_rating_id", "category", "rating", "id"),
+    )
 
 
 class User(SQLModel, table=True):
@@ -0,0 +1,153 @@
+import random
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Literal, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.config import settings
+
+# Statement profiler behind GET /auth/dashboard/queries: a sample of the SQL statements of every
+# engine, grouped by their normalised text (literals and IN lists folded), with counts and times.
+# The table keeps the QUERY_PROFILER_MAX_STATEMENTS statements with the most total time. A
+# statement slower than QUERY_PROFILER_SLOW_MS goes to a ring buffer of recent slow queries, and
+# the first time it does, its EXPLAIN QUERY PLAN is captured and full-table scans are flagged.
+# Unlike SQL_ECHO it costs two clock reads per sampled statement and writes nothing to stdout.
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \(\?(?:, \?)*\)", re.IGNORECASE)
+_VALUES = re.compile(r"(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(statement: str) -> str:
+    """The statement with its literals as ? and lists of placeholders folded: one entry per query shape."""
+    text = _SPACE.sub(" ", statement).strip()
+    text = _NUMBER.sub("?", _STRING.sub("?", text))
+    text = _VALUES.sub(r"\1, ...", text)
+    return _IN_LIST.sub("IN (?, ...)", text)
+
+
+def is_full_scan(detail: str) -> bool:
+    """An EXPLAIN QUERY PLAN step that reads a whole table: 'SCAN movie', not via an index."""
+    if not detail.startswith("SCAN "):
+        return False
+    return not any(marker in detail for marker in ("USING", "VIRTUAL TABLE", "CONSTANT ROW", "SUBQUERY"))
+
+
+class StatementStats:
+    __slots__ = ("statement", "count", "total", "max", "plan", "full_scan")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.plan: Union[list[str], None] = None
+        self.full_scan: Union[bool, None] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "plan": self.plan,
+            "full_scan": self.full_scan,
+        }
+
+
+class QueryProfiler:
+    """Statements and slow queries of this worker process; fed from any thread."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements: dict[str, StatementStats] = {}
+        self.slow: deque = deque(maxlen=settings.QUERY_PROFILER_SLOW_LOG_SIZE)
+        self.sampled = 0
+        self.slow_total = 0
+
+    def record(self, statement: str, duration: float) -> Union[StatementStats, None]:
+        """Adds one execution; returns its entry when it is slow and has no plan yet."""
+        key = normalize(statement)
+        slow = duration * 1000 >= settings.QUERY_PROFILER_SLOW_MS
+        with self.lock:
+            self.sampled += 1
+            stats = self.statements.get(key)
+            if stats is None:
+                if len(self.statements) >= settings.QUERY_PROFILER_MAX_STATEMENTS:
+                    # Full: the statement with the least total time makes room
+                    del self.statements[min(self.statements.values(), key=lambda entry: entry.total).statement]
+                stats = self.statements[key] = StatementStats(key)
+            stats.count += 1
+            stats.total += duration
+            stats.max = max(stats.max, duration)
+            if slow:
+                self.slow_total += 1
+                self.slow.append({"at": time.time(), "ms": round(duration * 1000, 3), "statement": key})
+        return stats if slow and stats.plan is None else None
+
+    def report(self, limit: int, sort: Literal["total", "max", "count"]) -> dict:
+        with self.lock:
+            entries = sorted(self.statements.values(), key=lambda entry: getattr(entry, sort), reverse=True)[:limit]
+            return {
+                "sample_rate": settings.QUERY_PROFILER_SAMPLE_RATE,
+                "slow_ms": settings.QUERY_PROFILER_SLOW_MS,
+                "sampled": self.sampled,
+                "statements": [entry.as_dict() for entry in entries],
+                "slow": list(self.slow)[::-1],
+            }
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow = deque(maxlen=settings.QUERY_PROFILER_SLOW_LOG_SIZE)
+            self.sampled = 0
+            self.slow_total = 0
+
+
+query_profiler = QueryProfiler()
+
+
+def explain(conn, statement: str, parameters, executemany: bool) -> list[str]:
+    """EXPLAIN QUERY PLAN of `statement` on the connection that just ran it (no events fire)."""
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+# Like the query metrics (src/metrics.py), listening on the Engine class covers every engine
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    rate = settings.QUERY_PROFILER_SAMPLE_RATE
+    if rate > 0 and (rate >= 1 or random.random() < rate):
+        conn.info["profile_started"] = time.perf_counter()
+    else:
+        conn.info.pop("profile_started", None)  # left by a statement that raised
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("profile_started", None)
+    if started is None:
+        return
+    stats = query_profiler.record(statement, time.perf_counter() - started)
+    if stats is not None and statement.lstrip().split(None, 1)[0].upper() in EXPLAINABLE:
+        try:
+            plan = explain(conn, statement, parameters, executemany)
+        except Exception as exc:  # e.g. a temp table gone by now: the timing is still recorded
+            plan = [f"EXPLAIN failed: {exc}"]
+        stats.plan = plan
+        stats.full_scan = any(is_full_scan(detail) for detail in plan)
@@ -0,0 +1,86 @@
+from typing import Hashable, Sequence
+
+from sqlalchemy import Row, bindparam
+from sqlalchemy.dialects import sqlite
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.models.tables import Movie as MovieDB
+from src.search import match_statement
+from src.serialization import MOVIE_COLUMNS
+
+# Read path of GET /movies/{id}, GET /movies/ and GET /movies/by_category: plain column rows
+# (SQLAlchemy Row tuples, which also answer row.title) instead of ORM instances, so a read
+# builds no Movie objects, registers nothing in the session's identity map and tracks no state.
+# The SQL of each statement shape is compiled once per process and reused with new parameter
+# values; only the values change between requests. Engine events (the query metrics) still fire.
+#
+#   query = movie_page(pagination, filters)
+#   rows = fetch(session, query)        # or: await afetch(session, query)
+
+MOVIE_READ_COLUMNS = (*MOVIE_COLUMNS, MovieDB.version)
+
+_dialect = sqlite.dialect()
+# shape -> (SQL with ? placeholders, names of the parameters in placeholder order)
+_statements: dict[Hashable, tuple[str, tuple[str, ...]]] = {}
+
+
+class Query:
+    """A compiled statement and the values of its named parameters."""
+    __slots__ = ("sql", "names", "params")
+
+    def __init__(self, sql: str, names: tuple[str, ...], params: dict):
+        self.sql = sql
+        self.names = names
+        self.params = params
+
+    @property
+    def args(self) -> tuple:
+        params = self.params
+        return tuple(params[name] for name in self.names)
+
+
+def compiled(shape: Hashable, build) -> tuple[str, tuple[str, ...]]:
+    """The SQL of `shape`; build() returns its statement the first time the shape is seen."""
+    entry = _statements.get(shape)
+    if entry is None:
+        compiled_statement = build().compile(dialect=_dialect)
+        entry = _statements[shape] = (compiled_statement.string, tuple(compiled_statement.positiontup))
+    return entry
+
+
+def _select():
+    return select(*MOVIE_READ_COLUMNS)
+
+
+def movie_by_id(id: int) -> Query:
+    sql, names = compiled("movie_by_id", lambda: _select().where(MovieDB.id == bindparam("id")))
+    return Query(sql, names, {"id": id})
+
+
+def movie_page(pagination, filters) -> Query:
+    """A page of GET /movies/: PaginationParams and MovieFilterParams give the shape and the values."""
+    sql, names = compiled(
+        ("movie_page", pagination.shape(), filters.shape()),
+        lambda: pagination.apply(filters.apply(_select(), MovieDB), MovieDB),
+    )
+    return Query(sql, names, {**filters.params(), **pagination.params()})
+
+
+def movies_matching(match: str) -> Query:
+    """Every movie matching the FTS5 query `match`, by id."""
+    sql, names = compiled("movies_matching", lambda: match_statement(match, _select()).order_by(MovieDB.id))
+    return Query(sql, names, {"match": match})
+
+
+def fetch(session: Session, query: Query) -> Sequence[Row]:
+    return session.connection().exec_driver_sql(query.sql, query.args).all()
+
+
+async def afetch(session: AsyncSession, query: Query) -> Sequence[Row]:
+    conn = await session.connection()
+    return (await conn.exec_driver_sql(query.sql, query.args)).all()
+
+
+def statement_cache_size() -> int:
+    return len(_statements)
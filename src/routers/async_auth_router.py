@@ -0,0 +1,124 @@
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse
+from typing import Annotated, Literal, Union
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from functools import partial
+from src.database import async_write_queue, get_async_session
+from src.stats import check_catalog_stats
+from src.changes import compact_changes
+from src.profiler import query_profiler
+from src.jobs import JOB_TYPES, enqueue_job, job_stats, read_job
+from src.models.tables import User 
+from src.models.user_model import UserCreate
+from src.models.job_model import JobRequest
+from src.config import settings
+from src.security import (
+    verify_and_update_password_async,
+    create_access_token,
+    get_current_user_async,
+    get_current_admin_user_async,
+    get_password_hash_async,
+)
+
+# Same endpoints as auth_router, served on the event loop with an AsyncSession (DB_MODE="async")
+async_auth_router = APIRouter()
+
+@async_auth_router.post("/register", tags=['Auth'], status_code=status.HTTP_201_CREATED)
+async def register(user_data: UserCreate, session: AsyncSession = Depends(get_async_session)):
+    existing_user = (await session.exec(select(User).where(User.username == user_data.username))).first()
+    if existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username already exists"
+        )
+
+    hashed_pw = await get_password_hash_async(user_data.password)
+    new_user = User(username=user_data.username, password=hashed_pw, role=user_data.role)
+    session.add(new_user)
+    await session.commit()
+    return {"message": "User created successfully"}
+
+@async_auth_router.post("/login", tags=['Auth'])
+async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: AsyncSession = Depends(get_async_session)):
+    statement = select(User).where(User.username == form_data.username)
+    user = (await session.exec(statement)).first()
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password")
+    valid, new_hash = await verify_and_update_password_async(form_data.password, user.password)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password")
+    if new_hash:
+        user.password = new_hash
+        session.add(user)
+        await session.commit()
+    
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"username": user.username, "role": user.role},
+        expires_delta=access_token_expires
+    )
+
+    response = JSONResponse(content={"message": "Login successful"})
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        httponly=True,
+        samesite="strict"
+    )
+    return response
+
+@async_auth_router.get("/profile", tags=['Auth'])
+async def profile(my_user: Annotated[dict, Depends(get_current_user_async)]):
+    return my_user
+
+@async_auth_router.get('/dashboard', tags=['Auth'])
+async def dashboard(admin_user: Annotated[dict, Depends(get_current_admin_user_async)]):
+    return {"message": f"Welcome to the admin dashboard, {admin_user['username']}!", "user_data": admin_user}
+
+@async_auth_router.post('/dashboard/stats/check', tags=['Auth'])
+async def check_stats(admin_user: Annotated[dict, Depends(get_current_admin_user_async)], repair: bool = True, session: AsyncSession = Depends(get_async_session)):
+    """Recomputes the catalog statistics from the movie table and compares them with the summary."""
+    mismatches = await async_write_queue(session.bind).submit(partial(check_catalog_stats, repair=repair))
+    return {"consistent": not mismatches, "repaired": bool(mismatches) and repair, "mismatches": mismatches}
+
+@async_auth_router.post('/dashboard/changes/compact', tags=['Auth'])
+async def compact_change_log(admin_user: Annotated[dict, Depends(get_current_admin_user_async)], retention_seconds: Union[float, None] = Query(default=None, ge=0), session: AsyncSession = Depends(get_async_session)):
+    """Drops superseded change-log entries and tombstones past their retention."""
+    retention = settings.CHANGES_TOMBSTONE_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+    return await async_write_queue(session.bind).submit(partial(compact_changes, tombstone_retention_seconds=retention))
+
+@async_auth_router.get('/dashboard/queries', tags=['Auth'])
+async def query_profile(admin_user: Annotated[dict, Depends(get_current_admin_user_async)], limit: int = Query(default=50, gt=0, le=1000), sort: Literal["total", "max", "count"] = "total"):
+    """The sampled statements with the most time spent (or the slowest, or the most frequent) and the recent slow queries."""
+    return query_profiler.report(limit, sort)
+
+@async_auth_router.get('/dashboard/jobs', tags=['Auth'])
+async def jobs_overview(admin_user: Annotated[dict, Depends(get_current_admin_user_async)], session: AsyncSession = Depends(get_async_session)):
+    """Queue depth per job type and status, wait and run times of the latest jobs, and the most recent ones."""
+    conn = await session.connection()
+    return await conn.run_sync(job_stats)
+
+@async_auth_router.post('/dashboard/jobs', tags=['Auth'], status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(admin_user: Annotated[dict, Depends(get_current_admin_user_async)], job: JobRequest, session: AsyncSession = Depends(get_async_session)):
+    """Queues a maintenance job for the worker process and returns at once."""
+    if job.type not in JOB_TYPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown job type, expected one of {', '.join(JOB_TYPES)}")
+    return await async_write_queue(session.bind).submit(partial(
+        enqueue_job, type=job.type, payload=job.payload, delay_seconds=job.delay_seconds, dedup_key=job.dedup_key,
+    ))
+
+@async_auth_router.get('/dashboard/jobs/{id}', tags=['Auth'])
+async def get_job(admin_user: Annotated[dict, Depends(get_current_admin_user_async)], id: int, session: AsyncSession = Depends(get_async_session)):
+    conn = await session.connection()
+    job = await conn.run_sync(read_job, id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
@@ -0,0 +1,220 @@
+from src.models.movie_model import CatalogStats, ChangePage, Movie as MovieResponse, MovieBatch, MovieBatchRequest, MovieCreate, MovieUpdate
+from fastapi import Path, Query, APIRouter, HTTPException, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from functools import partial
+from typing import Union
+from sqlalchemy import insert
+from src.dependencies import BatchIdsParams, MovieFilterParams, PaginationParams, SearchParams, batch_ids
+from src.cache import (
+    CachedRoute,
+    cache_response,
+    invalidate_movie_bulk_insert,
+    invalidate_movie_write,
+    movie_batch_tags,
+    movie_category_tags,
+    movie_list_tags,
+    movie_search_tags,
+    movie_tags,
+)
+from src.bulk import BulkFormat, BulkReport, MEDIA_TYPES, aiter_export, export_filename, iter_valid_chunks, resolve_format
+from src.files import file_response
+from src.batch import batch_statements, order_batch
+from src.serialization import movie_batch_response, movie_response, movie_select, movies_response
+from src.search import build_match, search_statement
+from src.reads import afetch, movie_by_id, movie_page, movies_matching
+from src.stats import read_catalog_stats
+from src.changes import (
+    CursorTooOld,
+    arun_with_connection,
+    cursor_gone,
+    read_changes,
+    resume_cursor,
+    stream_changes,
+    stream_cursor,
+)
+from src.config import settings
+from src.similarity import notify_similarity, similarity_store
+from src.catalog import aupdate_catalog, catalog_store
+from src.jobs import aenqueue
+from src.database import async_write_queue, get_async_session
+from src import writes
+from src.versioning import if_match_versions, movie_etag, precondition_failed
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.models.tables import Movie as MovieDB
+
+# Same endpoints as movie_router, served on the event loop with an AsyncSession (DB_MODE="async")
+async_movie_router = APIRouter(route_class=CachedRoute)
+
+@async_movie_router.get('/get_file', tags=['Files'])
+async def get_file(request: Request) -> Response:
+    # stat() and the first hash of the file are blocking
+    return await run_in_threadpool(file_response, request, 'files/sample.pdf')
+
+@async_movie_router.get('/export', tags=['Movies'], response_description="The whole catalog as NDJSON or CSV")
+async def export_movies(format: BulkFormat = "ndjson", session: AsyncSession = Depends(get_async_session)) -> StreamingResponse:
+    return StreamingResponse(
+        aiter_export(session.bind, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": export_filename(format)},
+    )
+
+@async_movie_router.post('/bulk', tags=['Movies'], response_description="Import report with the rows that failed validation")
+async def bulk_import(request: Request, format: Union[BulkFormat, None] = None, session: AsyncSession = Depends(get_async_session)) -> dict:
+    report = BulkReport()
+    async for chunk in iter_valid_chunks(request, resolve_format(format, request.headers.get("content-type")), report):
+        await session.exec(insert(MovieDB), params=chunk)
+        await session.commit()
+        report.inserted += len(chunk)
+    if report.inserted:
+        invalidate_movie_bulk_insert()
+        notify_similarity(session.bind)
+        await aupdate_catalog(session)
+        await aenqueue(session.bind, "optimize", dedup_key="optimize")
+    return report.as_dict()
+
+@async_movie_router.get('/search', tags=['Movies'], response_description="Movies matching the search, best match first")
+@cache_response(tags=movie_search_tags)
+async def search_movies(request: Request, response: Response, search: SearchParams = Depends(), session: AsyncSession = Depends(get_async_session)) -> list[MovieResponse]:
+    match = build_match(search.q)
+    if match is None:
+        return []
+    statement = search_statement(match, limit=search.size, offset=search.offset, statement=movie_select())
+    return movies_response((await session.exec(statement)).all(), response, request)
+
+@async_movie_router.get('/by_category', tags=['Movies'], response_description="Movies filtered by category")
+@cache_response(tags=movie_category_tags)
+async def get_movie_by_category(request: Request, response: Response, category:str = Query(min_length=3,max_length=20), session: AsyncSession = Depends(get_async_session)) -> list[MovieResponse]:
+    # Prefix match on the category column of the full-text index instead of a '%x%' table scan
+    if settings.CATALOG_SNAPSHOT:
+        store = catalog_store(session.bind)
+        await store.afollow(session)
+        results = store.matching_category(category)
+    else:
+        match = build_match(category, column="category")
+        results = await afetch(session, movies_matching(match)) if match else []
+    if not results: 
+        raise HTTPException(status_code=404, detail="Movie Category not found")
+    return movies_response(results, response, request)
+
+@async_movie_router.get('/stats', tags=['Movies'], response_description="Counts, average ratings and year histogram")
+async def get_catalog_stats(category: Union[str, None] = Query(default=None, min_length=1, max_length=40), session: AsyncSession = Depends(get_async_session)) -> CatalogStats:
+    conn = await session.connection()
+    stats = await conn.run_sync(read_catalog_stats, category)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Movie Category not found")
+    return stats
+
+@async_movie_router.get('/changes', tags=['Movies'], response_description="Changes after the cursor, oldest first")
+async def get_movie_changes(since: int = Query(default=0, ge=0, description="next_cursor of the previous page; 0 for a full snapshot"), limit: int = Query(default=100, gt=0, le=1000), session: AsyncSession = Depends(get_async_session)) -> ChangePage:
+    conn = await session.connection()
+    try:
+        return await conn.run_sync(read_changes, since, limit)
+    except CursorTooOld as exc:
+        raise cursor_gone(exc)
+
+@async_movie_router.get('/changes/stream', tags=['Movies'], response_description="Server-Sent Events of the change log")
+async def stream_movie_changes(request: Request, since: Union[int, None] = Query(default=None, ge=0, description="Start after this cursor; default: only new changes"), max_seconds: Union[float, None] = Query(default=None, gt=0, description="End the stream sooner than CHANGES_STREAM_MAX_SECONDS"), session: AsyncSession = Depends(get_async_session)) -> StreamingResponse:
+    bind = session.bind
+    try:
+        start = await arun_with_connection(bind, stream_cursor, resume_cursor(request.headers.get("last-event-id"), since))
+    except CursorTooOld as exc:
+        raise cursor_gone(exc)
+    read_page = partial(arun_with_connection, bind, read_changes)
+    duration = min(max_seconds or settings.CHANGES_STREAM_MAX_SECONDS, settings.CHANGES_STREAM_MAX_SECONDS)
+    events = stream_changes(read_page, start, request.is_disconnected, duration)
+    # X-Accel-Buffering: nginx would otherwise hold the events back in its proxy buffer
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def _movies_batch(session: AsyncSession, ids: list[int], response: Union[Response, None] = None, request: Union[Request, None] = None):
+    # One primary-key IN query per chunk of ids instead of one request and query per movie
+    rows = []
+    for statement in batch_statements(ids, movie_select()):
+        rows.extend((await session.exec(statement)).all())
+    return movie_batch_response(*order_batch(ids, rows), response, request)
+
+@async_movie_router.get('/batch', tags=['Movies'], response_description="Movies by id in the requested order, and the ids not found")
+@cache_response(tags=movie_batch_tags)
+async def get_movies_batch(request: Request, response: Response, batch: BatchIdsParams = Depends(), session: AsyncSession = Depends(get_async_session)) -> MovieBatch:
+    return await _movies_batch(session, batch.ids, response, request)
+
+@async_movie_router.post('/batch', tags=['Movies'], response_description="Movies by id in the requested order, and the ids not found")
+async def post_movies_batch(body: MovieBatchRequest, session: AsyncSession = Depends(get_async_session)) -> MovieBatch:
+    # Same as GET /batch for id lists too long for a URL
+    return await _movies_batch(session, batch_ids(body.ids))
+
+@async_movie_router.get('/{id}', tags=['Movies'])
+@cache_response(tags=movie_tags)
+async def get_movie(request: Request, response: Response, id:int = Path(gt=0), session: AsyncSession = Depends(get_async_session)) -> MovieResponse:
+    movie = next(iter(await afetch(session, movie_by_id(id))), None)
+    if not movie:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return movie_response(movie, response, request)
+
+@async_movie_router.get('/{id}/similar', tags=['Movies'], response_description="Movies with the most similar title, overview and category, best first")
+async def get_similar_movies(request: Request, response: Response, id: int = Path(gt=0), limit: int = Query(default=10, gt=0, le=100), session: AsyncSession = Depends(get_async_session)) -> list[MovieResponse]:
+    store = similarity_store(session.bind)
+    await store.acatch_up(session.bind)
+    ids = [id, *store.similar(id, limit)]
+    rows = []
+    for statement in batch_statements(ids, movie_select()):
+        rows.extend((await session.exec(statement)).all())
+    found, missing = order_batch(ids, rows)
+    if id in missing:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return movies_response(found[1:], response, request)
+
+@async_movie_router.get('/', tags=['Movies'], response_description="List all movies")
+@cache_response(tags=movie_list_tags)
+async def get_all_movies(request: Request, response: Response, pagination: PaginationParams = Depends(), filters: MovieFilterParams = Depends(), session: AsyncSession = Depends(get_async_session)) -> list[MovieResponse]:
+    if settings.CATALOG_SNAPSHOT:
+        store = catalog_store(session.bind)
+        await store.afollow(session)
+        movies = store.page(pagination, filters)
+    else:
+        movies = await afetch(session, movie_page(pagination, filters))
+    next_cursor = pagination.next_cursor(movies)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return movies_response(movies, response, request)
+
+@async_movie_router.post('/', tags=['Movies'], response_model=MovieResponse, status_code=status.HTTP_201_CREATED, response_description="Add a movie")
+async def create_movie(movie: MovieCreate, response: Response, session: AsyncSession = Depends(get_async_session)) -> MovieResponse:
+    new_movie = await async_write_queue(session.bind).submit(partial(writes.insert_movie, values=movie.model_dump()))
+    invalidate_movie_write(None, new_movie)
+    notify_similarity(session.bind)
+    await aupdate_catalog(session)
+    response.headers["ETag"] = movie_etag(new_movie["id"], new_movie["version"])
+    return new_movie
+
+@async_movie_router.put('/{id}', tags=['Movies'])
+async def update_movie(id: int, movie: MovieUpdate, request: Request, response: Response, session: AsyncSession = Depends(get_async_session)) -> MovieResponse:
+    movie_data = movie.model_dump(exclude_unset=True)
+    # If-Match: only update the version the client last read (optimistic concurrency)
+    op = partial(writes.update_movie, id=id, values=movie_data, versions=if_match_versions(request, id))
+    try:
+        updated = await async_write_queue(session.bind).submit(op)
+    except writes.VersionConflict as conflict:
+        raise precondition_failed(conflict.current)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    before, after = updated
+    invalidate_movie_write(before, after)
+    notify_similarity(session.bind)
+    await aupdate_catalog(session)
+    response.headers["ETag"] = movie_etag(after["id"], after["version"])
+    return after
+
+@async_movie_router.delete('/{id}', tags=['Movies'], status_code=status.HTTP_200_OK)
+async def delete_movie(id: int, request: Request, session: AsyncSession = Depends(get_async_session)) -> dict:
+    op = partial(writes.delete_movie, id=id, versions=if_match_versions(request, id))
+    try:
+        before = await async_write_queue(session.bind).submit(op)
+    except writes.VersionConflict as conflict:
+        raise precondition_failed(conflict.current)
+    if before is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    invalidate_movie_write(before, None)
+    notify_similarity(session.bind)
+    await aupdate_catalog(session)
+    return {"message": "Movie deleted successfully"}
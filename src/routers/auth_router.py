@@ -1,15 +1,21 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.responses import JSONResponse
-from typing import Annotated
+from typing import Annotated, Literal, Union
 from sqlmodel import Session, select
-from src.database import get_session
+from functools import partial
+from src.database import get_session, write_queue
+from src.stats import check_catalog_stats
+from src.changes import compact_changes
+from src.profiler import query_profiler
+from src.jobs import JOB_TYPES, enqueue_job, job_stats, read_job
 from src.models.tables import User 
 from src.models.user_model import UserCreate
+from src.models.job_model import JobRequest
 from src.config import settings
 from src.security import (
-    verify_password,
+    verify_and_update_password,
     create_access_token,
     get_current_user,
     get_current_admin_user,
@@ -39,10 +45,20 @@ def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: S
     statement = select(User).where(User.username == form_data.username)
     user = session.exec(statement).first()
 
-    if not user or not verify_password(form_data.password, user.password):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password")
+    valid, new_hash = verify_and_update_password(form_data.password, user.password)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password")
+    if new_hash:
+        # Stored hash used older argon2 parameters: upgrade it transparently
+        user.password = new_hash
+        session.add(user)
+        session.commit()
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -65,4 +81,43 @@ def profile(my_user: Annotated[dict, Depends(get_current_user)]):
 
 @auth_router.get('/dashboard', tags=['Auth'])
 def dashboard(admin_user: Annotated[dict, Depends(get_current_admin_user)]):
-    return {"message": f"Welcome to the admin dashboard, {admin_user['username']}!", "user_data": admin_user}
\ No newline at end of file
+    return {"message": f"Welcome to the admin dashboard, {admin_user['username']}!", "user_data": admin_user}
+
+@auth_router.post('/dashboard/stats/check', tags=['Auth'])
+def check_stats(admin_user: Annotated[dict, Depends(get_current_admin_user)], repair: bool = True, session: Session = Depends(get_session)):
+    """Recomputes the catalog statistics from the movie table and compares them with the summary."""
+    # Through the writer: the scan sees no concurrent write and a repair commits atomically
+    mismatches = write_queue(session.get_bind()).submit(partial(check_catalog_stats, repair=repair)).result()
+    return {"consistent": not mismatches, "repaired": bool(mismatches) and repair, "mismatches": mismatches}
+
+@auth_router.post('/dashboard/changes/compact', tags=['Auth'])
+def compact_change_log(admin_user: Annotated[dict, Depends(get_current_admin_user)], retention_seconds: Union[float, None] = Query(default=None, ge=0), session: Session = Depends(get_session)):
+    """Drops superseded change-log entries and tombstones past their retention."""
+    retention = settings.CHANGES_TOMBSTONE_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+    return write_queue(session.get_bind()).submit(partial(compact_changes, tombstone_retention_seconds=retention)).result()
+
+@auth_router.get('/dashboard/queries', tags=['Auth'])
+def query_profile(admin_user: Annotated[dict, Depends(get_current_admin_user)], limit: int = Query(default=50, gt=0, le=1000), sort: Literal["total", "max", "count"] = "total"):
+    """The sampled statements with the most time spent (or the slowest, or the most frequent) and the recent slow queries."""
+    return query_profiler.report(limit, sort)
+
+@auth_router.get('/dashboard/jobs', tags=['Auth'])
+def jobs_overview(admin_user: Annotated[dict, Depends(get_current_admin_user)], session: Session = Depends(get_session)):
+    """Queue depth per job type and status, wait and run times of the latest jobs, and the most recent ones."""
+    return job_stats(session.connection())
+
+@auth_router.post('/dashboard/jobs', tags=['Auth'], status_code=status.HTTP_202_ACCEPTED)
+def submit_job(admin_user: Annotated[dict, Depends(get_current_admin_user)], job: JobRequest, session: Session = Depends(get_session)):
+    """Queues a maintenance job for the worker process and returns at once."""
+    if job.type not in JOB_TYPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown job type, expected one of {', '.join(JOB_TYPES)}")
+    return write_queue(session.get_bind()).submit(partial(
+        enqueue_job, type=job.type, payload=job.payload, delay_seconds=job.delay_seconds, dedup_key=job.dedup_key,
+    )).result()
+
+@auth_router.get('/dashboard/jobs/{id}', tags=['Auth'])
+def get_job(admin_user: Annotated[dict, Depends(get_current_admin_user)], id: int, session: Session = Depends(get_session)):
+    job = read_job(session.connection(), id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
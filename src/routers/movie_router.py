@@ -1,69 +1,227 @@
-from src.models.movie_model import Movie as MovieResponse, MovieCreate, MovieUpdate
-from fastapi import Path, Query, APIRouter, HTTPException, Depends, status
-from fastapi.responses import FileResponse, JSONResponse, Response
-from src.dependencies import PaginationParams
-from src.database import get_session
-from sqlmodel import Session, select
+from src.models.movie_model import CatalogStats, ChangePage, Movie as MovieResponse, MovieBatch, MovieBatchRequest, MovieCreate, MovieUpdate
+from fastapi import Path, Query, APIRouter, HTTPException, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from functools import partial
+from typing import Union
+from sqlalchemy import insert
+from src.dependencies import BatchIdsParams, MovieFilterParams, PaginationParams, SearchParams, batch_ids
+from src.cache import (
+    CachedRoute,
+    cache_response,
+    invalidate_movie_bulk_insert,
+    invalidate_movie_write,
+    movie_batch_tags,
+    movie_category_tags,
+    movie_list_tags,
+    movie_search_tags,
+    movie_tags,
+)
+from src.bulk import BulkFormat, BulkReport, MEDIA_TYPES, export_filename, iter_export, iter_valid_chunks, resolve_format
+from src.files import file_response
+from src.batch import batch_statements, order_batch
+from src.serialization import movie_batch_response, movie_response, movie_select, movies_response
+from src.search import build_match, search_statement
+from src.reads import fetch, movie_by_id, movie_page, movies_matching
+from src.stats import read_catalog_stats
+from src.changes import (
+    CursorTooOld,
+    run_with_connection,
+    cursor_gone,
+    read_changes,
+    resume_cursor,
+    stream_changes,
+    stream_cursor,
+)
+from src.config import settings
+from src.similarity import notify_similarity, similarity_store
+from src.catalog import catalog_store, update_catalog
+from src.jobs import enqueue
+from src.database import get_session, write_queue
+from src import writes
+from src.versioning import if_match_versions, movie_etag, precondition_failed
+from sqlmodel import Session
 from src.models.tables import Movie as MovieDB
 
-movie_router = APIRouter()
+movie_router = APIRouter(route_class=CachedRoute)
 
 @movie_router.get('/get_file', tags=['Files'])
-def get_file():
-    return FileResponse('files/sample.pdf')
+def get_file(request: Request) -> Response:
+    # ETag/Last-Modified, 304 and Range requests (resumable PDF downloads)
+    return file_response(request, 'files/sample.pdf')
+
+@movie_router.get('/export', tags=['Movies'], response_description="The whole catalog as NDJSON or CSV")
+def export_movies(format: BulkFormat = "ndjson", session: Session = Depends(get_session)) -> StreamingResponse:
+    return StreamingResponse(
+        iter_export(session.get_bind(), format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": export_filename(format)},
+    )
+
+def _insert_chunk(session: Session, rows: list[dict]):
+    # A list of parameter sets runs as one executemany inside one transaction
+    session.exec(insert(MovieDB), params=rows)
+    session.commit()
+
+@movie_router.post('/bulk', tags=['Movies'], response_description="Import report with the rows that failed validation")
+async def bulk_import(request: Request, format: Union[BulkFormat, None] = None, session: Session = Depends(get_session)) -> dict:
+    # async so the body can be read as a stream; the blocking inserts go to the threadpool
+    report = BulkReport()
+    async for chunk in iter_valid_chunks(request, resolve_format(format, request.headers.get("content-type")), report):
+        await run_in_threadpool(_insert_chunk, session, chunk)
+        report.inserted += len(chunk)
+    if report.inserted:
+        invalidate_movie_bulk_insert()
+        notify_similarity(session.get_bind())
+        await run_in_threadpool(update_catalog, session.get_bind(), session.connection())
+        # Fresh planner statistics and merged search segments, once the import is done
+        await run_in_threadpool(enqueue, session.get_bind(), "optimize", dedup_key="optimize")
+    return report.as_dict()
+
+@movie_router.get('/search', tags=['Movies'], response_description="Movies matching the search, best match first")
+@cache_response(tags=movie_search_tags)
+def search_movies(request: Request, response: Response, search: SearchParams = Depends(), session: Session = Depends(get_session)) -> list[MovieResponse]:
+    match = build_match(search.q)
+    if match is None:
+        return []
+    statement = search_statement(match, limit=search.size, offset=search.offset, statement=movie_select())
+    return movies_response(session.exec(statement).all(), response, request)
 
 @movie_router.get('/by_category', tags=['Movies'], response_description="Movies filtered by category")
-def get_movie_by_category(category:str = Query(min_length=3,max_length=20), session: Session = Depends(get_session)) -> list[MovieResponse]:
-    statement = select(MovieDB).where(MovieDB.category.ilike(f"%{category}%"))
-    results = session.exec(statement).all()
+@cache_response(tags=movie_category_tags)
+def get_movie_by_category(request: Request, response: Response, category:str = Query(min_length=3,max_length=20), session: Session = Depends(get_session)) -> list[MovieResponse]:
+    # Prefix match on the category column of the full-text index instead of a '%x%' table scan
+    if settings.CATALOG_SNAPSHOT:
+        store = catalog_store(session.get_bind())
+        store.follow(session)
+        results = store.matching_category(category)
+    else:
+        match = build_match(category, column="category")
+        results = fetch(session, movies_matching(match)) if match else []
     if not results: 
         raise HTTPException(status_code=404, detail="Movie Category not found")
-    return results
+    return movies_response(results, response, request)
+
+@movie_router.get('/stats', tags=['Movies'], response_description="Counts, average ratings and year histogram")
+def get_catalog_stats(category: Union[str, None] = Query(default=None, min_length=1, max_length=40), session: Session = Depends(get_session)) -> CatalogStats:
+    # Read from the trigger-maintained summary tables: O(categories + years), no scan of movie
+    stats = read_catalog_stats(session.connection(), category)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Movie Category not found")
+    return stats
+
+@movie_router.get('/changes', tags=['Movies'], response_description="Changes after the cursor, oldest first")
+def get_movie_changes(since: int = Query(default=0, ge=0, description="next_cursor of the previous page; 0 for a full snapshot"), limit: int = Query(default=100, gt=0, le=1000), session: Session = Depends(get_session)) -> ChangePage:
+    try:
+        return read_changes(session.connection(), since, limit)
+    except CursorTooOld as exc:
+        raise cursor_gone(exc)
+
+@movie_router.get('/changes/stream', tags=['Movies'], response_description="Server-Sent Events of the change log")
+async def stream_movie_changes(request: Request, since: Union[int, None] = Query(default=None, ge=0, description="Start after this cursor; default: only new changes"), max_seconds: Union[float, None] = Query(default=None, gt=0, description="End the stream sooner than CHANGES_STREAM_MAX_SECONDS"), session: Session = Depends(get_session)) -> StreamingResponse:
+    # The stream outlives the request's session: every poll reads on a connection of its own
+    bind = session.get_bind()
+    try:
+        start = await run_in_threadpool(run_with_connection, bind, stream_cursor, resume_cursor(request.headers.get("last-event-id"), since))
+    except CursorTooOld as exc:
+        raise cursor_gone(exc)
+    read_page = partial(run_in_threadpool, run_with_connection, bind, read_changes)
+    duration = min(max_seconds or settings.CHANGES_STREAM_MAX_SECONDS, settings.CHANGES_STREAM_MAX_SECONDS)
+    events = stream_changes(read_page, start, request.is_disconnected, duration)
+    # X-Accel-Buffering: nginx would otherwise hold the events back in its proxy buffer
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _movies_batch(session: Session, ids: list[int], response: Union[Response, None] = None, request: Union[Request, None] = None):
+    # One primary-key IN query per chunk of ids instead of one request and query per movie
+    rows = []
+    for statement in batch_statements(ids, movie_select()):
+        rows.extend(session.exec(statement).all())
+    return movie_batch_response(*order_batch(ids, rows), response, request)
+
+@movie_router.get('/batch', tags=['Movies'], response_description="Movies by id in the requested order, and the ids not found")
+@cache_response(tags=movie_batch_tags)
+def get_movies_batch(request: Request, response: Response, batch: BatchIdsParams = Depends(), session: Session = Depends(get_session)) -> MovieBatch:
+    return _movies_batch(session, batch.ids, response, request)
+
+@movie_router.post('/batch', tags=['Movies'], response_description="Movies by id in the requested order, and the ids not found")
+def post_movies_batch(body: MovieBatchRequest, session: Session = Depends(get_session)) -> MovieBatch:
+    # Same as GET /batch for id lists too long for a URL
+    return _movies_batch(session, batch_ids(body.ids))
 
 @movie_router.get('/{id}', tags=['Movies'])
-def get_movie(id:int = Path(gt=0), session: Session = Depends(get_session)) -> MovieResponse:
-    movie = session.get(MovieDB, id)
+@cache_response(tags=movie_tags)
+def get_movie(request: Request, response: Response, id:int = Path(gt=0), session: Session = Depends(get_session)) -> MovieResponse:
+    movie = next(iter(fetch(session, movie_by_id(id))), None)
     if not movie:
         raise HTTPException(status_code=404, detail="Movie not found")
-    return movie
+    return movie_response(movie, response, request)
+
+@movie_router.get('/{id}/similar', tags=['Movies'], response_description="Movies with the most similar title, overview and category, best first")
+def get_similar_movies(request: Request, response: Response, id: int = Path(gt=0), limit: int = Query(default=10, gt=0, le=100), session: Session = Depends(get_session)) -> list[MovieResponse]:
+    # Precomputed neighbours: one row of the index, then one primary-key query for the movies
+    store = similarity_store(session.get_bind())
+    store.catch_up(session.connection())
+    ids = [id, *store.similar(id, limit)]
+    rows = []
+    for statement in batch_statements(ids, movie_select()):
+        rows.extend(session.exec(statement).all())
+    found, missing = order_batch(ids, rows)
+    if id in missing:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return movies_response(found[1:], response, request)
 
 @movie_router.get('/', tags=['Movies'], response_description="List all movies")
-def get_all_movies(pagination: PaginationParams = Depends(), session: Session = Depends(get_session)) -> list[MovieResponse]:
-    statement = select(MovieDB).offset(pagination.offset).limit(pagination.size)
-    movies = session.exec(statement).all()
-    return movies
+@cache_response(tags=movie_list_tags)
+def get_all_movies(request: Request, response: Response, pagination: PaginationParams = Depends(), filters: MovieFilterParams = Depends(), session: Session = Depends(get_session)) -> list[MovieResponse]:
+    if settings.CATALOG_SNAPSHOT:
+        store = catalog_store(session.get_bind())
+        store.follow(session)
+        movies = store.page(pagination, filters)
+    else:
+        movies = fetch(session, movie_page(pagination, filters))
+    next_cursor = pagination.next_cursor(movies)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return movies_response(movies, response, request)
 
 @movie_router.post('/', tags=['Movies'], response_model=MovieResponse, status_code=status.HTTP_201_CREATED, response_description="Add a movie")
-def create_movie(movie: MovieCreate, session: Session = Depends(get_session)) -> MovieResponse:
-    # Convert the Pydantic input model to a dictionary
-    movie_data = movie.model_dump()
-    new_movie = MovieDB(**movie_data)
-    session.add(new_movie)
-    session.commit()
-    session.refresh(new_movie)
+def create_movie(movie: MovieCreate, response: Response, session: Session = Depends(get_session)) -> MovieResponse:
+    # Group commit: the insert shares a transaction with the writes queued around it
+    new_movie = write_queue(session.get_bind()).submit(partial(writes.insert_movie, values=movie.model_dump())).result()
+    invalidate_movie_write(None, new_movie)
+    notify_similarity(session.get_bind())
+    update_catalog(session.get_bind(), session.connection())
+    response.headers["ETag"] = movie_etag(new_movie["id"], new_movie["version"])
     return new_movie
 
 @movie_router.put('/{id}', tags=['Movies'])
-def update_movie(id: int, movie: MovieUpdate, session: Session = Depends(get_session)) -> MovieResponse:
-    db_movie = session.get(MovieDB, id)
-    if not db_movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    
+def update_movie(id: int, movie: MovieUpdate, request: Request, response: Response, session: Session = Depends(get_session)) -> MovieResponse:
     movie_data = movie.model_dump(exclude_unset=True)
-    for key, value in movie_data.items():
-        setattr(db_movie, key, value)
-    
-    session.add(db_movie)
-    session.commit()
-    session.refresh(db_movie)
-    
-    return db_movie
+    # If-Match: only update the version the client last read (optimistic concurrency)
+    op = partial(writes.update_movie, id=id, values=movie_data, versions=if_match_versions(request, id))
+    try:
+        updated = write_queue(session.get_bind()).submit(op).result()
+    except writes.VersionConflict as conflict:
+        raise precondition_failed(conflict.current)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    before, after = updated
+    invalidate_movie_write(before, after)
+    notify_similarity(session.get_bind())
+    update_catalog(session.get_bind(), session.connection())
+    response.headers["ETag"] = movie_etag(after["id"], after["version"])
+    return after
 
 @movie_router.delete('/{id}', tags=['Movies'], status_code=status.HTTP_200_OK)
-def delete_movie(id: int, session: Session = Depends(get_session)) -> dict:
-    movie = session.get(MovieDB, id)
-    if not movie:
+def delete_movie(id: int, request: Request, session: Session = Depends(get_session)) -> dict:
+    op = partial(writes.delete_movie, id=id, versions=if_match_versions(request, id))
+    try:
+        before = write_queue(session.get_bind()).submit(op).result()
+    except writes.VersionConflict as conflict:
+        raise precondition_failed(conflict.current)
+    if before is None:
         raise HTTPException(status_code=404, detail="Movie not found")
-    session.delete(movie)
-    session.commit()
-    return {"message": "Movie deleted successfully"}
\ No newline at end of file
+    invalidate_movie_write(before, None)
+    notify_similarity(session.get_bind())
+    update_catalog(session.get_bind(), session.connection())
+    return {"message": "Movie deleted successfully"}
@@ -0,0 +1,87 @@
+import re
+import unicodedata
+from typing import Union
+from sqlalchemy import DDL, Connection, column, event, inspect, table, text
+from sqlmodel import select
+from src.models.tables import Movie
+
+# FTS5 index over the text columns of `movie`. It is an external-content table: it stores only
+# the inverted index and reads the documents back from `movie` by rowid (= movie.id).
+FTS_TABLE = "movie_fts"
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, overview, category,
+        content='movie', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    # Triggers keep the index in sync with every write path (ORM, bulk inserts, raw SQL)
+    f"""CREATE TRIGGER IF NOT EXISTS movie_fts_ai AFTER INSERT ON movie BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, overview, category) VALUES (new.id, new.title, new.overview, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS movie_fts_ad AFTER DELETE ON movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, overview, category) VALUES ('delete', old.id, old.title, old.overview, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS movie_fts_au AFTER UPDATE OF title, overview, category ON movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, overview, category) VALUES ('delete', old.id, old.title, old.overview, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, title, overview, category) VALUES (new.id, new.title, new.overview, new.category);
+    END""",
+]
+
+for statement in FTS_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement))
+
+fts_table = table(FTS_TABLE, column("rowid"))
+
+# bm25 column weights (title, overview, category): a hit in the title ranks above one in the overview
+BM25_RANK = text(f"bm25({FTS_TABLE}, 10.0, 1.0, 5.0)")
+
+
+def ensure_search_index(conn: Connection):
+    """
+    Creates the index and triggers on a database whose `movie` table predates them,
+    and fills the index from the existing rows.
+    """
+    is_new = not inspect(conn).has_table(FTS_TABLE)
+    for statement in FTS_DDL:
+        conn.exec_driver_sql(statement)
+    if is_new:
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fold(text: str) -> str:
+    """Lower case without diacritics, like the unicode61 tokenizer of the index."""
+    return "".join(char for char in unicodedata.normalize("NFKD", text.casefold()) if not unicodedata.combining(char))
+
+
+def search_terms(text: str) -> list[str]:
+    """The words of `text` as the index compares them: "Acción" and "accion" are the same term."""
+    return [fold(term) for term in re.findall(r"\w+", text)]
+
+
+def build_match(query: str, column: Union[str, None] = None) -> Union[str, None]:
+    """
+    Turns free user text into an FTS5 query: every word becomes a quoted prefix term
+    (so "adv" matches "Adventure") and all of them must match.
+    Returns None when the text has no searchable words.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    match = " ".join(f'"{term}"*' for term in terms)
+    return f"{column} : ({match})" if column else match
+
+
+def match_statement(match: str, statement=None):
+    """`statement` (default select(Movie)) restricted to the rows matching the FTS5 query `match`."""
+    statement = select(Movie) if statement is None else statement
+    return (
+        statement
+        .join(fts_table, fts_table.c.rowid == Movie.id)
+        .where(text(f"{FTS_TABLE} MATCH :match").bindparams(match=match))
+    )
+
+
+def search_statement(match: str, limit: int, offset: int = 0, statement=None):
+    """Page of the rows matching `match`, best bm25 score first."""
+    return match_statement(match, statement).order_by(BM25_RANK, Movie.id).offset(offset).limit(limit)
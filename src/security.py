@@ -1,32 +1,53 @@
+import asyncio
 import hashlib
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, Union
 
 from fastapi import Depends, HTTPException, status, Cookie
-from jose import jwt
-from passlib.context import CryptContext
+from sqlalchemy import event
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.database import get_session
+from src.cache import BoundedTTLMap
+from src.hashing import argon2_params, hash_secret, hashing_pool, verify_secret
+from src.database import get_session, get_async_session
 from src.models.tables import User
 from src.config import settings
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# token -> username, for tokens whose signature was already verified (entry expires with the JWT)
+verified_tokens = BoundedTTLMap(max_entries=settings.TOKEN_CACHE_MAX_ENTRIES)
+# username -> principal dict (user without password)
+cached_users = BoundedTTLMap(max_entries=settings.USER_CACHE_MAX_ENTRIES)
+
+def _prehash(password: str) -> str:
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
 
 def get_password_hash(password: str) -> str:
     """
-    Hashes a password first with SHA-256 and then with bcrypt.
-    This avoids bcrypt's 72-byte limit by always hashing a 64-character hex string.
+    Hashes a password first with SHA-256 and then with argon2 (in the hashing process pool).
+    The pre-hash keeps the argon2 input a fixed 64-character hex string.
+    Raises 503 when the hashing pool is saturated.
     """
-    sha256_hex = hashlib.sha256(password.encode("utf-8")).hexdigest()
-    return pwd_context.hash(sha256_hex)
+    return hashing_pool.submit(hash_secret, _prehash(password), argon2_params()).result()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Union[str, None]]:
     """
-    Verifies a password by applying the same SHA-256 + bcrypt logic.
+    Verifies a password by applying the same SHA-256 + argon2 logic.
+    Also returns a new hash when the stored one was made with outdated argon2 parameters.
     """
-    sha256_hex = hashlib.sha256(plain_password.encode("utf-8")).hexdigest()
-    return pwd_context.verify(sha256_hex, hashed_password)
+    return hashing_pool.submit(verify_secret, _prehash(plain_password), hashed_password, argon2_params()).result()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+async def get_password_hash_async(password: str) -> str:
+    return await asyncio.wrap_future(hashing_pool.submit(hash_secret, _prehash(password), argon2_params()))
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, Union[str, None]]:
+    return await asyncio.wrap_future(
+        hashing_pool.submit(verify_secret, _prehash(plain_password), hashed_password, argon2_params())
+    )
 
 # JWT Token
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None):
@@ -36,33 +57,79 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt  # imported on first use: python-jose and its crypto backends cost ~30 ms at startup
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def decode_token(token: str, session: Session) -> dict:
+def decode_username(token: str) -> str:
+    """Verifies the JWT and returns the username it was issued for."""
+    username = verified_tokens.get(token)
+    if username is not None:
+        return username
+    from jose import jwt
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: Union[str, None] = payload.get("username")
-        if username is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        
-        user = session.exec(select(User).where(User.username == username)).first()
-        if user is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
-        
-        user_data = user.model_dump()
-        user_data.pop("password", None)
-        return user_data
     except jwt.JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    username: Union[str, None] = payload.get("username")
+    if username is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    verified_tokens.set(token, username, expires_at=payload["exp"])
+    return username
+
+def user_to_principal(user: Union[User, None]) -> dict:
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+    user_data = user.model_dump()
+    user_data.pop("password", None)
+    cached_users.set(user.username, user_data, expires_at=time.time() + settings.USER_CACHE_TTL_SECONDS)
+    return dict(user_data)
+
+def decode_token(token: str, session: Session) -> dict:
+    username = decode_username(token)
+    principal = cached_users.get(username)
+    if principal is not None:
+        return dict(principal)
+    user = session.exec(select(User).where(User.username == username)).first()
+    return user_to_principal(user)
+
+async def decode_token_async(token: str, session: AsyncSession) -> dict:
+    username = decode_username(token)
+    principal = cached_users.get(username)
+    if principal is not None:
+        return dict(principal)
+    user = (await session.exec(select(User).where(User.username == username))).first()
+    return user_to_principal(user)
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _forget_cached_user(mapper, connection, user: User):
+    """Any ORM write to a user drops its cached principal (role changes apply on the next request)."""
+    cached_users.pop(user.username)
+
+def clear_auth_caches():
+    verified_tokens.clear()
+    cached_users.clear()
 
 def get_current_user(access_token: Annotated[Union[str, None], Cookie()] = None, session: Session = Depends(get_session)) -> dict:
     if access_token is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     return decode_token(access_token, session)
 
+async def get_current_user_async(access_token: Annotated[Union[str, None], Cookie()] = None, session: AsyncSession = Depends(get_async_session)) -> dict:
+    if access_token is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return await decode_token_async(access_token, session)
+
 def get_current_admin_user(current_user: Annotated[dict, Depends(get_current_user)]):
     """Depends to verify if the user is an administrador."""
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
-    return current_user
\ No newline at end of file
+    return current_user
+
+async def get_current_admin_user_async(current_user: Annotated[dict, Depends(get_current_user_async)]):
+    """Async twin of get_current_admin_user for DB_MODE="async"."""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return current_user
@@ -0,0 +1,89 @@
+from typing import Sequence, Union
+
+import orjson
+from fastapi.requests import Request
+from fastapi.responses import Response
+from sqlmodel import select
+
+from src.config import settings
+from src.models.movie_model import Movie as MovieResponse
+from src.models.tables import Movie as MovieDB
+from src.versioning import is_fresh, list_etag, movie_etag
+
+# Fast JSON path (FAST_JSON=true): read endpoints select plain column tuples in the field order
+# of the response model and dump them straight to bytes with orjson, skipping the ORM instance,
+# the Pydantic re-validation, jsonable_encoder and json.dumps of the default path.
+# Given the request, the *_response helpers also send the ETag of the rows (src/versioning.py)
+# and turn a matching If-None-Match into a 304 before anything is serialized.
+
+MOVIE_FIELDS = tuple(MovieResponse.model_fields)
+MOVIE_COLUMNS = tuple(getattr(MovieDB, name) for name in MOVIE_FIELDS)
+
+
+class RawJSONResponse(Response):
+    """Response whose content is already serialized JSON."""
+    media_type = "application/json"
+
+
+def movie_select():
+    """select() for the movie read endpoints: column rows on the fast path, ORM objects otherwise."""
+    # version comes after the response fields, which zip() in the dumps below stops at
+    return select(*MOVIE_COLUMNS, MovieDB.version) if settings.FAST_JSON else select(MovieDB)
+
+
+def movie_to_json(row) -> bytes:
+    return orjson.dumps(dict(zip(MOVIE_FIELDS, row)))
+
+
+def movies_to_json(rows: Sequence) -> bytes:
+    fields = MOVIE_FIELDS
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+
+def _not_modified(etag: Union[str, None], request: Union[Request, None], response: Union[Response, None]) -> Union[Response, None]:
+    """Sets the ETag on `response`; returns the 304 to send instead when the client is fresh."""
+    if etag is None:
+        return None
+    if response is not None:
+        response.headers["ETag"] = etag
+    if is_fresh(request, etag):
+        headers = dict(response.headers) if response is not None else {"ETag": etag}
+        headers.pop("content-length", None)
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def _headers(response: Union[Response, None]) -> Union[dict, None]:
+    return dict(response.headers) if response is not None else None
+
+
+def movie_batch_response(rows: Sequence, missing: list[int], response: Union[Response, None] = None, request: Union[Request, None] = None) -> Union[Response, dict]:
+    """Body of /movies/batch: the found movies in request order and the ids that were not found."""
+    not_modified = _not_modified(list_etag(rows, missing) if request is not None else None, request, response)
+    if not_modified is not None:
+        return not_modified
+    if not settings.FAST_JSON:
+        return {"movies": rows, "missing": missing}
+    fields = MOVIE_FIELDS
+    return RawJSONResponse(orjson.dumps({"movies": [dict(zip(fields, row)) for row in rows], "missing": missing}), headers=_headers(response))
+
+
+def movie_response(row, response: Union[Response, None] = None, request: Union[Request, None] = None) -> Union[Response, object]:
+    """Serialized row on the fast path; the row itself (validated by FastAPI) otherwise."""
+    not_modified = _not_modified(movie_etag(row.id, row.version) if request is not None else None, request, response)
+    if not_modified is not None:
+        return not_modified
+    return RawJSONResponse(movie_to_json(row), headers=_headers(response)) if settings.FAST_JSON else row
+
+
+def movies_response(rows: Sequence, response: Union[Response, None] = None, request: Union[Request, None] = None) -> Union[Response, Sequence]:
+    """
+    Same for lists. `response` is the endpoint's injected Response: FastAPI ignores it when the
+    endpoint returns a Response itself, so its headers are copied over.
+    """
+    not_modified = _not_modified(list_etag(rows) if request is not None else None, request, response)
+    if not_modified is not None:
+        return not_modified
+    if not settings.FAST_JSON:
+        return rows
+    return RawJSONResponse(movies_to_json(rows), headers=_headers(response))
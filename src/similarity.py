@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import os
+import shutil
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Union
+
+import anyio.to_thread
+from fastapi import HTTPException, status
+from sqlalchemy import Connection, Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.changes import CursorTooOld, arun_with_connection, latest_seq, read_changes, run_with_connection
+from src.config import settings
+
+if TYPE_CHECKING:
+    from src.tfidf import SimilarityIndex
+
+# Lifecycle of the similarity index behind GET /movies/{id}/similar (the vectors and the
+# neighbour search are in src/tfidf.py). Generations live under SIMILARITY_INDEX_DIR; CURRENT
+# names the one to map. A background thread per engine builds the first generation, rebuilds
+# every SIMILARITY_REBUILD_SECONDS and picks up the generations other workers publish. Between
+# rebuilds the index follows the change log (src/changes.py): a write through this worker only
+# wakes the thread, which applies the change log off the request, and a lookup applies whatever
+# is still pending (other workers, raw SQL, a write the thread has not reached yet).
+#
+#   python -m src.similarity    # builds a generation before the first request needs one
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "build.lock"
+BUILD_RETRY_AFTER_SECONDS = 5
+PENDING_PAGE_SIZE = 1000
+
+# A movie's text for the index, with its id
+_DOCUMENT_FIELDS = ("id", "title", "overview", "category")
+
+
+def read_documents(conn: Connection) -> tuple[int, list[dict]]:
+    """(seq of the change log, every movie ordered by id) for a full build."""
+    # The seq is read first: a write that lands between the two reads is in the movies and in the
+    # changes after seq, and applying a change again is harmless (it sets the current state)
+    seq = latest_seq(conn)
+    rows = conn.exec_driver_sql(f"SELECT {', '.join(_DOCUMENT_FIELDS)} FROM movie ORDER BY id")
+    return seq, [dict(zip(_DOCUMENT_FIELDS, row)) for row in rows]
+
+
+def pending_changes(conn: Connection, since: int) -> list[dict]:
+    """Every entry of the change log after `since`; CursorTooOld when the index must be rebuilt."""
+    changes = []
+    while True:
+        page = read_changes(conn, since, PENDING_PAGE_SIZE)
+        changes.extend(page["changes"])
+        since = page["next_cursor"]
+        if not page["has_more"]:
+            return changes
+
+
+@contextmanager
+def build_lock(directory: Path):
+    """Held by the one process building a generation; the others skip the round."""
+    import fcntl
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK_FILE, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def current_generation(directory: Path) -> Union[Path, None]:
+    try:
+        return directory / (directory / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def publish_generation(directory: Path, path: Path):
+    """Points CURRENT at `path` atomically and removes the older generations."""
+    pointer = directory / f"{CURRENT_FILE}.tmp"
+    pointer.write_text(path.name)
+    os.replace(pointer, directory / CURRENT_FILE)
+    for old in directory.glob("gen-*"):
+        if old != path:
+            # Workers that still map an old generation keep reading it until they switch
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def build_index(directory: Path, documents: tuple[int, list[dict]]) -> Path:
+    from src.tfidf import build_generation  # numpy and scipy: first build only
+    seq, movies = documents
+    path = build_generation(directory / f"gen-{time.time_ns()}", seq, movies, settings.SIMILARITY_TOP_K)
+    publish_generation(directory, path)
+    return path
+
+
+class SimilarityStore:
+    """
+    The index of one engine in this process. `read(fn, *args)` runs fn(conn, *args) on a
+    connection of the engine from the maintenance thread, as long as `alive()`.
+    """
+    def __init__(self, read: Callable[..., Any], directory: Path, alive: Callable[[], bool] = lambda: True):
+        self.read = read
+        self.alive = alive
+        self.directory = directory
+        self.index: Union["SimilarityIndex", None] = None
+        self.lock = threading.Lock()
+        self.rebuilds = 0
+        self._verified: Union[Path, None] = None
+        self._rebuild_requested = False
+        self._changed = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+    def ready(self) -> "SimilarityIndex":
+        """The loaded index; 503 + Retry-After while the first generation is being built."""
+        if self.index is None:
+            self.open_current()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="similarity-index", daemon=True)
+            self._thread.start()
+        if self.index is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The similarity index is being built, retry shortly",
+                headers={"Retry-After": str(BUILD_RETRY_AFTER_SECONDS)},
+            )
+        return self.index
+
+    def needs_check(self) -> bool:
+        # Once per generation: is it from this database (not ahead of its change log)?
+        return self.index is not None and self._verified != self.index.path
+
+    def check(self, latest: int):
+        index = self.index
+        if index.seq > latest:
+            self.request_rebuild()  # built from another database
+        self._verified = index.path
+
+    def apply(self, since: int, changes: list[dict]):
+        with self.lock:
+            # A concurrent catch-up may have applied part of them meanwhile: the rest still
+            # follows on from the index, so it is applied here instead of left to the next write
+            if self.index is not None and self.index.seq >= since:
+                self.index.apply([change for change in changes if change["seq"] > self.index.seq])
+
+    def catch_up(self, conn: Connection):
+        """
+        Applies the change log since the index was built or last caught up: one indexed range
+        query when nothing changed. 503 while there is no index yet.
+        """
+        since = self.ready().seq
+        if self.needs_check():
+            self.check(latest_seq(conn))
+        try:
+            self.apply(since, pending_changes(conn, since))
+        except CursorTooOld:
+            self.request_rebuild()  # compaction outran the index: keep serving it until the rebuild
+
+    async def acatch_up(self, bind: AsyncEngine):
+        """catch_up for AsyncEngine binds: only the reads run on the event loop."""
+        # Mapping the first generation (and importing numpy) and scoring the changes take CPU
+        # time that would stall every other request of the loop
+        index = self.index
+        if index is None or self._thread is None:
+            index = await anyio.to_thread.run_sync(self.ready)
+        since = index.seq
+        if self.needs_check():
+            self.check(await arun_with_connection(bind, latest_seq))
+        try:
+            changes = await arun_with_connection(bind, pending_changes, since)
+        except CursorTooOld:
+            self.request_rebuild()
+            return
+        if changes:
+            await anyio.to_thread.run_sync(self.apply, since, changes)
+
+    def notify(self):
+        """A write landed: the maintenance thread applies the change log."""
+        self._changed = True
+        self._wake.set()
+
+    def follow(self):
+        """catch_up from the maintenance thread, reading through `read`."""
+        index = self.index
+        if index is None:
+            return
+        try:
+            self.apply(index.seq, self.read(pending_changes, index.seq))
+        except CursorTooOld:
+            self.request_rebuild()
+
+    def similar(self, id: int, limit: int) -> list[int]:
+        return self.ready().similar(id, limit)
+
+    def open_current(self) -> bool:
+        """Maps the generation CURRENT names when it is not the loaded one."""
+        path = current_generation(self.directory)
+        if path is None or (self.index is not None and self.index.path == path):
+            return False
+        from src.tfidf import SimilarityIndex  # numpy: first lookup only
+        try:
+            index = SimilarityIndex(path)
+        except FileNotFoundError:
+            return False  # replaced by a newer generation meanwhile: the next round loads that one
+        with self.lock:
+            self.index = index
+        return True
+
+    def request_rebuild(self):
+        self._rebuild_requested = True
+        self._wake.set()
+
+    def rebuild(self) -> bool:
+        """Builds and maps a new generation, unless another process is building one."""
+        with build_lock(self.directory) as acquired:
+            if not acquired:
+                return False
+            self._rebuild_requested = False
+            build_index(self.directory, self.read(read_documents))
+        self.rebuilds += 1
+        return self.open_current()
+
+    def footprint(self) -> dict:
+        index = self.index
+        if index is None:
+            return {"mapped": 0, "overlay": 0}
+        return {"mapped": index.mapped_bytes, "overlay": index.overlay_bytes()}
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _due(self) -> bool:
+        index = self.index
+        return index is None or self._rebuild_requested or index.age() >= settings.SIMILARITY_REBUILD_SECONDS
+
+    def _run(self):
+        while not self._stop.is_set() and self.alive():
+            try:
+                # A fresher generation from another worker replaces the rebuild of this one
+                if not self.open_current() and self._due():
+                    self.rebuild()
+                if self._changed:
+                    self._changed = False
+                    self.follow()
+            except Exception as exc:  # retried next round; lookups keep the loaded generation
+                print(f"Similarity index: build failed: {exc!r}")
+            index = self.index
+            wait = 1.0 if index is None else max(1.0, settings.SIMILARITY_REBUILD_SECONDS - index.age())
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+_stores_lock = threading.Lock()
+_stores: "weakref.WeakKeyDictionary[Union[Engine, AsyncEngine], SimilarityStore]" = weakref.WeakKeyDictionary()
+
+
+def similarity_store(bind: Union[Engine, AsyncEngine]) -> SimilarityStore:
+    with _stores_lock:
+        if bind not in _stores:
+            if isinstance(bind, AsyncEngine):
+                # The maintenance thread reads through the event loop that serves the engine
+                loop = asyncio.get_running_loop()
+                read = lambda fn, *args: asyncio.run_coroutine_threadsafe(arun_with_connection(bind, fn, *args), loop).result()
+                _stores[bind] = SimilarityStore(read, Path(settings.SIMILARITY_INDEX_DIR), alive=lambda: not loop.is_closed())
+            else:
+                read = lambda fn, *args: run_with_connection(bind, fn, *args)
+                _stores[bind] = SimilarityStore(read, Path(settings.SIMILARITY_INDEX_DIR))
+        return _stores[bind]
+
+
+def loaded_store(bind: Union[Engine, AsyncEngine]) -> Union[SimilarityStore, None]:
+    """The store of `bind` if this process has served a similarity lookup on it."""
+    return _stores.get(bind)
+
+
+def notify_similarity(bind: Union[Engine, AsyncEngine]):
+    """After a write: wakes the index of this process, if there is one, to apply it in the background."""
+    store = loaded_store(bind)
+    if store is not None:
+        store.notify()
+
+
+def similarity_footprint() -> dict:
+    """Bytes of the indexes of this process: mapped generation files, and in-memory updates."""
+    totals = {"mapped": 0, "overlay": 0}
+    for store in list(_stores.values()):
+        for part, size in store.footprint().items():
+            totals[part] += size
+    return totals
+
+
+def shutdown_similarity():
+    with _stores_lock:
+        for store in _stores.values():
+            store.stop()
+        _stores.clear()
+
+
+def main(argv=None):
+    from src.database import sqlite_url
+    parser = argparse.ArgumentParser(description="Build the similarity index of GET /movies/{id}/similar")
+    parser.add_argument("--db-url", default=sqlite_url)
+    parser.add_argument("--index-dir", type=Path, default=Path(settings.SIMILARITY_INDEX_DIR))
+    args = parser.parse_args(argv)
+    engine = create_engine(args.db_url)
+    started = time.perf_counter()
+    documents = run_with_connection(engine, read_documents)
+    path = build_index(args.index_dir, documents)
+    print(f"{len(documents[1])} movies -> {path} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
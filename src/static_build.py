@@ -0,0 +1,73 @@
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+from src.files import DIST_DIR, MANIFEST_PATH, STATIC_DIR
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz siblings are written
+    brotli = None
+
+# Build step for src/static: copies every asset to dist/ under a name that contains its content
+# hash (served with a one-year immutable Cache-Control), writes .br/.gz siblings for text assets,
+# and records name -> fingerprinted path in dist/manifest.json for asset_path().
+#
+#   python -m src.static_build
+
+COMPRESSIBLE = {".css", ".js", ".mjs", ".html", ".svg", ".json", ".txt", ".xml", ".map"}
+
+
+def fingerprinted_name(path: Path, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f"{path.stem}.{digest}{path.suffix}"
+
+
+def precompress(target: Path, data: bytes) -> list[Path]:
+    """Writes the compressed siblings that are actually smaller than `data`."""
+    written = []
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            sibling = target.with_name(target.name + suffix)
+            sibling.write_bytes(compressed)
+            written.append(sibling)
+    return written
+
+
+def build(static_dir: Path = STATIC_DIR, dist_dir: Path = DIST_DIR) -> dict:
+    """Rebuilds `dist_dir` from `static_dir` and returns the manifest."""
+    if dist_dir.exists():
+        shutil.rmtree(dist_dir)
+    manifest = {}
+    sources = sorted(path for path in static_dir.rglob("*") if path.is_file() and not path.is_relative_to(dist_dir))
+    for source in sources:
+        relative = source.relative_to(static_dir)
+        data = source.read_bytes()
+        target = dist_dir / relative.parent / fingerprinted_name(source, data)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        if source.suffix.lower() in COMPRESSIBLE:
+            precompress(target, data)
+        manifest[relative.as_posix()] = target.relative_to(static_dir).as_posix()
+    dist_dir.mkdir(parents=True, exist_ok=True)
+    (dist_dir / MANIFEST_PATH.name).write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress src/static")
+    parser.add_argument("--static-dir", type=Path, default=STATIC_DIR)
+    args = parser.parse_args(argv)
+    manifest = build(args.static_dir, args.static_dir / DIST_DIR.name)
+    for name, path in manifest.items():
+        print(f"{name} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
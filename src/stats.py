@@ -0,0 +1,123 @@
+from typing import Union
+from sqlalchemy import DDL, Connection, event, inspect
+from src.models.tables import Movie
+
+# Summary tables behind GET /movies/stats: movie count and rating sum per category, and movie
+# count per (category, year). Triggers keep them up to date on every write path (ORM, group
+# commit, bulk import, raw SQL), so reading the stats costs O(categories + years), not a scan.
+CATEGORY_STATS = "movie_category_stats"
+YEAR_STATS = "movie_year_stats"
+
+_ADD_NEW = f"""
+        INSERT INTO {CATEGORY_STATS}(category, movie_count, rating_sum) VALUES (new.category, 1, new.rating)
+            ON CONFLICT(category) DO UPDATE SET movie_count = movie_count + 1, rating_sum = rating_sum + excluded.rating_sum;
+        INSERT INTO {YEAR_STATS}(category, year, movie_count) VALUES (new.category, new.year, 1)
+            ON CONFLICT(category, year) DO UPDATE SET movie_count = movie_count + 1;"""
+
+_REMOVE_OLD = f"""
+        UPDATE {CATEGORY_STATS} SET movie_count = movie_count - 1, rating_sum = rating_sum - old.rating WHERE category = old.category;
+        DELETE FROM {CATEGORY_STATS} WHERE category = old.category AND movie_count = 0;
+        UPDATE {YEAR_STATS} SET movie_count = movie_count - 1 WHERE category = old.category AND year = old.year;
+        DELETE FROM {YEAR_STATS} WHERE category = old.category AND year = old.year AND movie_count = 0;"""
+
+STATS_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {CATEGORY_STATS} (
+        category VARCHAR NOT NULL PRIMARY KEY,
+        movie_count INTEGER NOT NULL,
+        rating_sum FLOAT NOT NULL
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {YEAR_STATS} (
+        category VARCHAR NOT NULL,
+        year INTEGER NOT NULL,
+        movie_count INTEGER NOT NULL,
+        PRIMARY KEY (category, year)
+    ) WITHOUT ROWID""",
+    f"CREATE TRIGGER IF NOT EXISTS movie_stats_ai AFTER INSERT ON movie BEGIN{_ADD_NEW}\n    END",
+    f"CREATE TRIGGER IF NOT EXISTS movie_stats_ad AFTER DELETE ON movie BEGIN{_REMOVE_OLD}\n    END",
+    f"CREATE TRIGGER IF NOT EXISTS movie_stats_au AFTER UPDATE OF category, year, rating ON movie BEGIN{_REMOVE_OLD}{_ADD_NEW}\n    END",
+]
+
+for statement in STATS_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement))
+
+# rating_sum is a float updated by additions and subtractions: allow for rounding drift
+RATING_SUM_TOLERANCE = 1e-6
+
+
+def rebuild_catalog_stats(conn: Connection):
+    """Recomputes both summary tables from a full scan of `movie`."""
+    conn.exec_driver_sql(f"DELETE FROM {CATEGORY_STATS}")
+    conn.exec_driver_sql(f"DELETE FROM {YEAR_STATS}")
+    conn.exec_driver_sql(
+        f"INSERT INTO {CATEGORY_STATS}(category, movie_count, rating_sum) "
+        "SELECT category, count(*), total(rating) FROM movie GROUP BY category"
+    )
+    conn.exec_driver_sql(
+        f"INSERT INTO {YEAR_STATS}(category, year, movie_count) "
+        "SELECT category, year, count(*) FROM movie GROUP BY category, year"
+    )
+
+
+def ensure_catalog_stats(conn: Connection):
+    """Creates the summary tables and triggers on a database that predates them, and fills them."""
+    is_new = not inspect(conn).has_table(CATEGORY_STATS)
+    for statement in STATS_DDL:
+        conn.exec_driver_sql(statement)
+    if is_new:
+        rebuild_catalog_stats(conn)
+
+
+def read_catalog_stats(conn: Connection, category: Union[str, None] = None) -> Union[dict, None]:
+    """
+    Totals, per-category counts and average ratings, and the year histogram (of `category`
+    only when given). None when `category` has no movies.
+    """
+    where, params = ("WHERE category = ?", (category,)) if category is not None else ("", ())
+    categories = conn.exec_driver_sql(
+        f"SELECT category, movie_count, rating_sum FROM {CATEGORY_STATS} {where} ORDER BY category", params
+    ).all()
+    if category is not None and not categories:
+        return None
+    years = conn.exec_driver_sql(
+        f"SELECT year, sum(movie_count) FROM {YEAR_STATS} {where} GROUP BY year ORDER BY year", params
+    ).all()
+    total = sum(count for _, count, _ in categories)
+    rating_sum = sum(rating for _, _, rating in categories)
+    return {
+        "total": total,
+        "average_rating": round(rating_sum / total, 2) if total else None,
+        "categories": [
+            {"category": name, "count": count, "average_rating": round(rating / count, 2)}
+            for name, count, rating in categories
+        ],
+        "years": [{"year": year, "count": count} for year, count in years],
+    }
+
+
+def check_catalog_stats(conn: Connection, repair: bool = False) -> list[dict]:
+    """
+    Consistency check: recomputes the summary from `movie` and returns where the incremental
+    values differ (empty list = consistent). With `repair`, rebuilds the tables when they do.
+    """
+    expected_categories = {
+        name: (count, rating)
+        for name, count, rating in conn.exec_driver_sql("SELECT category, count(*), total(rating) FROM movie GROUP BY category")
+    }
+    actual_categories = {
+        name: (count, rating)
+        for name, count, rating in conn.exec_driver_sql(f"SELECT category, movie_count, rating_sum FROM {CATEGORY_STATS}")
+    }
+    expected_years = {(name, year): count for name, year, count in conn.exec_driver_sql("SELECT category, year, count(*) FROM movie GROUP BY category, year")}
+    actual_years = {(name, year): count for name, year, count in conn.exec_driver_sql(f"SELECT category, year, movie_count FROM {YEAR_STATS}")}
+
+    mismatches = []
+    for name in sorted(expected_categories.keys() | actual_categories.keys()):
+        expected, actual = expected_categories.get(name), actual_categories.get(name)
+        if expected is None or actual is None or expected[0] != actual[0] or abs(expected[1] - actual[1]) > RATING_SUM_TOLERANCE:
+            mismatches.append({"table": CATEGORY_STATS, "key": [name], "expected": expected, "actual": actual})
+    for key in sorted(expected_years.keys() | actual_years.keys()):
+        if expected_years.get(key) != actual_years.get(key):
+            mismatches.append({"table": YEAR_STATS, "key": list(key), "expected": expected_years.get(key), "actual": actual_years.get(key)})
+    if mismatches and repair:
+        rebuild_catalog_stats(conn)
+    return mismatches
@@ -0,0 +1,335 @@
+import json
+import math
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from scipy import sparse
+
+# The numeric half of GET /movies/{id}/similar (src/similarity.py runs its lifecycle): TF-IDF
+# vectors of title, overview and category with L2-normalised rows, so a dot product is the
+# cosine similarity, and the top-k neighbours of every movie computed in one blocked pass.
+# A generation is a directory of .npy files that every worker memory-maps: the neighbour table
+# is indexed by movie id (a lookup is one row, O(k)) and the postings (the matrix by column)
+# let a write score one new vector against the catalog without loading the matrix.
+#
+# numpy and scipy are only imported with this module, by the first similarity lookup.
+
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his in into is it its of on or "
+    "she that the their them they this to was were which while who will with".split()
+)
+# Occurrence weight per field; the category is one token of its own ("category:science fiction")
+FIELD_WEIGHTS = {"title": 2.0, "overview": 1.0}
+CATEGORY_WEIGHT = 1.0
+_WORD = re.compile(r"[^\W_]+")
+
+# Cells of the similarity block computed at once (float32): bounds the memory of a rebuild
+BLOCK_CELLS = 1 << 24
+# A matrix at least this dense is multiplied as dense arrays (BLAS) rather than sparse ones
+DENSE_MIN_DENSITY = 0.05
+DENSE_MAX_BYTES = 512 * 1024 * 1024
+
+_ARRAYS = ("neighbours", "scores", "row_ids", "postings_data", "postings_indices", "postings_indptr", "idf")
+
+
+def document_terms(movie: dict) -> Counter:
+    """Weighted term counts of one movie."""
+    terms: Counter = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for word in _WORD.findall((movie.get(field) or "").lower()):
+            if len(word) > 1 and word not in STOP_WORDS:
+                terms[word] += weight
+    category = (movie.get("category") or "").strip().lower()
+    if category:
+        terms[f"category:{category}"] += CATEGORY_WEIGHT
+    return terms
+
+
+def _tf(count: float) -> float:
+    return 1.0 + math.log(count)  # sublinear: the tenth repetition of a word adds little
+
+
+def vectorize(terms: Counter, vocabulary: dict, idf: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(columns, weights) of a unit vector; terms missing from the vocabulary are ignored."""
+    pairs = [(vocabulary[term], _tf(count)) for term, count in terms.items() if term in vocabulary]
+    columns = np.fromiter((column for column, _ in pairs), dtype=np.int64, count=len(pairs))
+    weights = np.fromiter((tf for _, tf in pairs), dtype=np.float32, count=len(pairs)) * idf[columns]
+    norm = np.linalg.norm(weights)
+    return columns, weights / norm if norm else weights
+
+
+def tfidf_matrix(movies: Sequence[dict]) -> tuple[sparse.csr_matrix, list[str], np.ndarray]:
+    """(rows = movies as unit vectors, vocabulary, idf) with a smoothed idf."""
+    documents = [document_terms(movie) for movie in movies]
+    document_frequency: Counter = Counter()
+    for terms in documents:
+        document_frequency.update(terms.keys())
+    vocabulary = sorted(document_frequency)
+    columns_of = {term: column for column, term in enumerate(vocabulary)}
+    frequencies = np.array([document_frequency[term] for term in vocabulary], dtype=np.float64)
+    idf = (np.log((1 + len(movies)) / (1 + frequencies)) + 1).astype(np.float32)
+
+    rows, columns, values = [], [], []
+    for row, terms in enumerate(documents):
+        for term, count in terms.items():
+            rows.append(row)
+            columns.append(columns_of[term])
+            values.append(_tf(count))
+    columns_array = np.array(columns, dtype=np.int64)
+    matrix = sparse.csr_matrix(
+        (np.array(values, dtype=np.float32) * idf[columns_array], (np.array(rows, dtype=np.int64), columns_array)),
+        shape=(len(movies), len(vocabulary)),
+        dtype=np.float32,
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32), vocabulary, idf
+
+
+def top_neighbours(matrix: sparse.csr_matrix, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (positions, scores) of the k most similar rows of every row, best first; -1 / 0 pad the
+    rows with fewer than k similar ones. The product is computed a block of rows at a time.
+    """
+    n, terms = matrix.shape
+    positions = np.full((n, k), -1, dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float32)
+    take = min(k, n - 1)
+    if take <= 0:
+        return positions, scores
+    dense = matrix.nnz >= DENSE_MIN_DENSITY * n * terms and n * terms * 4 <= DENSE_MAX_BYTES
+    transposed = matrix.T.toarray() if dense else matrix.T.tocsr()
+    block = max(1, BLOCK_CELLS // n)
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        rows = matrix[start:stop]
+        similarity = rows.toarray() @ transposed if dense else (rows @ transposed).toarray()
+        similarity[np.arange(stop - start), np.arange(start, stop)] = -1  # not its own neighbour
+        best = np.argpartition(-similarity, take - 1, axis=1)[:, :take]
+        best_scores = np.take_along_axis(similarity, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+        similar = best_scores > 0
+        positions[start:stop, :take] = np.where(similar, best, -1)
+        scores[start:stop, :take] = np.where(similar, best_scores, 0)
+    return positions, scores
+
+
+def build_generation(path: Path, seq: int, movies: Sequence[dict], k: int) -> Path:
+    """Writes the index of `movies` (ordered by id) at `seq` of the change log into `path`."""
+    started = time.perf_counter()
+    matrix, vocabulary, idf = tfidf_matrix(movies)
+    positions, scores = top_neighbours(matrix, k)
+    row_ids = np.array([movie["id"] for movie in movies], dtype=np.int64)
+    size = int(row_ids[-1]) + 1 if len(row_ids) else 1
+    # Rows by movie id, so a lookup is a direct index; id 0 / score 0 mark an empty slot
+    neighbours = np.zeros((size, k), dtype=np.int64)
+    table_scores = np.zeros((size, k), dtype=np.float32)
+    neighbours[row_ids] = np.where(positions >= 0, row_ids[np.maximum(positions, 0)], 0)
+    table_scores[row_ids] = scores
+    postings = matrix.tocsc()
+    index_dtype = np.int32 if postings.nnz < 2**31 else np.int64
+
+    path.mkdir(parents=True)
+    arrays = {
+        "neighbours": neighbours,
+        "scores": table_scores,
+        "row_ids": row_ids,
+        "postings_data": postings.data.astype(np.float32),
+        "postings_indices": postings.indices.astype(index_dtype),
+        "postings_indptr": postings.indptr.astype(np.int64),
+        "idf": idf,
+    }
+    for name, array in arrays.items():
+        np.save(path / f"{name}.npy", array)
+    (path / "vocabulary.json").write_text(json.dumps(vocabulary))
+    meta = {"seq": seq, "k": k, "movies": len(movies), "built_at": time.time(), "build_seconds": round(time.perf_counter() - started, 3)}
+    (path / "meta.json").write_text(json.dumps(meta))
+    return path
+
+
+class SimilarityIndex:
+    """
+    A generation mapped from disk plus the writes applied to it since it was built. The table
+    is mapped copy-on-write, so those updates stay in this process; the next generation has them.
+    Vectors of written movies use the generation's vocabulary: words it has never seen count
+    from the next rebuild on.
+    """
+    def __init__(self, path: Path):
+        meta = json.loads((path / "meta.json").read_text())
+        self.path = path
+        self.seq: int = meta["seq"]
+        self.k: int = meta["k"]
+        self.built_at: float = meta["built_at"]
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="c" if name in ("neighbours", "scores") else "r") for name in _ARRAYS}
+        # Plain ndarray views of the same mappings: slicing a np.memmap costs a Python-level wrapper per slice
+        arrays = {name: array.view(np.ndarray) for name, array in arrays.items()}
+        self.neighbours, self.scores = arrays["neighbours"], arrays["scores"]
+        self.row_ids = arrays["row_ids"]
+        self.postings = (arrays["postings_data"], arrays["postings_indices"], arrays["postings_indptr"])
+        self.idf = arrays["idf"]
+        self.mapped_bytes = sum(int(array.nbytes) for array in arrays.values())
+        self.vocabulary = {term: column for column, term in enumerate(json.loads((path / "vocabulary.json").read_text()))}
+        self.stale: set[int] = set()  # positions whose stored vector predates a write
+        self.removed: set[int] = set()  # deleted movie ids
+        # Vectors written since the build, as postings of their own: slot -> movie id (-1 once
+        # rewritten or deleted), column -> (slots, weights), so scoring a write against them
+        # reads only the postings of its terms
+        self.vectors: dict[int, int] = {}  # movie id -> slot
+        self.slot_ids = np.zeros(0, dtype=np.int64)
+        self.written_postings: dict[int, tuple[list[int], list[float]]] = {}
+        # Rows of the ids past the end of the table (new movies), indexed by id - len(table)
+        self.overlay_neighbours = np.zeros((0, self.k), dtype=np.int64)
+        self.overlay_scores = np.zeros((0, self.k), dtype=np.float32)
+
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+    def similar(self, id: int, limit: int) -> list[int]:
+        """Ids of the most similar movies, best first: one table row, O(k)."""
+        if id < len(self.neighbours):
+            neighbours, scores = self.neighbours[id], self.scores[id]
+        elif id - len(self.neighbours) < len(self.overlay_neighbours):
+            neighbours, scores = self.overlay_neighbours[id - len(self.neighbours)], self.overlay_scores[id - len(self.neighbours)]
+        else:
+            return []
+        similar = [int(other) for other, score in zip(neighbours, scores) if score > 0 and other not in self.removed]
+        return similar[:limit]
+
+    def apply(self, changes: Sequence[dict]):
+        """Applies entries of the change log (src/changes.py) in order."""
+        latest: dict[int, dict] = {}
+        for change in changes:
+            latest.pop(change["id"], None)
+            latest[change["id"]] = change  # each movie once, in the order of its last change
+        for id, change in latest.items():
+            # Only rows of a movie indexed before can list it
+            listed = self._forget(id) or id in self.removed
+            if change["deleted"]:
+                self.removed.add(id)
+                self._set_row(id, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+            else:
+                self.removed.discard(id)
+                self._add(id, change["movie"], listed)
+        if changes:
+            self.seq = changes[-1]["seq"]
+
+    def overlay_bytes(self) -> int:
+        rows = self.overlay_neighbours.nbytes + self.overlay_scores.nbytes
+        vectors = self.slot_ids.nbytes + 12 * sum(len(slots) for slots, _ in self.written_postings.values())
+        return rows + vectors + 8 * (len(self.stale) + len(self.removed) + len(self.vectors))
+
+    def _position(self, id: int) -> int:
+        position = int(np.searchsorted(self.row_ids, id))
+        return position if position < len(self.row_ids) and self.row_ids[position] == id else -1
+
+    def _forget(self, id: int) -> bool:
+        """Drops the vector of `id` from the scoring; False when it had none."""
+        position = self._position(id)
+        if position >= 0:
+            self.stale.add(position)
+        slot = self.vectors.pop(id, None)
+        if slot is not None:
+            self.slot_ids[slot] = -1
+        return position >= 0 or slot is not None
+
+    def _written_scores(self, columns: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of the live written vectors that share a term with (columns, weights)."""
+        slots, products = [], []
+        for column, weight in zip(columns.tolist(), weights.tolist()):
+            posting = self.written_postings.get(column)
+            if posting is not None:
+                slots.append(np.array(posting[0], dtype=np.int64))
+                products.append(np.array(posting[1], dtype=np.float32) * weight)
+        if not slots:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        totals = np.bincount(np.concatenate(slots), np.concatenate(products), minlength=len(self.slot_ids)).astype(np.float32)
+        similar = np.flatnonzero((totals > 0) & (self.slot_ids >= 0))
+        return self.slot_ids[similar], totals[similar]
+
+    def _add(self, id: int, movie: dict, listed: bool = True):
+        columns, weights = vectorize(document_terms(movie), self.vocabulary, self.idf)
+        data, indices, indptr = self.postings
+        # Only the postings of the movie's own terms are read
+        base = np.zeros(len(self.row_ids), dtype=np.float32)
+        for column, weight in zip(columns, weights):
+            start, stop = indptr[column], indptr[column + 1]
+            base[indices[start:stop]] += weight * data[start:stop]
+        if self.stale:
+            base[np.fromiter(self.stale, dtype=np.int64, count=len(self.stale))] = 0
+        similar = np.flatnonzero(base > 0)
+        ids, scores = self.row_ids[similar], base[similar]
+        if self.vectors:
+            written_ids, written_scores = self._written_scores(columns, weights)
+            ids = np.concatenate([ids, written_ids])
+            scores = np.concatenate([scores, written_scores])
+
+        best = _top(scores, self.k)
+        self._set_row(id, ids[best], scores[best])
+        self._offer(ids, scores, id, listed)
+        slot = len(self.slot_ids)
+        self.slot_ids = np.append(self.slot_ids, id)
+        self.vectors[id] = slot
+        for column, weight in zip(columns.tolist(), weights.tolist()):
+            posting = self.written_postings.setdefault(column, ([], []))
+            posting[0].append(slot)
+            posting[1].append(weight)
+
+    def _set_row(self, id: int, ids: np.ndarray, scores: np.ndarray):
+        neighbours = np.zeros(self.k, dtype=np.int64)
+        row_scores = np.zeros(self.k, dtype=np.float32)
+        neighbours[:len(ids)], row_scores[:len(ids)] = ids, scores
+        if id < len(self.neighbours):
+            self.neighbours[id], self.scores[id] = neighbours, row_scores
+            return
+        row = id - len(self.neighbours)
+        if row >= len(self.overlay_neighbours):
+            # New ids come in order: grow by doubling
+            capacity = max(row + 1, 2 * len(self.overlay_neighbours), 64)
+            grown_neighbours = np.zeros((capacity, self.k), dtype=np.int64)
+            grown_scores = np.zeros((capacity, self.k), dtype=np.float32)
+            grown_neighbours[:len(self.overlay_neighbours)] = self.overlay_neighbours
+            grown_scores[:len(self.overlay_scores)] = self.overlay_scores
+            self.overlay_neighbours, self.overlay_scores = grown_neighbours, grown_scores
+        self.overlay_neighbours[row], self.overlay_scores[row] = neighbours, row_scores
+
+    def _offer(self, ids: np.ndarray, scores: np.ndarray, new_id: int, listed: bool = True):
+        """Puts `new_id` in the rows of `ids` where its score is among their k best; `listed`: rows may list it already."""
+        in_table = ids < len(self.neighbours)
+        for table, table_scores, rows, offered in (
+            (self.neighbours, self.scores, ids[in_table], scores[in_table]),
+            (self.overlay_neighbours, self.overlay_scores, ids[~in_table] - len(self.neighbours), scores[~in_table]),
+        ):
+            # Rows are sorted best first: only those listing new_id or with a weaker last entry change
+            candidates = offered > table_scores[rows, -1]
+            if listed:
+                candidates |= (table[rows] == new_id).any(axis=1)
+            rows, offered = rows[candidates], offered[candidates]
+            if len(rows):
+                table[rows], table_scores[rows] = _merge(table[rows], table_scores[rows], offered, new_id)
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k best scores, best first, ties in position order: argsort(-scores)[:k] without sorting them all."""
+    candidates = np.arange(len(scores))
+    if len(scores) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth)
+    return candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+
+
+def _merge(neighbours: np.ndarray, row_scores: np.ndarray, scores: np.ndarray, new_id: int) -> tuple[np.ndarray, np.ndarray]:
+    """Rows with `new_id` at its new score: updated where listed, else replacing the weakest if better."""
+    listed = neighbours == new_id
+    row_scores = np.where(listed, scores[:, None], row_scores)
+    rows = np.arange(len(neighbours))
+    weakest = row_scores.argmin(axis=1)
+    better = ~listed.any(axis=1) & (scores > row_scores[rows, weakest])
+    neighbours[rows[better], weakest[better]] = new_id
+    row_scores[rows[better], weakest[better]] = scores[better]
+    order = np.argsort(-row_scores, axis=1, kind="stable")
+    return np.take_along_axis(neighbours, order, axis=1), np.take_along_axis(row_scores, order, axis=1)
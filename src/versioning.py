@@ -0,0 +1,60 @@
+import hashlib
+from typing import Iterable, Sequence, Union
+
+from fastapi import HTTPException, status
+from fastapi.requests import Request
+
+from src.files import etag_matches
+
+# Row versions on `movie`: every UPDATE bumps movie.version (an onupdate of the column, so any
+# Core or ORM update does it). Read endpoints send weak ETags built from the ids and versions
+# they return and answer a matching If-None-Match with 304; PUT and DELETE take If-Match and
+# answer 412 when the row has moved on. The ETags are weak because the body differs per
+# Content-Encoding while the data is the same.
+
+
+def movie_etag(id: int, version: int) -> str:
+    return f'W/"{id}.{version}"'
+
+
+def list_etag(rows: Sequence, missing: Iterable[int] = ()) -> str:
+    """ETag of a list body: changes when a row is added, removed, reordered or updated."""
+    digest = hashlib.blake2b(digest_size=12)
+    for row in rows:
+        digest.update(b"%d.%d," % (row.id, row.version))
+    for id in missing:
+        digest.update(b"-%d," % id)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names `etag` (answer 304)."""
+    header = request.headers.get("if-none-match")
+    return header is not None and etag_matches(header, etag)
+
+
+def if_match_versions(request: Request, id: int) -> Union[set[int], None]:
+    """
+    Versions of movie `id` the client's If-Match accepts; None when there is no condition.
+    The weak ETags of the read endpoints are accepted here too: they identify the row version.
+    """
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    versions = set()
+    for candidate in header.split(","):
+        candidate = candidate.strip().removeprefix("W/").strip('"')
+        if candidate == "*":
+            return None  # any current version: only requires the movie to exist
+        etag_id, _, version = candidate.partition(".")
+        if etag_id == str(id) and version.isdigit():
+            versions.add(int(version))
+    return versions
+
+
+def precondition_failed(current: dict) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Movie was modified by another request",
+        headers={"ETag": movie_etag(current["id"], current["version"])},
+    )
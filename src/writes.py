@@ -0,0 +1,49 @@
+from typing import Iterable, Union
+from sqlalchemy import Connection, delete, insert, select, update
+from src.models.tables import Movie
+
+# Movie writes for the group-commit queue of src/database.py (run as write_queue(bind).submit(
+# partial(fn, ...))). Plain Core statements with RETURNING: the written row comes back from the
+# statement itself instead of a refresh() SELECT through the ORM. `versions` is the If-Match
+# condition: the write only happens while the row is at one of those versions. The check runs
+# inside the writer's transaction, so no other write can slip in between.
+
+movie_table = Movie.__table__
+
+
+class VersionConflict(Exception):
+    """The row is not at a version the caller expected; `current` is the row as it is."""
+    def __init__(self, current: dict):
+        super().__init__(f"movie {current['id']} is at version {current['version']}")
+        self.current = current
+
+
+def insert_movie(conn: Connection, values: dict) -> dict:
+    statement = insert(movie_table).values(**values).returning(*movie_table.c)
+    return dict(conn.execute(statement).mappings().one())
+
+
+def update_movie(conn: Connection, id: int, values: dict, versions: Union[Iterable[int], None] = None) -> Union[tuple[dict, dict], None]:
+    """(row before, row after) of the update, or None when there is no such movie."""
+    before = conn.execute(select(movie_table).where(movie_table.c.id == id)).mappings().first()
+    if before is None:
+        return None
+    if versions is not None and before["version"] not in versions:
+        raise VersionConflict(dict(before))
+    if not values:
+        return dict(before), dict(before)
+    statement = update(movie_table).where(movie_table.c.id == id).values(**values).returning(*movie_table.c)
+    return dict(before), dict(conn.execute(statement).mappings().one())
+
+
+def delete_movie(conn: Connection, id: int, versions: Union[Iterable[int], None] = None) -> Union[dict, None]:
+    """The deleted row, or None when there is no such movie."""
+    statement = delete(movie_table).where(movie_table.c.id == id)
+    if versions is not None:
+        statement = statement.where(movie_table.c.version.in_(list(versions)))
+    row = conn.execute(statement.returning(*movie_table.c)).mappings().first()
+    if row is None and versions is not None:
+        current = conn.execute(select(movie_table).where(movie_table.c.id == id)).mappings().first()
+        if current is not None:
+            raise VersionConflict(dict(current))
+    return None if row is None else dict(row)
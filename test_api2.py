@@ -3,12 +3,15 @@ from dotenv import load_dotenv
 load_dotenv() # Set .env file  
 
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
 from src.main import app
 from src.database import get_session
 from src.models.tables import Movie as MovieDB
+from src.cache import response_cache
+from src.security import clear_auth_caches
+from src.admission import reset_admission
 
 client = TestClient(app)
 
@@ -42,6 +45,9 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    response_cache.clear()
+    clear_auth_caches()
+    reset_admission()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
@@ -237,4 +243,1896 @@ def test_admin_can_access_admin_dashboard(client):
     response = client.get("/auth/dashboard", cookies=login_response.cookies)
     
     # ¡Aquí esperamos un 200 OK! El administrador tiene luz verde
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+# ----------------------
+     # ASYNC ENGINE (DB_MODE="async")
+# ----------------------
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.database import get_async_session
+from src.routers.async_movie_router import async_movie_router
+from src.routers.async_auth_router import async_auth_router
+
+
+@pytest.fixture(name="async_client")
+def async_client_fixture():
+    """
+    Serves the async routers from an in-memory aiosqlite database.
+    """
+    async_app = FastAPI()
+    async_app.include_router(prefix='/movies', router=async_movie_router)
+    async_app.include_router(prefix='/auth', router=async_auth_router)
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+
+    async def get_async_session_override():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+    response_cache.clear()
+    clear_auth_caches()
+    with TestClient(async_app) as client:
+        client.portal.call(create_tables)
+        yield client
+        client.portal.call(engine.dispose)
+
+
+def test_async_movie_crud(async_client: TestClient):
+    movie = {"title": "Async Movie", "overview": "An overview served by aiosqlite.", "year": 2024, "rating": 8, "category": "Action"}
+    created = async_client.post("/movies/", json=movie)
+    assert created.status_code == 201
+    movie_id = created.json()["id"]
+
+    assert async_client.get(f"/movies/{movie_id}").json()["title"] == "Async Movie"
+    assert len(async_client.get("/movies/").json()) == 1
+    assert async_client.get("/movies/by_category?category=act").json()[0]["id"] == movie_id
+
+    stale = async_client.put(f"/movies/{movie_id}", json={"rating": 1}, headers={"If-Match": f'W/"{movie_id}.0"'})
+    assert stale.status_code == 412
+    updated = async_client.put(f"/movies/{movie_id}", json={"rating": 9.5}, headers={"If-Match": created.headers["ETag"]})
+    assert updated.json()["rating"] == 9.5
+    assert async_client.get("/movies/stats").json()["categories"] == [{"category": "Action", "count": 1, "average_rating": 9.5}]
+
+    assert async_client.delete(f"/movies/{movie_id}").status_code == 200
+    assert async_client.get(f"/movies/{movie_id}").status_code == 404
+
+
+def test_async_auth_flow(async_client: TestClient):
+    payload = {"username": "usuario_async", "password": "password_seguro_123", "role": "admin"}
+    assert async_client.post("/auth/register", json=payload).status_code == 201
+    assert async_client.post("/auth/register", json=payload).status_code == 409
+
+    login_response = async_client.post("/auth/login", data={"username": "usuario_async", "password": "password_seguro_123"})
+    assert login_response.status_code == 200
+    async_client.cookies = login_response.cookies
+
+    assert async_client.get("/auth/profile").json()["username"] == "usuario_async"
+    assert async_client.get("/auth/dashboard").status_code == 200
+
+
+# ----------------------
+     # KEYSET PAGINATION
+# ----------------------
+
+def _add_movies(session: Session, count: int):
+    for i in range(count):
+        session.add(MovieDB(title=f"Movie {i:03d}", overview="Overview for pagination.", year=2000 + i % 7, rating=(i * 37) % 10 + 0.5, category="Drama"))
+    session.commit()
+
+@pytest.mark.parametrize("sort,order", [("id", "asc"), ("year", "asc"), ("rating", "desc"), ("title", "desc")])
+def test_cursor_pagination_matches_offset_pagination(session: Session, client: TestClient, sort: str, order: str):
+    """Walking X-Next-Cursor returns the same rows as the page/size walk, in the same order."""
+    _add_movies(session, 23)
+    by_offset = []
+    for page in range(1, 4):
+        by_offset += client.get(f"/movies/?size=10&page={page}&sort={sort}&order={order}").json()
+
+    by_cursor, url = [], f"/movies/?size=10&sort={sort}&order={order}"
+    while url:
+        response = client.get(url)
+        by_cursor += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        url = f"/movies/?size=10&sort={sort}&order={order}&cursor={cursor}" if cursor else None
+
+    assert [m["id"] for m in by_cursor] == [m["id"] for m in by_offset]
+    assert len(by_cursor) == 23
+    keys = [(m[sort], m["id"]) for m in by_cursor]
+    assert keys == sorted(keys, reverse=(order == "desc"))
+
+def test_cursor_pagination_rejects_bad_cursor(session: Session, client: TestClient):
+    _add_movies(session, 3)
+    cursor = client.get("/movies/?size=2&sort=year").headers["X-Next-Cursor"]
+    assert client.get(f"/movies/?size=2&sort=rating&cursor={cursor}").status_code == 400
+    assert client.get("/movies/?cursor=not-a-cursor").status_code == 400
+
+@pytest.mark.parametrize("sort, key, id", [
+    ("title", [1], 2), ("id", 1, {"x": 1}), ("year", "1999", 2), ("rating", None, 2),
+    ("title", "A", True), ("id", 2 ** 70, 1), ("rating", float("nan"), 1),
+])
+def test_cursor_pagination_rejects_mistyped_keys(session: Session, client: TestClient, sort: str, key, id):
+    import base64, json
+    _add_movies(session, 3)
+    raw = json.dumps([sort, "asc", key, id]).encode()
+    cursor = base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+    response = client.get(f"/movies/?sort={sort}&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+def test_cursor_pagination_seeks_on_index(session: Session):
+    """The seek query is answered from the (sort_key, id) index, not by scanning the table."""
+    from sqlmodel import select
+    from src.dependencies import PaginationParams, encode_cursor
+    pagination = PaginationParams(size=10, cursor=encode_cursor("year", "asc", 2003, 40), sort="year", order="asc")
+    statement = pagination.apply(select(MovieDB), MovieDB)
+    compiled = statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[-1] for row in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}"))
+    assert "ix_movie_year_id" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+# ----------------------
+     # FILTERS AND MIGRATIONS
+# ----------------------
+
+FILTER_COMBINATIONS = [
+    {"year_from": 2002}, {"year_to": 2003}, {"year_from": 2001, "year_to": 2004}, {"min_rating": 5},
+    {"category": "Drama"}, {"year_from": 2002, "min_rating": 5}, {"category": "Drama", "year_to": 2003},
+    {"category": "Drama", "min_rating": 5}, {"category": "Drama", "year_from": 2001, "year_to": 2004, "min_rating": 5},
+]
+
+def _matches(movie: dict, filters: dict) -> bool:
+    return (
+        movie["year"] >= filters.get("year_from", movie["year"])
+        and movie["year"] <= filters.get("year_to", movie["year"])
+        and movie["rating"] >= filters.get("min_rating", movie["rating"])
+        and movie["category"] == filters.get("category", movie["category"])
+    )
+
+@pytest.mark.parametrize("sort", ["id", "title", "year", "rating"])
+def test_filters_return_matching_movies_in_sort_order(session: Session, client: TestClient, sort: str):
+    _add_movies(session, 30)
+    session.add(MovieDB(title="Other", overview="Not a drama.", year=2003, rating=9.5, category="Comedy"))
+    session.commit()
+    everything = client.get("/movies/?size=100").json()
+    for filters in FILTER_COMBINATIONS:
+        movies = client.get("/movies/", params={**filters, "sort": sort, "size": 100}).json()
+        expected = sorted((m for m in everything if _matches(m, filters)), key=lambda m: (m[sort], m["id"]))
+        assert [m["id"] for m in movies] == [m["id"] for m in expected], filters
+    assert client.get("/movies/?year_from=2005&year_to=2001").status_code == 400
+
+@pytest.mark.parametrize("filters", FILTER_COMBINATIONS)
+@pytest.mark.parametrize("sort", ["id", "title", "year", "rating"])
+def test_every_filter_combination_uses_an_index(session: Session, filters: dict, sort: str):
+    """EXPLAIN QUERY PLAN: the movie table is searched through an index, never scanned."""
+    from src.dependencies import MovieFilterParams, PaginationParams
+    statement = PaginationParams(size=10, sort=sort).apply(MovieFilterParams(**filters).apply(select(MovieDB), MovieDB), MovieDB)
+    compiled = statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = [row[-1] for row in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+    assert plan[0].startswith("SEARCH movie USING INDEX ix_movie_"), plan
+
+def test_filtered_pages_follow_updates(session: Session, client: TestClient):
+    _add_movies(session, 5)
+    url = "/movies/?year_from=2004"
+    assert [m["id"] for m in client.get(url).json()] == [5]
+    assert client.get(url).headers["X-Cache"] == "HIT"
+    client.put("/movies/1", json={"year": 2010})
+    assert [m["id"] for m in client.get(url).json()] == [1, 5]
+
+def test_migrations_upgrade_an_existing_database():
+    """A database from before the migrations gets every index and the search index, once."""
+    from sqlalchemy import inspect
+    from src.migrations import SCHEMA_VERSION, run_migrations, schema_version
+    engine = create_engine("sqlite:///:memory:", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE movie (id INTEGER PRIMARY KEY, title VARCHAR, overview VARCHAR, year INTEGER, rating FLOAT, category VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO movie VALUES (1, 'Legacy', 'Stored before the migrations.', 1999, 7, 'Drama')")
+
+    assert run_migrations(engine) == SCHEMA_VERSION
+    assert run_migrations(engine) == 0
+    with engine.connect() as conn:
+        assert schema_version(conn) == SCHEMA_VERSION
+        assert conn.exec_driver_sql("SELECT rowid FROM movie_fts WHERE movie_fts MATCH 'legacy'").all() == [(1,)]
+        version, updated_at = conn.exec_driver_sql("SELECT version, updated_at FROM movie").one()
+        assert version == 1 and updated_at is not None
+    indexes = {index["name"] for index in inspect(engine).get_indexes("movie")}
+    assert {index.name for index in MovieDB.__table__.indexes} <= indexes
+    assert inspect(engine).has_table("user")
+
+
+# ----------------------
+     # FULL-TEXT SEARCH
+# ----------------------
+
+def test_search_ranks_title_matches_first(session: Session, client: TestClient):
+    session.add(MovieDB(title="Harbour Lights", overview="A detective story about a lighthouse keeper.", year=2001, rating=6, category="Thriller"))
+    session.add(MovieDB(title="Lighthouse", overview="Two keepers slowly lose their minds.", year=2019, rating=7.5, category="Horror"))
+    session.add(MovieDB(title="Unrelated", overview="Nothing to see here at all.", year=2010, rating=5, category="Comedy"))
+    session.commit()
+
+    data = client.get("/movies/search?q=lighth").json()
+    assert [m["title"] for m in data] == ["Lighthouse", "Harbour Lights"]
+    assert client.get("/movies/search?q=lighthouse keep").json()[0]["title"] == "Lighthouse"
+    assert client.get("/movies/search?q=lighth&size=1&page=2").json()[0]["title"] == "Harbour Lights"
+    assert client.get("/movies/search?q=zzzz").json() == []
+
+def test_search_index_follows_updates_and_deletes(session: Session, client: TestClient):
+    movie_id = client.post("/movies/", json={"title": "Old Name", "overview": "An overview that is long enough.", "year": 2020, "category": "Western"}).json()["id"]
+    client.put(f"/movies/{movie_id}", json={"title": "Brand New Name", "category": "Musical"})
+
+    assert client.get("/movies/search?q=old").json() == []
+    assert client.get("/movies/search?q=brand").json()[0]["id"] == movie_id
+    assert client.get("/movies/by_category?category=western").status_code == 404
+    assert client.get("/movies/by_category?category=music").json()[0]["id"] == movie_id
+
+    client.delete(f"/movies/{movie_id}")
+    assert client.get("/movies/search?q=brand").json() == []
+
+def test_search_index_is_built_for_existing_database():
+    """ensure_search_index indexes rows written before the FTS table existed."""
+    from src.search import FTS_TABLE, ensure_search_index
+    engine = create_engine("sqlite:///:memory:", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE movie (id INTEGER PRIMARY KEY, title VARCHAR, overview VARCHAR, year INTEGER, rating FLOAT, category VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO movie VALUES (1, 'Legacy', 'Stored before the index existed.', 1999, 7, 'Drama')")
+    for _ in range(2):  # idempotent
+        with engine.begin() as conn:
+            ensure_search_index(conn)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH 'legacy'").all()
+    assert rows == [(1,)]
+
+
+# ----------------------
+     # RESPONSE CACHE
+# ----------------------
+
+def _create_movie(client: TestClient, **fields) -> dict:
+    movie = {"title": "Cached Movie", "overview": "An overview that is long enough.", "year": 2020, "rating": 7, "category": "Action"}
+    movie.update(fields)
+    return client.post("/movies/", json=movie).json()
+
+def test_read_endpoints_are_served_from_cache(session: Session, client: TestClient):
+    movie = _create_movie(client)
+    first = client.get(f"/movies/{movie['id']}")
+    assert first.headers["X-Cache"] == "MISS"
+
+    # A write behind the API's back is invisible until the entry is invalidated
+    session.get(MovieDB, movie["id"]).title = "Changed Directly"
+    session.commit()
+    second = client.get(f"/movies/{movie['id']}")
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+
+    stats = response_cache.stats()
+    assert stats["hits"] >= 1 and stats["misses"] >= 1 and stats["bytes"] > 0
+
+def test_writes_invalidate_only_affected_entries(client: TestClient):
+    action = _create_movie(client, title="Action One", category="Action")
+    drama = _create_movie(client, title="Drama One", category="Drama")
+    for url in (f"/movies/{action['id']}", f"/movies/{drama['id']}", "/movies/by_category?category=drama", "/movies/by_category?category=act", "/movies/?sort=year"):
+        client.get(url)
+
+    client.put(f"/movies/{action['id']}", json={"overview": "A new overview that is long enough."})
+    assert client.get(f"/movies/{action['id']}").headers["X-Cache"] == "MISS"
+    assert client.get(f"/movies/{drama['id']}").headers["X-Cache"] == "HIT"
+    assert client.get("/movies/by_category?category=drama").headers["X-Cache"] == "HIT"
+    assert client.get("/movies/?sort=year").headers["X-Cache"] == "MISS"  # page contains the movie
+    assert client.get("/movies/by_category?category=act").headers["X-Cache"] == "MISS"
+
+    client.put(f"/movies/{drama['id']}", json={"rating": 9})
+    assert client.get("/movies/by_category?category=act").headers["X-Cache"] == "HIT"
+
+    # A new Action movie must show up in the cached "act" category result
+    _create_movie(client, title="Action Two", category="Action")
+    response = client.get("/movies/by_category?category=act")
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(response.json()) == 2
+
+    client.delete(f"/movies/{drama['id']}")
+    assert client.get(f"/movies/{drama['id']}").status_code == 404
+
+def test_accented_category_writes_invalidate_folded_queries(client: TestClient):
+    _create_movie(client, title="Acción Uno", category="Acción")
+    for query in ("accion", "ACCIÓN"):
+        assert len(client.get(f"/movies/by_category?category={query}").json()) == 1
+    _create_movie(client, title="Acción Dos", category="Acción")
+    for query in ("accion", "ACCIÓN"):
+        response = client.get(f"/movies/by_category?category={query}")
+        assert response.headers["X-Cache"] == "MISS" and len(response.json()) == 2
+
+def test_response_cache_is_bounded_in_bytes():
+    from src.cache import CacheEntry, ResponseCache
+    cache = ResponseCache(max_entries=100, max_bytes=250, ttl=60)
+    for i in range(5):
+        cache.set(f"key{i}", CacheEntry(body=b"x" * 90, headers=[], media_type=None, tags=frozenset({"t"}), expires_at=float("inf"), size=100), cache.generation)
+    stats = cache.stats()
+    assert stats["bytes"] <= 250
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 3
+    assert cache.get("key4") is not None and cache.get("key0") is None
+    cache.invalidate_tags(["t"])
+    assert cache.stats()["entries"] == 0
+
+
+# ----------------------
+     # AUTH HOT PATH CACHES
+# ----------------------
+from sqlalchemy import event as sa_event
+
+def test_authenticated_requests_skip_the_database_once_warm(session: Session, client: TestClient):
+    payload = {"username": "usuario_test_cache", "password": "password_seguro_123", "role": "admin"}
+    client.post("/auth/register", json=payload)
+    client.cookies = client.post("/auth/login", data=payload).cookies
+    assert client.get("/auth/profile").status_code == 200  # warms both caches
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    sa_event.listen(session.get_bind(), "before_cursor_execute", count)
+    try:
+        for _ in range(5):
+            assert client.get("/auth/profile").json()["username"] == "usuario_test_cache"
+            assert client.get("/auth/dashboard").status_code == 200
+    finally:
+        sa_event.remove(session.get_bind(), "before_cursor_execute", count)
+    assert statements == []
+
+def test_user_changes_invalidate_the_cached_principal(session: Session, client: TestClient):
+    from src.models.tables import User
+    payload = {"username": "usuario_test_role", "password": "password_seguro_123"}
+    client.post("/auth/register", json=payload)
+    client.cookies = client.post("/auth/login", data=payload).cookies
+    assert client.get("/auth/dashboard").status_code == 403
+
+    user = session.exec(select(User).where(User.username == "usuario_test_role")).first()
+    user.role = "admin"
+    session.add(user)
+    session.commit()
+    assert client.get("/auth/dashboard").status_code == 200
+
+def test_verified_token_cache_honours_expiry(session: Session, client: TestClient):
+    from datetime import timedelta
+    from src.security import create_access_token, verified_tokens
+    client.post("/auth/register", json={"username": "usuario_test_exp", "password": "password_seguro_123"})
+    token = create_access_token({"username": "usuario_test_exp"}, expires_delta=timedelta(seconds=-1))
+    assert client.get("/auth/profile", cookies={"access_token": token}).status_code == 401
+    assert verified_tokens.get(token) is None
+
+
+# ----------------------
+     # PASSWORD HASHING POOL
+# ----------------------
+
+def test_login_rehashes_password_when_argon2_parameters_change(session: Session, client: TestClient, monkeypatch):
+    from src.config import settings
+    from src.models.tables import User
+    payload = {"username": "usuario_test_rehash", "password": "password_seguro_123"}
+    client.post("/auth/register", json=payload)
+    old_hash = session.exec(select(User).where(User.username == "usuario_test_rehash")).first().password
+    assert f"t={settings.ARGON2_TIME_COST}," in old_hash
+
+    monkeypatch.setattr(settings, "ARGON2_TIME_COST", settings.ARGON2_TIME_COST + 1)
+    assert client.post("/auth/login", data=payload).status_code == 200
+    session.expire_all()
+    new_hash = session.exec(select(User).where(User.username == "usuario_test_rehash")).first().password
+    assert new_hash != old_hash
+    assert f"t={settings.ARGON2_TIME_COST}," in new_hash
+    assert client.post("/auth/login", data=payload).status_code == 200
+
+def test_saturated_hashing_pool_sheds_with_retry_after(client: TestClient, monkeypatch):
+    import src.security
+    from src.hashing import HashingPool
+    full_pool = HashingPool(workers=0, queue_size=0)
+    assert full_pool._slots.acquire(blocking=False)  # the only slot is taken
+    monkeypatch.setattr(src.security, "hashing_pool", full_pool)
+
+    response = client.post("/auth/register", json={"username": "usuario_test_busy", "password": "password_seguro_123"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert full_pool.rejected == 1
+
+def test_hashing_pool_releases_slots():
+    from src.hashing import HashingPool, argon2_params, hash_secret
+    pool = HashingPool(workers=1, queue_size=0)
+    try:
+        for _ in range(3):
+            assert pool.submit(hash_secret, "secret", argon2_params()).result().startswith("$argon2id$")
+        import time
+        deadline = time.monotonic() + 5  # done-callbacks run just after result() wakes up
+        while pool.in_flight() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.in_flight() == 0
+    finally:
+        pool.shutdown()
+
+
+# ----------------------
+     # BULK IMPORT / EXPORT
+# ----------------------
+
+def test_bulk_import_ndjson_reports_bad_rows(session: Session, client: TestClient, monkeypatch):
+    import json
+    from src.config import settings
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)  # several transactions
+    rows = [
+        {"title": f"Bulk {i}", "overview": "An overview that is long enough.", "year": 2000 + i, "rating": 6, "category": "Documentary"}
+        for i in range(5)
+    ]
+    body = "\n".join(json.dumps(row) for row in rows[:3]) + "\n{not json}\n" + json.dumps({"title": "X", "overview": "short", "year": 1800}) + "\n\n" + "\n".join(json.dumps(row) for row in rows[3:])
+
+    response = client.post("/movies/bulk", content=body.encode(), headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 5
+    assert report["failed"] == 2
+    assert [error["row"] for error in report["errors"]] == [4, 5]
+    assert {tuple(e["loc"]) for e in report["errors"][1]["errors"]} == {("title",), ("overview",), ("year",)}
+    assert len(client.get("/movies/search?q=bulk&size=100").json()) == 5
+
+def test_bulk_import_csv_with_quoted_newlines(client: TestClient):
+    body = 'title,overview,year,rating,category\n"Quoted, Title","First line\nsecond line of overview",1999,,\nPlain Title,Another long enough overview,2001,8.5,Comedy\n'
+    report = client.post("/movies/bulk", content=body.encode(), headers={"Content-Type": "text/csv"}).json()
+    assert report == {"inserted": 2, "failed": 0, "errors": [], "errors_truncated": False}
+    movies = client.get("/movies/").json()
+    assert movies[0]["title"] == "Quoted, Title"
+    assert movies[0]["overview"] == "First line\nsecond line of overview"
+    assert movies[0]["rating"] == 5 and movies[0]["category"] == "No category"
+
+def test_bulk_import_csv_reports_stray_quotes_and_long_records_per_row(client: TestClient, monkeypatch):
+    from src.config import settings
+    monkeypatch.setattr(settings, "BULK_MAX_RECORD_SIZE", 200)
+    rows = "".join(f"Movie {i},An overview that is long enough,2001,5.0,Drama\n" for i in range(3))
+    body = (
+        'title,overview,year,rating,category\n'
+        'Bad "title,An overview with a "quote" inside,2001,5.0,Drama\n'  # literal quotes, as in the csv module
+        + rows
+        + f'Long,"{"x" * 300}",2001,5.0,Drama\n'
+        + '"Open quote,' + "y" * 150 + '\n' + "z" * 100 + '\n'  # a quoted field past the cap
+        + rows
+    )
+    report = client.post("/movies/bulk", content=body.encode(), headers={"Content-Type": "text/csv"}).json()
+    assert report["inserted"] == 7
+    assert [(error["row"], error["errors"][0]["msg"]) for error in report["errors"]] == [
+        (5, "Record longer than 200 characters"), (6, "Record longer than 200 characters"),
+    ]
+    assert client.get("/movies/1").json()["title"] == 'Bad "title'
+
+def test_export_streams_round_trip(session: Session, client: TestClient, monkeypatch):
+    import csv, io, json
+    from src.config import settings
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 3)
+    _add_movies(session, 7)
+
+    with client.stream("GET", "/movies/export") as response:
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [line for line in response.iter_lines() if line]
+    exported = [json.loads(line) for line in lines]
+    assert [m["id"] for m in exported] == list(range(1, 8))
+    assert exported[0] == client.get("/movies/1").json()
+
+    text = client.get("/movies/export?format=csv").text
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert len(rows) == 7 and rows[6]["title"] == "Movie 006"
+
+    # The CSV export is a valid import file
+    client.post("/movies/bulk?format=csv", content=text.encode())
+    assert len(client.get("/movies/?size=100").json()) == 14
+
+def test_async_bulk_import_and_export(async_client: TestClient):
+    import json
+    body = "\n".join(json.dumps({"title": f"Async Bulk {i}", "overview": "An overview that is long enough.", "year": 2010}) for i in range(3))
+    assert async_client.post("/movies/bulk", content=body.encode()).json()["inserted"] == 3
+    lines = [line for line in async_client.get("/movies/export").text.splitlines() if line]
+    assert [json.loads(line)["title"] for line in lines] == ["Async Bulk 0", "Async Bulk 1", "Async Bulk 2"]
+
+
+# ----------------------
+     # BENCHMARK SUITE (smoke test)
+# ----------------------
+
+def test_benchmark_suite_covers_every_route(tmp_path):
+    import asyncio
+    import json
+    from benchmarks import dataset, load, regression
+    from src.routers.auth_router import auth_router
+    from src.routers.movie_router import movie_router
+
+    routes = {f"{method} /movies{route.path}" for route in movie_router.routes for method in route.methods}
+    routes |= {f"{method} /auth{route.path}" for route in auth_router.routes for method in route.methods}
+    assert routes <= {scenario.name.split(" (")[0] for scenario in load.SCENARIOS}
+
+    db = tmp_path / "bench.db"
+    assert dataset.populate(f"sqlite:///{db}", movies=50, users=3)["movies"] == 50
+    assert list(dataset.generate_movies(3, seed=7)) == list(dataset.generate_movies(3, seed=7))
+
+    client = load.asgi_client(str(db))
+    async def go():
+        async with client:
+            return await load.run(client, movie_count=50, requests=3, concurrency=2)
+    try:
+        report = asyncio.run(go())
+    finally:
+        app.dependency_overrides.clear()
+        response_cache.clear()
+    assert all(row["errors"] == 0 for row in report["routes"].values()), report
+    assert report["routes"]["GET /auth/dashboard"]["statuses"] == {"200": 3}
+
+    baseline = regression.make_baseline(report)
+    assert regression.find_regressions(report, baseline) == []
+    slower = {"routes": {**report["routes"], "GET /movies/{id}": {**report["routes"]["GET /movies/{id}"], "p95_ms": 10_000}}}
+    assert [r["route"] for r in regression.find_regressions(slower, baseline)] == ["GET /movies/{id}"]
+    # A scenario without a baseline entry (or the reverse) fails instead of being skipped
+    unlisted = {**baseline, "routes": {name: row for name, row in baseline["routes"].items() if name != "GET /movies/stats"}}
+    assert [(r["route"], r["reason"]) for r in regression.find_regressions(report, unlisted)] == [("GET /movies/stats", "not in the baseline")]
+    unmeasured = {"routes": {name: row for name, row in report["routes"].items() if name != "GET /movies/stats"}}
+    assert [(r["route"], r["reason"]) for r in regression.find_regressions(unmeasured, baseline)] == [("GET /movies/stats", "not measured")]
+    committed = json.loads(regression.BASELINE_PATH.read_text())
+    assert set(committed["routes"]) == {scenario.name for scenario in load.SCENARIOS}
+
+
+# ----------------------
+     # METRICS
+# ----------------------
+
+def test_server_timing_reports_db_work(session: Session, client: TestClient):
+    _add_movies(session, 3)
+    response = client.get("/movies/2")
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith("app;dur=")
+    assert 'db;dur=' in timing and 'desc="1 queries"' in timing
+
+    # Served from the response cache: no query at all
+    assert 'desc="0 queries"' in client.get("/movies/2").headers["Server-Timing"]
+
+def test_session_dependency_records_threadpool_wait():
+    from src.metrics import RequestStats, current_request_stats, server_timing
+    stats = RequestStats()
+    token = current_request_stats.set(stats)
+    try:
+        dependency = get_session()
+        next(dependency)
+        dependency.close()
+    finally:
+        current_request_stats.reset(token)
+    assert stats.threadpool_wait is not None and stats.threadpool_wait >= 0
+    assert "tp;dur=" in server_timing(0.01, stats)
+
+def test_metrics_endpoint_exposes_prometheus_text(session: Session, client: TestClient):
+    from src.metrics import metrics
+    metrics.reset()
+    _add_movies(session, 2)
+    client.get("/movies/1")
+    client.get("/movies/999")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/movies/{id}",status="200"} 1' in text
+    assert 'http_requests_total{method="GET",route="/movies/{id}",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/movies/{id}"} 2' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/movies/{id}",le="+Inf"} 2' in text
+    assert 'db_queries_total{method="GET",route="/movies/{id}"} 2' in text
+    assert "http_requests_in_flight 1" in text  # the /metrics request itself
+    assert 'threadpool_tokens{state="borrowed"}' in text
+    assert 'response_cache{stat="entries"}' in text and 'response_cache{stat="misses"}' not in text
+    assert "# TYPE response_cache_events_total counter" in text and 'response_cache_events_total{event="misses"}' in text
+
+
+# ----------------------
+     # FAST JSON PATH
+# ----------------------
+
+def test_fast_json_matches_default_serialization(session: Session, client: TestClient, monkeypatch):
+    from src.config import settings
+    _add_movies(session, 12)
+    urls = ["/movies/3", "/movies/?size=5&sort=rating&order=desc", "/movies/search?q=movie", "/movies/by_category?category=drama"]
+    default = [client.get(url) for url in urls]
+
+    response_cache.clear()
+    monkeypatch.setattr(settings, "FAST_JSON", True)
+    fast = [client.get(url) for url in urls]
+
+    for slow_response, fast_response in zip(default, fast):
+        assert fast_response.status_code == 200
+        assert fast_response.headers["content-type"] == "application/json"
+        assert fast_response.json() == slow_response.json()
+    assert fast[1].headers["X-Next-Cursor"] == default[1].headers["X-Next-Cursor"]
+    assert [response.headers["ETag"] for response in fast] == [response.headers["ETag"] for response in default]
+    assert client.get("/movies/999").status_code == 404
+
+def test_fast_json_batch_matches_default(session: Session, client: TestClient, monkeypatch):
+    from src.config import settings
+    _add_movies(session, 5)
+    default = client.get("/movies/batch?ids=4,99,2").json()
+    response_cache.clear()
+    monkeypatch.setattr(settings, "FAST_JSON", True)
+    assert client.get("/movies/batch?ids=4,99,2").json() == default
+
+def test_serialization_microbenchmark_runs():
+    from benchmarks.serialization import measure
+    result = measure(size=10, number=5)
+    assert result["default_us"] > 0 and result["fast_us"] > 0
+
+
+# ----------------------
+     # ROW READ PATH
+# ----------------------
+
+def test_reads_leave_the_identity_map_empty(session: Session, client: TestClient):
+    _add_movies(session, 12)
+    session.expunge_all()
+    assert client.get("/movies/3").json()["id"] == 3
+    assert len(client.get("/movies/?size=5&year_from=1900&sort=rating").json()) == 5
+    assert client.get("/movies/by_category?category=drama").status_code == 200
+    assert len(session.identity_map) == 0
+
+def test_read_statements_are_compiled_once_per_shape(session: Session, client: TestClient):
+    from src.reads import statement_cache_size
+    _add_movies(session, 12)
+    response = client.get("/movies/?size=3&sort=title")
+    pages, sizes = [response.json()], []
+    while "X-Next-Cursor" in response.headers:
+        response = client.get(f"/movies/?size=3&sort=title&cursor={response.headers['X-Next-Cursor']}")
+        pages.append(response.json())
+        sizes.append(statement_cache_size())
+    # Every page after the first is the same (sort, seek) shape with other values
+    assert len(sizes) > 2 and len(set(sizes)) == 1
+    assert [movie["id"] for page in pages for movie in page] == [movie["id"] for movie in client.get("/movies/?size=12&sort=title").json()]
+
+def test_read_benchmark_runs(tmp_path):
+    from benchmarks.reads import measure
+    results = measure(tmp_path / "bench_reads.db", movies=200, number=5)
+    assert [result["query"] for result in results] == ["by_id", "page", "by_category"]
+    assert all(result["orm_us"] > 0 and result["rows_us"] > 0 for result in results)
+
+
+# ----------------------
+     # COLD START
+# ----------------------
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+COLD_START_SCRIPT = """
+import asyncio, time
+started = time.perf_counter()
+from src.main import app
+async def startup():
+    async with app.router.lifespan_context(app):
+        pass
+asyncio.run(startup())
+print("COLD_START_MS", (time.perf_counter() - started) * 1000)
+"""
+LAZY_MODULES = ("jinja2", "jose", "passlib", "starlette.staticfiles")
+
+def _cold_start(cwd: Path) -> tuple[float, set]:
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parent)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START_SCRIPT],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+    elapsed = next(float(line.split()[1]) for line in result.stdout.splitlines() if line.startswith("COLD_START_MS"))
+    return elapsed, imported
+
+def test_cold_start_fits_the_budget(tmp_path):
+    """Import of src.main plus startup on an existing database, in a fresh interpreter."""
+    from src.config import settings
+    _cold_start(tmp_path)  # creates the database, like the first start of a container
+    elapsed, imported = _cold_start(tmp_path)
+    assert not [module for module in LAZY_MODULES if module in imported]
+    assert elapsed < settings.COLD_START_BUDGET_MS, f"cold start took {elapsed:.0f} ms"
+
+def test_up_to_date_schema_is_checked_with_one_query(tmp_path):
+    from src.migrations import run_migrations
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    run_migrations(engine)
+    statements = []
+    sa_event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    assert run_migrations(engine) == 0
+    assert statements == ["PRAGMA user_version"]
+
+def test_lazy_subsystems_still_serve(client: TestClient):
+    assert "styles.css" in client.get("/").text
+    assert client.get("/static/styles.css").status_code == 200
+    assert client.get("/static/missing.css").status_code == 404
+
+
+# ----------------------
+     # FILE DELIVERY
+# ----------------------
+
+def test_get_file_validators_and_ranges(client: TestClient):
+    full = client.get("/movies/get_file")
+    assert full.status_code == 200 and full.headers["accept-ranges"] == "bytes"
+    etag, size = full.headers["etag"], len(full.content)
+    assert not etag.startswith("W/") and full.headers["last-modified"]
+
+    assert client.get("/movies/get_file", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/movies/get_file", headers={"If-Modified-Since": full.headers["last-modified"]}).status_code == 304
+
+    part = client.get("/movies/get_file", headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.content == full.content[10:20]
+    assert part.headers["content-range"] == f"bytes 10-19/{size}"
+    assert client.get("/movies/get_file", headers={"Range": "bytes=-5"}).content == full.content[-5:]
+    assert client.get("/movies/get_file", headers={"Range": "bytes=10-19", "If-Range": '"stale"'}).status_code == 200
+    unsatisfiable = client.get("/movies/get_file", headers={"Range": f"bytes={size}-"})
+    assert unsatisfiable.status_code == 416 and unsatisfiable.headers["content-range"] == f"bytes */{size}"
+
+def test_static_build_serves_fingerprinted_precompressed_assets(tmp_path):
+    import gzip
+    from fastapi import FastAPI
+    from src.files import IMMUTABLE, REVALIDATE, StaticAssets
+    from src.static_build import build
+
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    (tmp_path / "secret.txt").write_text("not an asset")
+    css = b"body { color: #333; }\n" * 50
+    (static_dir / "styles.css").write_bytes(css)
+    manifest = build(static_dir, static_dir / "dist")
+    assert build(static_dir, static_dir / "dist") == manifest  # rebuild does not fingerprint its own output
+    fingerprinted = manifest["styles.css"]
+    assert fingerprinted.startswith("dist/styles.") and fingerprinted.endswith(".css")
+
+    static_app = FastAPI()
+    static_app.mount("/static", StaticAssets(static_dir))
+    static_client = TestClient(static_app)
+
+    plain = static_client.get("/static/styles.css")
+    assert plain.headers["cache-control"] == REVALIDATE and plain.content == css
+
+    identity = static_client.get(f"/static/{fingerprinted}", headers={"Accept-Encoding": "identity"})
+    assert identity.headers["cache-control"] == IMMUTABLE and "content-encoding" not in identity.headers
+    assert identity.headers["vary"] == "Accept-Encoding"
+    gzipped = static_client.get(f"/static/{fingerprinted}", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip" and gzipped.content == css  # httpx decodes it
+    assert int(gzipped.headers["content-length"]) == len(gzip.compress(css, compresslevel=9, mtime=0))
+    assert gzipped.headers["etag"] != identity.headers["etag"]
+    assert static_client.get(f"/static/{fingerprinted}", headers={"Accept-Encoding": "gzip, br"}).headers["content-encoding"] == "br"
+    assert static_client.get(f"/static/{fingerprinted}", headers={"Accept-Encoding": "gzip;q=0"}).headers.get("content-encoding") is None
+
+    assert static_client.get("/static/..%2Fsecret.txt").status_code == 404
+    assert static_client.get(f"/static/{fingerprinted}.gz").status_code == 404
+    assert static_client.post("/static/styles.css").status_code == 405
+
+
+# ----------------------
+     # GROUP COMMIT
+# ----------------------
+
+def _file_engine(tmp_path):
+    from src.database import sqlite_pragmas
+    return sqlite_pragmas(create_engine(f"sqlite:///{tmp_path / 'writes.db'}", connect_args={"check_same_thread": False}))
+
+def test_group_commit_batches_concurrent_writes(tmp_path, monkeypatch):
+    from functools import partial
+    from concurrent.futures import ThreadPoolExecutor
+    from src import writes
+    from src.config import settings
+    from src.database import WriteQueue
+    from src.migrations import run_migrations
+    monkeypatch.setattr(settings, "WRITE_BATCH_WINDOW_MS", 20)
+    engine = _file_engine(tmp_path)
+    run_migrations(engine)
+    writer = WriteQueue(engine)
+
+    movie = {"title": "Queued", "overview": "Written by the group commit.", "year": 2001, "rating": 6.5, "category": "Drama"}
+    with ThreadPoolExecutor(16) as pool:
+        futures = [writer.submit(partial(writes.insert_movie, values={**movie, "title": f"Queued {i}"})) for i in range(40)]
+        futures.append(writer.submit(partial(writes.insert_movie, values={**movie, "title": None})))  # NOT NULL
+        rows = [future.result() for future in futures[:-1]]
+    with pytest.raises(Exception):
+        futures[-1].result()
+    writer.shutdown()
+
+    assert sorted(row["title"] for row in rows) == sorted(f"Queued {i}" for i in range(40))
+    assert writer.writes == 41 and writer.batches < 41
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM movie").scalar() == 40
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+
+def test_async_group_commit_batches_concurrent_writes(tmp_path):
+    import asyncio
+    from functools import partial
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from src import writes
+    from src.database import async_write_queue
+    from src.migrations import run_migrations
+    run_migrations(_file_engine(tmp_path))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'writes.db'}")
+    movie = {"title": "Async", "overview": "Queued on the event loop.", "year": 2002, "rating": 7.0, "category": "Drama"}
+
+    async def go():
+        writer = async_write_queue(engine)
+        rows = await asyncio.gather(*(writer.submit(partial(writes.insert_movie, values=movie)) for _ in range(20)))
+        updated = await writer.submit(partial(writes.update_movie, id=rows[0]["id"], values={"rating": 9.0}))
+        missing = await writer.submit(partial(writes.delete_movie, id=10_000))
+        await engine.dispose()
+        return writer, rows, updated, missing
+
+    writer, rows, updated, missing = asyncio.run(go())
+    assert len({row["id"] for row in rows}) == 20
+    assert updated[0]["rating"] == 7.0 and updated[1]["rating"] == 9.0
+    assert missing is None
+    assert writer.batches < writer.writes
+
+def test_api_writes_use_returning_instead_of_refresh(session: Session, client: TestClient):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        created = client.post("/movies/", json={"title": "Returning", "overview": "No refresh SELECT.", "year": 2020, "rating": 8.0, "category": "Drama"})
+    finally:
+        sa_event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert created.status_code == 201 and created.json()["id"]
+    assert [s for s in statements if "movie" in s] == [s for s in statements if s.startswith("INSERT INTO movie") and "RETURNING" in s]
+    assert client.put("/movies/999", json={"rating": 1.0}).status_code == 404
+    assert client.delete("/movies/999").status_code == 404
+
+def test_write_benchmark_runs(tmp_path):
+    from benchmarks.writes import measure
+    result = measure(tmp_path / "bench_writes.db", concurrency=4, count=40)
+    assert result["per_request_rps"] > 0 and result["group_commit_rps"] > 0
+
+
+# ----------------------
+     # CATALOG STATISTICS
+# ----------------------
+
+def _admin_client(client: TestClient, session: Session) -> TestClient:
+    from src.models.tables import User
+    from src.security import get_password_hash
+    session.add(User(username="stats_admin", password=get_password_hash("secret-password"), role="admin"))
+    session.commit()
+    client.cookies = client.post("/auth/login", data={"username": "stats_admin", "password": "secret-password"}).cookies
+    return client
+
+def test_stats_follow_every_write_path(session: Session, client: TestClient):
+    _add_movies(session, 10)  # ORM
+    created = _create_movie(client, title="Stats One", year=1999, rating=9.0, category="Comedy")
+    client.post("/movies/bulk", content='{"title": "Stats Two", "overview": "Imported in bulk for stats.", "year": 1999, "rating": 3.0, "category": "Comedy"}\n')
+    client.put("/movies/1", json={"category": "Comedy", "year": 1999, "rating": 6.0})
+    client.delete("/movies/2")
+
+    movies = client.get("/movies/?size=100").json()
+    stats = client.get("/movies/stats").json()
+    assert stats["total"] == len(movies) == 11
+    comedy = next(row for row in stats["categories"] if row["category"] == "Comedy")
+    assert comedy["count"] == 3 and comedy["average_rating"] == round((9.0 + 3.0 + 6.0) / 3, 2)
+    assert {"year": 1999, "count": 3} in stats["years"]
+    assert sum(row["count"] for row in stats["years"]) == 11
+
+    only_comedy = client.get("/movies/stats?category=Comedy").json()
+    assert only_comedy["total"] == 3 and only_comedy["years"] == [{"year": 1999, "count": 3}]
+    assert client.get("/movies/stats?category=Western").status_code == 404
+    assert created["id"]
+
+def test_stats_read_only_the_summary_tables(session: Session, client: TestClient):
+    import re
+    _add_movies(session, 5)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert client.get("/movies/stats").json()["total"] == 5
+    finally:
+        sa_event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert statements and not [s for s in statements if re.search(r"\bFROM movie\b", s)]
+
+def test_stats_consistency_check_repairs_drift(session: Session, client: TestClient):
+    from src.stats import check_catalog_stats
+    _add_movies(session, 6)
+    admin = _admin_client(client, session)
+    assert admin.post("/auth/dashboard/stats/check").json() == {"consistent": True, "repaired": False, "mismatches": []}
+
+    session.connection().exec_driver_sql("UPDATE movie_category_stats SET movie_count = movie_count + 5")
+    session.connection().exec_driver_sql("DELETE FROM movie_year_stats WHERE year = 2000")
+    session.commit()
+    report = admin.post("/auth/dashboard/stats/check?repair=false").json()
+    assert not report["consistent"] and not report["repaired"]
+    assert {m["table"] for m in report["mismatches"]} == {"movie_category_stats", "movie_year_stats"}
+
+    assert admin.post("/auth/dashboard/stats/check").json()["repaired"]
+    assert check_catalog_stats(session.connection()) == []
+    assert client.get("/movies/stats").json()["total"] == 6
+
+
+# ----------------------
+     # ADMISSION CONTROL
+# ----------------------
+
+def test_login_is_rate_limited_per_client(client: TestClient, monkeypatch):
+    from src.config import settings
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"POST /auth/login": "2/60"})
+    form = {"username": "nobody", "password": "wrong-password"}
+    assert [client.post("/auth/login", data=form, headers={"X-Real-IP": "10.0.0.1"}).status_code for _ in range(2)] == [401, 401]
+    limited = client.post("/auth/login", data=form, headers={"X-Real-IP": "10.0.0.1"})
+    assert limited.status_code == 429 and int(limited.headers["Retry-After"]) >= 1
+    assert client.post("/auth/login", data=form, headers={"X-Real-IP": "10.0.0.2"}).status_code == 401
+    assert client.get("/movies/").status_code == 200  # routes without a rule are not limited
+
+def test_authenticated_clients_get_their_own_bucket(session: Session, client: TestClient, monkeypatch):
+    from src.config import settings
+    from src.models.tables import User
+    from src.security import create_access_token
+    for name in ("alice", "bob"):
+        session.add(User(username=name, password="unused", role="client"))
+    session.commit()
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"GET /auth/profile": "1/60"})
+    tokens = {name: create_access_token({"username": name, "role": "client"}) for name in ("alice", "bob")}
+    profile = lambda name: TestClient(app, cookies={"access_token": tokens[name]}).get("/auth/profile").status_code
+    assert [profile("alice"), profile("bob"), profile("alice")] == [200, 200, 429]
+
+def test_concurrency_limiter_queues_with_deadline(monkeypatch):
+    import asyncio
+    from src.admission import ConcurrencyLimiter
+    from src.config import settings
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_SIZE", 1)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT_MS", 50)
+
+    async def go():
+        limiter = ConcurrencyLimiter()
+        assert await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not await limiter.acquire()  # queue full
+        assert not await waiting  # deadline
+        handed_over = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()  # the slot goes straight to the waiter
+        assert await handed_over and limiter.active == 1
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(go())
+    assert limiter.active == 0 and limiter.rejected == {"queue_full": 1, "deadline": 1}
+
+def test_overload_is_shed_and_latency_stays_bounded(monkeypatch):
+    import asyncio
+    import time
+    import httpx
+    from fastapi import FastAPI
+    from src.admission import AdmissionMiddleware
+    from src.config import settings
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_SIZE", 4)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT_MS", 100)
+    monkeypatch.setattr(settings, "RATE_LIMITS", {})
+    slow_app = FastAPI()
+    slow_app.add_middleware(AdmissionMiddleware)
+
+    @slow_app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.05)
+        return {}
+
+    async def timed(client):
+        started = time.perf_counter()
+        response = await client.get("/slow")
+        return response, time.perf_counter() - started
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=slow_app), base_url="http://test") as client:
+            return await asyncio.gather(*(timed(client) for _ in range(30)))
+
+    results = asyncio.run(go())
+    statuses = [response.status_code for response, _ in results]
+    assert statuses.count(200) >= 2 and statuses.count(503) >= 20
+    assert all(response.headers["Retry-After"] == "1" for response, _ in results if response.status_code == 503)
+    # Served requests waited at most the queue deadline: 100 ms + one 50 ms service time, plus slack
+    assert max(elapsed for response, elapsed in results if response.status_code == 200) < 0.5
+
+
+# ----------------------
+     # BATCH LOOKUP
+# ----------------------
+
+def test_batch_returns_movies_in_requested_order(session: Session, client: TestClient):
+    _add_movies(session, 5)
+    single = {id: client.get(f"/movies/{id}").json() for id in (1, 3, 5)}
+    response = client.get("/movies/batch?ids=5,42,1&ids=3,1")
+    assert response.status_code == 200
+    assert response.json() == {"movies": [single[5], single[1], single[3]], "missing": [42]}
+    assert client.post("/movies/batch", json={"ids": [3, 5, 42]}).json() == {"movies": [single[3], single[5]], "missing": [42]}
+
+def test_batch_validates_ids_and_caps_their_number(client: TestClient, monkeypatch):
+    from src.config import settings
+    monkeypatch.setattr(settings, "BATCH_MAX_IDS", 3)
+    assert client.get("/movies/batch?ids=1,x").status_code == 400
+    assert client.get("/movies/batch?ids=0").status_code == 400
+    assert client.get("/movies/batch?ids=1,2,3,4").status_code == 400
+    assert client.get("/movies/batch?ids=1,2,3,3,2").status_code == 200  # duplicates count once
+    assert client.post("/movies/batch", json={"ids": [1, 2, 3, 4]}).status_code == 400
+    assert client.post("/movies/batch", json={"ids": []}).status_code == 422
+    # Past a SQLite INTEGER: 400, not the 500 of binding it
+    too_large = client.get(f"/movies/batch?ids=1,{10 ** 20}")
+    assert too_large.status_code == 400 and too_large.json()["detail"] == f"Ids must be below {2 ** 63}"
+    assert client.post("/movies/batch", json={"ids": [1, 2 ** 70]}).status_code == 400
+    assert client.get(f"/movies/batch?ids={2 ** 63 - 1}").status_code == 200
+
+def test_batch_queries_in_chunks(session: Session, client: TestClient, monkeypatch):
+    from sqlalchemy import event
+    from src import batch
+    _add_movies(session, 7)
+    monkeypatch.setattr(batch, "IN_CHUNK_SIZE", 3)
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(session.get_bind(), "before_cursor_execute", record)
+    try:
+        body = client.post("/movies/batch", json={"ids": list(range(8, 0, -1))}).json()
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", record)
+    assert [movie["id"] for movie in body["movies"]] == list(range(7, 0, -1)) and body["missing"] == [8]
+    assert sum(" IN (" in statement for statement in statements) == 3
+
+def test_cached_batch_follows_writes(client: TestClient):
+    movie = _create_movie(client, title="Batch One")
+    url = f"/movies/batch?ids={movie['id']},{movie['id'] + 1}"
+    assert client.get(url).json()["missing"] == [movie["id"] + 1]
+    assert client.get(url).headers["X-Cache"] == "HIT"
+    created = _create_movie(client, title="Batch Two")
+    assert created["id"] == movie["id"] + 1
+    assert [m["title"] for m in client.get(url).json()["movies"]] == ["Batch One", "Batch Two"]
+    client.put(f"/movies/{movie['id']}", json={"title": "Batch Renamed"})
+    assert client.get(url).json()["movies"][0]["title"] == "Batch Renamed"
+
+def test_cached_batch_follows_bulk_imports(client: TestClient):
+    assert client.get("/movies/batch?ids=1").json()["missing"] == [1]
+    assert client.get("/movies/batch?ids=1").headers["X-Cache"] == "HIT"
+    client.post("/movies/bulk", content='{"title": "Bulk Batch", "overview": "Imported after the batch was cached.", "year": 2001, "rating": 5.0, "category": "Drama"}\n')
+    response = client.get("/movies/batch?ids=1")
+    assert response.headers["X-Cache"] == "MISS"
+    assert [movie["title"] for movie in response.json()["movies"]] == ["Bulk Batch"] and response.json()["missing"] == []
+
+def test_async_batch(async_client: TestClient):
+    movie = {"overview": "An overview served by aiosqlite.", "year": 2024, "rating": 8, "category": "Action"}
+    ids = [async_client.post("/movies/", json={**movie, "title": f"Async {i}"}).json()["id"] for i in range(3)]
+    body = async_client.get(f"/movies/batch?ids={ids[2]},{ids[0]},999").json()
+    assert [movie["title"] for movie in body["movies"]] == ["Async 2", "Async 0"] and body["missing"] == [999]
+    assert async_client.post("/movies/batch", json={"ids": ids}).json()["missing"] == []
+
+
+# ----------------------
+     # COMPRESSION
+# ----------------------
+
+@pytest.mark.parametrize("coding", ["zstd", "br", "gzip"])
+def test_list_responses_are_compressed(session: Session, client: TestClient, coding: str):
+    _add_movies(session, 40)
+    plain = client.get("/movies/?size=40", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers and plain.headers["Vary"] == "Accept-Encoding"
+    compressed = client.get("/movies/?size=40", headers={"Accept-Encoding": f"{coding}, identity;q=0.5"})
+    assert compressed.headers["Content-Encoding"] == coding
+    assert int(compressed.headers["Content-Length"]) < int(plain.headers["Content-Length"]) / 3
+    assert compressed.json() == plain.json()
+
+def test_compression_skips_small_and_binary_bodies(session: Session, client: TestClient):
+    _add_movies(session, 1)
+    assert "Content-Encoding" not in client.get("/movies/1", headers={"Accept-Encoding": "gzip"}).headers
+    pdf = client.get("/movies/get_file", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in pdf.headers and pdf.content.startswith(b"%PDF")
+    assert "Content-Encoding" not in client.get("/movies/?size=40", headers={"Accept-Encoding": "gzip;q=0"}).headers
+
+def test_compressed_files_get_a_weak_etag(tmp_path):
+    from fastapi import FastAPI
+    from src.compression import CompressionMiddleware
+    from src.files import StaticAssets
+    css = b"body { color: #333; }\n" * 100
+    (tmp_path / "styles.css").write_bytes(css)
+    static_app = FastAPI()
+    static_app.mount("/static", StaticAssets(tmp_path))
+    static_client = TestClient(CompressionMiddleware(static_app))
+
+    identity = static_client.get("/static/styles.css", headers={"Accept-Encoding": "identity"})
+    etag = identity.headers["etag"]
+    assert not etag.startswith("W/") and "content-encoding" not in identity.headers
+    gzipped = static_client.get("/static/styles.css", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip" and gzipped.headers["etag"] == f"W/{etag}"
+    revalidated = static_client.get("/static/styles.css", headers={"Accept-Encoding": "gzip", "If-None-Match": f"W/{etag}"})
+    assert revalidated.status_code == 304 and revalidated.headers["etag"] == f"W/{etag}"
+    # A range validated by the tag of the compressed body is not served from the identity bytes
+    resumed = static_client.get("/static/styles.css", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9", "If-Range": f"W/{etag}"})
+    assert resumed.status_code == 200 and resumed.content == css
+    part = static_client.get("/static/styles.css", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9", "If-Range": etag})
+    assert part.status_code == 206 and part.content == css[:10] and part.headers["etag"] == etag
+
+def test_streamed_responses_are_compressed_chunk_by_chunk(session: Session, client: TestClient, monkeypatch):
+    import zlib
+    from src.config import settings
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 10)
+    _add_movies(session, 35)
+    export = client.get("/movies/export", headers={"Accept-Encoding": "gzip"})
+    assert export.headers["Content-Encoding"] == "gzip" and "Content-Length" not in export.headers
+    assert len(export.text.splitlines()) == 35
+
+    # Every chunk is flushed: the client can decode each one as it arrives
+    import asyncio
+    from fastapi.responses import StreamingResponse
+    from src.compression import CompressionMiddleware
+    rows = [b'{"row": %d, "padding": "%s"}\n' % (i, b"x" * 600) for i in range(3)]
+    middleware = CompressionMiddleware(StreamingResponse(iter(rows), media_type="application/x-ndjson"))
+    messages = []
+    async def receive():
+        await asyncio.Event().wait()  # the client never disconnects
+    async def send(message):
+        messages.append(message)
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(middleware(scope, receive, send))
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = [decoder.decompress(message["body"]) for message in messages[1:] if message.get("more_body")]
+    assert chunks == rows
+
+def test_compression_benchmark_runs():
+    from benchmarks.compression import measure
+    results = measure(size=10, number=2)
+    assert {result["coding"] for result in results} >= {"gzip"}
+    assert all(result["bytes_out"] < result["bytes_in"] for result in results)
+
+
+# ----------------------
+     # ROW VERSIONS
+# ----------------------
+
+def test_conditional_get_of_a_movie(client: TestClient):
+    movie = _create_movie(client)
+    url = f"/movies/{movie['id']}"
+    etag = client.get(url).headers["ETag"]
+    assert etag == f'W/"{movie["id"]}.1"'
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["X-Cache"] == "HIT" and cached.content == b""
+    response_cache.clear()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    updated = client.put(url, json={"rating": 9})
+    assert updated.headers["ETag"] == f'W/"{movie["id"]}.2"'
+    fresh = client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["ETag"] == updated.headers["ETag"]
+
+def test_conditional_get_of_lists(session: Session, client: TestClient):
+    _add_movies(session, 12)
+    urls = ["/movies/?size=5", "/movies/by_category?category=drama", "/movies/search?q=movie", "/movies/batch?ids=2,99"]
+    etags = [client.get(url).headers["ETag"] for url in urls]
+    assert all(client.get(url, headers={"If-None-Match": etag}).status_code == 304 for url, etag in zip(urls, etags))
+    not_modified = client.get(urls[0], headers={"If-None-Match": etags[0]})
+    assert not_modified.headers["X-Next-Cursor"] == client.get(urls[0]).headers["X-Next-Cursor"]
+
+    client.put("/movies/2", json={"title": "Movie Renamed"})
+    assert [client.get(url, headers={"If-None-Match": etag}).status_code for url, etag in zip(urls, etags)] == [200, 200, 200, 200]
+
+def test_if_match_makes_writes_conditional(client: TestClient):
+    movie = _create_movie(client)
+    url = f"/movies/{movie['id']}"
+    etag = client.get(url).headers["ETag"]
+    # Two clients edit from the same read: the second one is told instead of overwriting
+    assert client.put(url, json={"rating": 8}, headers={"If-Match": etag}).status_code == 200
+    conflict = client.put(url, json={"rating": 2}, headers={"If-Match": etag})
+    assert conflict.status_code == 412 and conflict.headers["ETag"] == f'W/"{movie["id"]}.2"'
+    assert client.get(url).json()["rating"] == 8
+
+    assert client.put(url, json={"rating": 3}, headers={"If-Match": "*"}).status_code == 200
+    assert client.delete(url, headers={"If-Match": conflict.headers["ETag"]}).status_code == 412
+    assert client.delete(url, headers={"If-Match": '"garbage"'}).status_code == 412
+    assert client.delete(url, headers={"If-Match": f'W/"{movie["id"]}.3"'}).status_code == 200
+    assert client.delete(url, headers={"If-Match": f'W/"{movie["id"]}.3"'}).status_code == 404
+
+def test_every_update_path_bumps_the_version(session: Session):
+    movie = MovieDB(title="Versioned", overview="Overview for versions.", year=2001, rating=5, category="Drama")
+    session.add(movie)
+    session.commit()
+    stamped = movie.updated_at
+    movie.rating = 6
+    session.add(movie)
+    session.commit()
+    session.refresh(movie)
+    assert movie.version == 2 and movie.updated_at >= stamped
+    from src import writes
+    with session.get_bind().begin() as conn:
+        before, after = writes.update_movie(conn, movie.id, {"title": "Versioned Again"})
+    assert (before["version"], after["version"]) == (2, 3)
+
+
+# ----------------------
+     # CHANGE FEED
+# ----------------------
+
+def _sync(client: TestClient, since: int = 0) -> tuple[dict, int]:
+    """Applies every page after `since` to a mirror the way a client would."""
+    mirror = {}
+    while True:
+        page = client.get(f"/movies/changes?since={since}&limit=3").json()
+        for change in page["changes"]:
+            if change["deleted"]:
+                mirror.pop(change["id"], None)
+            else:
+                mirror[change["id"]] = change["movie"]
+        since = page["next_cursor"]
+        if not page["has_more"]:
+            return mirror, since
+
+def test_change_feed_follows_creates_updates_and_deletes(session: Session, client: TestClient):
+    _add_movies(session, 5)
+    mirror, cursor = _sync(client)
+    assert sorted(mirror) == [1, 2, 3, 4, 5]
+
+    client.put("/movies/2", json={"title": "Movie Renamed"})
+    client.delete("/movies/3")
+    created = _create_movie(client)
+    page = client.get(f"/movies/changes?since={cursor}").json()
+    assert [(change["id"], change["deleted"]) for change in page["changes"]] == [(2, False), (3, True), (created["id"], False)]
+    assert page["changes"][0]["movie"]["title"] == "Movie Renamed" and page["changes"][1]["movie"] is None
+    assert page["next_cursor"] == page["changes"][-1]["seq"] and not page["has_more"]
+
+    changes, cursor = _sync(client, cursor)
+    mirror.update({id: movie for id, movie in changes.items()})
+    mirror.pop(3)
+    assert mirror == {movie["id"]: movie for movie in client.get("/movies/?size=100").json()}
+    assert client.get(f"/movies/changes?since={cursor}").json() == {"changes": [], "next_cursor": cursor, "has_more": False}
+
+def test_change_feed_reads_only_what_changed(session: Session, client: TestClient):
+    import re
+    _add_movies(session, 200)
+    _, cursor = _sync(client)
+    client.put("/movies/7", json={"rating": 1})
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert [change["id"] for change in client.get(f"/movies/changes?since={cursor}").json()["changes"]] == [7]
+    finally:
+        sa_event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert not [s for s in statements if re.search(r"\bFROM movie\b", s)]
+
+def test_compaction_moves_the_snapshot_boundary(session: Session, client: TestClient):
+    _add_movies(session, 4)
+    _, old_cursor = _sync(client)
+    client.put("/movies/1", json={"rating": 2})
+    client.put("/movies/1", json={"rating": 3})
+    client.delete("/movies/2")
+    admin = _admin_client(client, session)
+
+    kept = admin.post("/auth/dashboard/changes/compact").json()
+    assert kept == {"superseded": 3, "tombstones": 0, "boundary": 0}  # all entries of 1 but the last, the insert of 2
+    assert len(client.get(f"/movies/changes?since={old_cursor}").json()["changes"]) == 2
+
+    compacted = admin.post("/auth/dashboard/changes/compact?retention_seconds=0").json()
+    assert compacted["tombstones"] == 1 and compacted["boundary"] > old_cursor
+    gone = client.get(f"/movies/changes?since={old_cursor}")
+    assert gone.status_code == 410 and "since=0" in gone.json()["detail"]
+    mirror, _ = _sync(client)
+    assert sorted(mirror) == [1, 3, 4] and mirror[1]["rating"] == 3
+
+def test_change_log_is_backfilled_for_existing_database():
+    from src.migrations import run_migrations
+    engine = create_engine("sqlite:///:memory:", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE movie (id INTEGER PRIMARY KEY, title VARCHAR, overview VARCHAR, year INTEGER, rating FLOAT, category VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO movie VALUES (1, 'Legacy', 'Stored before the change log.', 1999, 7, 'Drama'), (2, 'Older', 'Also stored before it.', 1990, 6, 'Drama')")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE movie SET rating = 8 WHERE id = 1")  # raw SQL is logged too
+        assert conn.exec_driver_sql("SELECT movie_id FROM movie_change ORDER BY seq").scalars().all() == [1, 2, 1]
+
+def test_change_stream_sends_backlog_then_new_changes(monkeypatch):
+    import asyncio
+    from src.changes import stream_changes
+    from src.config import settings
+    monkeypatch.setattr(settings, "CHANGES_STREAM_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "CHANGES_STREAM_HEARTBEAT_SECONDS", 0.03)
+    log = [{"seq": seq, "id": seq, "deleted": False, "movie": None} for seq in (1, 2, 3)]
+
+    async def read_page(since, limit):
+        changes = [change for change in log if change["seq"] > since][:limit]
+        return {"changes": changes, "next_cursor": changes[-1]["seq"] if changes else since, "has_more": len(changes) == limit}
+
+    async def consume():
+        events = []
+        disconnected = asyncio.Event()
+        async for event in stream_changes(read_page, 1, lambda: _is_set(disconnected), max_seconds=10):
+            events.append(event)
+            if len(events) == 2:
+                log.append({"seq": 7, "id": 1, "deleted": True, "movie": None})
+            if event.startswith(":"):
+                disconnected.set()
+        return events
+
+    async def _is_set(event):
+        return event.is_set()
+
+    events = asyncio.run(asyncio.wait_for(consume(), 5))
+    assert [event.split("\n")[0] for event in events] == ["id: 2", "id: 3", "id: 7", ": keep-alive"]
+    assert '"deleted":true' in events[2]
+
+def test_change_stream_endpoint(session: Session, client: TestClient):
+    _add_movies(session, 3)
+    response = client.get("/movies/changes/stream?since=1&max_seconds=0.05")
+    assert response.headers["content-type"].startswith("text/event-stream") and "content-encoding" not in response.headers
+    assert [line for line in response.text.splitlines() if line.startswith("id:")] == ["id: 2", "id: 3"]
+    resumed = client.get("/movies/changes/stream?max_seconds=0.05", headers={"Last-Event-ID": "2"})
+    assert [line for line in resumed.text.splitlines() if line.startswith("id:")] == ["id: 3"]
+    assert client.get("/movies/changes/stream?max_seconds=0.05").text == ""
+
+def test_async_change_feed(async_client: TestClient):
+    created = async_client.post("/movies/", json={"title": "Async Feed", "overview": "Created on the async router.", "year": 2010, "rating": 7, "category": "Drama"}).json()
+    async_client.delete(f"/movies/{created['id']}")
+    page = async_client.get("/movies/changes").json()
+    assert [(change["id"], change["deleted"]) for change in page["changes"]] == [(created["id"], True), (created["id"], True)]
+    stream = async_client.get("/movies/changes/stream?since=0&max_seconds=0.05")
+    assert stream.text.count("event: change") == 2
+
+
+# ----------------------
+     # SIMILAR MOVIES
+# ----------------------
+
+@pytest.fixture(name="similarity_dir")
+def similarity_dir_fixture(tmp_path, monkeypatch):
+    from src.config import settings
+    from src.similarity import shutdown_similarity
+    monkeypatch.setattr(settings, "SIMILARITY_INDEX_DIR", str(tmp_path / "similarity"))
+    yield tmp_path / "similarity"
+    shutdown_similarity()
+
+def _similar(client: TestClient, id: int, **params):
+    """GET /movies/{id}/similar, waiting out the 503 of the first build."""
+    import time
+    deadline = time.monotonic() + 30
+    while True:
+        response = client.get(f"/movies/{id}/similar", params=params)
+        if response.status_code != 503 or time.monotonic() > deadline:
+            return response
+        assert response.headers["Retry-After"]
+        time.sleep(0.05)
+
+def _add_similarity_catalog(session: Session):
+    for title, overview, category in [
+        ("Harbour Storm", "A lighthouse keeper weathers a storm at the harbour.", "Drama"),
+        ("Harbour Lights", "The lighthouse of the harbour goes dark during a storm.", "Drama"),
+        ("Orbit", "Astronauts repair a station in orbit around the moon.", "Science Fiction"),
+        ("Moon Station", "A station on the moon loses contact with orbit control.", "Science Fiction"),
+        ("Desert Road", "Two brothers drive across the desert.", "Western"),
+    ]:
+        session.add(MovieDB(title=title, overview=overview, year=2000, rating=7, category=category))
+    session.commit()
+
+def test_similar_movies_rank_by_text(session: Session, client: TestClient, similarity_dir):
+    _add_similarity_catalog(session)
+    assert client.get("/movies/1/similar").status_code in (200, 503)
+    assert [movie["id"] for movie in _similar(client, 1).json()][:1] == [2]
+    assert [movie["id"] for movie in _similar(client, 3).json()][:1] == [4]
+    assert [movie["id"] for movie in _similar(client, 5).json()] == []
+    assert len(_similar(client, 1, limit=1).json()) == 1
+    assert _similar(client, 99).status_code == 404
+    assert (similarity_dir / "CURRENT").exists()
+
+def test_similarity_index_follows_writes(session: Session, client: TestClient, similarity_dir):
+    from src.similarity import loaded_store
+    _add_similarity_catalog(session)
+    _similar(client, 1)
+    created = _create_movie(client, title="Harbour Keeper", overview="A storm hits the lighthouse at the harbour.", category="Drama")
+    assert created["id"] in [movie["id"] for movie in _similar(client, 1).json()][:2]
+    assert [movie["id"] for movie in _similar(client, created["id"]).json()][:2] in ([1, 2], [2, 1])
+
+    client.put(f"/movies/{created['id']}", json={"title": "Moon Orbit", "overview": "A station in orbit around the moon.", "category": "Science Fiction"})
+    assert [movie["id"] for movie in _similar(client, created["id"]).json()][:2] in ([3, 4], [4, 3])
+    client.delete("/movies/4")
+    assert 4 not in [movie["id"] for movie in _similar(client, 3).json()]
+    # Raw SQL (another worker, an import) is caught up from the change log by the next lookup
+    session.connection().exec_driver_sql("INSERT INTO movie (title, overview, year, rating, category, version) VALUES ('Desert Brothers', 'Brothers drive the desert road.', 2001, 6, 'Western', 1)")
+    session.commit()
+    assert [movie["title"] for movie in _similar(client, 5).json()] == ["Desert Brothers"]
+    assert loaded_store(session.get_bind()).rebuilds == 1
+
+def test_writes_leave_the_similarity_index_to_its_thread(session: Session, client: TestClient, similarity_dir, monkeypatch):
+    import threading
+    import time
+    from src.similarity import loaded_store
+    from src.tfidf import SimilarityIndex
+    _add_similarity_catalog(session)
+    _similar(client, 1)
+    store = loaded_store(session.get_bind())
+    threads = []
+    apply = SimilarityIndex.apply
+    def recorded(index, changes):
+        threads.append(threading.current_thread().name)
+        apply(index, changes)
+    monkeypatch.setattr(SimilarityIndex, "apply", recorded)
+    created = _create_movie(client, title="Harbour Keeper", overview="A storm hits the lighthouse at the harbour.", category="Drama")
+    deadline = time.monotonic() + 10
+    while not store.index.similar(created["id"], 2) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert set(store.index.similar(created["id"], 2)) == {1, 2}
+    assert threads and set(threads) == {"similarity-index"}
+
+def test_overlapping_catch_ups_apply_the_rest_of_their_changes(session: Session, client: TestClient, similarity_dir):
+    from src.similarity import loaded_store, pending_changes
+    _add_similarity_catalog(session)
+    _similar(client, 1)
+    store = loaded_store(session.get_bind())
+    since = store.index.seq
+    insert = "INSERT INTO movie (title, overview, year, rating, category, version) VALUES ('{}', 'A storm hits the lighthouse at the harbour.', 2001, 6, 'Drama', 1)"
+    session.connection().exec_driver_sql(insert.format("Harbour Keeper"))
+    session.commit()
+    first = pending_changes(session.connection(), since)
+    session.connection().exec_driver_sql(insert.format("Harbour Watch"))
+    session.commit()
+    second = pending_changes(session.connection(), since)
+    # Two writers read from the same seq; the slower one still applies its own write
+    store.apply(since, first)
+    store.apply(since, second)
+    assert store.index.seq == second[-1]["seq"]
+    assert store.index.similar(second[-1]["id"], 3)
+
+def test_incremental_updates_match_a_full_rebuild(tmp_path):
+    from src.tfidf import SimilarityIndex, build_generation
+    movies = [
+        {"id": id, "title": title, "overview": overview, "category": "Drama"}
+        for id, (title, overview) in enumerate([
+            ("Storm", "A storm at the harbour"), ("Harbour", "The harbour lighthouse"), ("Garden", "A secret garden in winter"),
+            ("Winter", "Winter in the garden"), ("Lighthouse", "A lighthouse keeper and the storm"),
+        ], start=1)
+    ]
+    index = SimilarityIndex(build_generation(tmp_path / "base", 0, movies[:4], k=3))
+    index.apply([{"seq": 1, "id": 5, "deleted": False, "movie": movies[4]}, {"seq": 2, "id": 3, "deleted": True, "movie": None}])
+    rebuilt = SimilarityIndex(build_generation(tmp_path / "full", 2, [movies[0], movies[1], movies[3], movies[4]], k=3))
+    # Same neighbours; the scores differ a little because the incremental vectors use the idf of the build
+    for id in (1, 2, 4, 5):
+        assert set(index.similar(id, 2)) == set(rebuilt.similar(id, 2)), id
+
+def test_incremental_updates_score_new_movies_against_each_other(tmp_path):
+    import time
+    from src.tfidf import SimilarityIndex, build_generation
+    topics = ["storm harbour lighthouse", "garden winter snow", "desert road brothers", "orbit moon station"]
+    movie = lambda id: {"id": id, "title": f"Film {id}", "overview": f"{topics[id % 4]} {id}", "category": "Drama"}
+    index = SimilarityIndex(build_generation(tmp_path / "base", 0, [movie(id) for id in range(1, 9)], k=3))
+    # New ids past the end of the table, then rewrites and deletes of some of them
+    started = time.perf_counter()
+    index.apply([{"seq": id, "id": id, "deleted": False, "movie": movie(id)} for id in range(9, 409)])
+    index.apply([{"seq": 409, "id": 400, "deleted": True, "movie": None}, {"seq": 410, "id": 404, "deleted": False, "movie": movie(405)}])
+    assert time.perf_counter() - started < 5  # scoring a write reads postings, it does not loop over earlier writes
+    for id in (1, 9, 200, 408):
+        assert all(other % 4 == id % 4 for other in index.similar(id, 3)), id
+        assert 400 not in index.similar(id, 3)
+    assert index.similar(404, 3) and all(other % 4 == 1 for other in index.similar(404, 3))
+    assert index.overlay_bytes() > 0
+
+def test_similar_lookup_reads_one_index_row(session: Session, client: TestClient, similarity_dir):
+    _add_movies(session, 50)
+    _similar(client, 1)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert len(client.get("/movies/7/similar?limit=5").json()) == 5
+    finally:
+        sa_event.remove(session.get_bind(), "before_cursor_execute", listener)
+    # The change log since the index (its boundary, then the empty range), then the movies by primary key
+    assert len(statements) == 3 and all("movie_change" in s for s in statements[:2]) and " IN " in statements[2]
+
+def test_similarity_index_is_rebuilt_in_the_background(session: Session, client: TestClient, similarity_dir, monkeypatch):
+    import time
+    from src.config import settings
+    from src.similarity import loaded_store
+    _add_similarity_catalog(session)
+    _similar(client, 1)
+    first = (similarity_dir / "CURRENT").read_text()
+    store = loaded_store(session.get_bind())
+    monkeypatch.setattr(settings, "SIMILARITY_REBUILD_SECONDS", 0)
+    store.request_rebuild()
+    deadline = time.monotonic() + 10
+    while store.rebuilds < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert store.rebuilds >= 2 and (similarity_dir / "CURRENT").read_text() != first
+    assert [path.name for path in similarity_dir.glob("gen-*")] == [store.index.path.name]
+
+    metrics = client.get("/metrics").text
+    mapped = next(line for line in metrics.splitlines() if line.startswith('similarity_index_bytes{part="mapped"}'))
+    assert float(mapped.split()[-1]) > 0
+
+def test_async_similar_movies(async_client: TestClient, similarity_dir):
+    for title in ("Harbour Storm", "Harbour Lights", "Desert Road"):
+        async_client.post("/movies/", json={"title": title, "overview": f"{title} at night, a film.", "year": 2000, "rating": 7, "category": "Drama"})
+    assert [movie["title"] for movie in _similar(async_client, 1, limit=1).json()] == ["Harbour Lights"]
+    created = async_client.post("/movies/", json={"title": "Harbour Storm Two", "overview": "Harbour Storm at night again.", "year": 2001, "rating": 7, "category": "Drama"}).json()
+    assert _similar(async_client, 1, limit=1).json()[0]["id"] == created["id"]
+
+
+
+def test_async_similarity_work_does_not_block_other_requests(tmp_path, similarity_dir, monkeypatch):
+    import asyncio
+    import json
+    import time
+    import httpx
+    from src.tfidf import SimilarityIndex
+    async_app = FastAPI()
+    async_app.include_router(prefix='/movies', router=async_movie_router)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'movies.db'}")
+
+    async def get_async_session_override():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+    apply = SimilarityIndex.apply
+    def slow_apply(index, changes):
+        time.sleep(0.5)  # scoring a large import
+        apply(index, changes)
+
+    async def go():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=async_app), base_url="http://test") as client:
+            await client.post("/movies/", json={"title": "Harbour Storm", "overview": "A storm at the harbour, a film.", "year": 2000, "rating": 7, "category": "Drama"})
+            while (await client.get("/movies/1/similar")).status_code == 503:
+                await asyncio.sleep(0.05)
+            monkeypatch.setattr(SimilarityIndex, "apply", slow_apply)
+            body = "\n".join(json.dumps({"title": f"Harbour {i}", "overview": "A storm at the harbour again.", "year": 2001}) for i in range(20))
+
+            async def import_then_look_up():
+                assert (await client.post("/movies/bulk", content=body.encode())).json()["inserted"] == 20
+                assert (await client.get("/movies/1/similar")).status_code == 200
+            task = asyncio.create_task(import_then_look_up())
+            answered = [time.perf_counter()]
+            while not task.done():
+                assert (await client.get("/movies/1")).status_code == 200
+                answered.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+            await task
+        await engine.dispose()
+        return [later - earlier for earlier, later in zip(answered, answered[1:])]
+
+    try:
+        gaps = asyncio.run(go())
+    finally:
+        response_cache.clear()
+    # The scoring runs in threads: the loop keeps answering while it takes 0.5 s
+    assert sum(gaps) >= 0.5 and max(gaps) < 0.3
+
+# ----------------------
+     # QUERY PROFILER
+# ----------------------
+
+@pytest.fixture(name="profile_everything")
+def profile_everything_fixture(monkeypatch):
+    from src.config import settings
+    from src.profiler import query_profiler
+    monkeypatch.setattr(settings, "QUERY_PROFILER_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "QUERY_PROFILER_SLOW_MS", 0)
+    query_profiler.reset()
+    yield query_profiler
+    query_profiler.reset()
+
+def _profiled(report: dict, fragment: str) -> dict:
+    return next(entry for entry in report["statements"] if fragment in entry["statement"])
+
+def test_query_profile_groups_statements_and_explains_slow_ones(session: Session, client: TestClient, profile_everything):
+    _add_movies(session, 6)
+    for id in (1, 2, 3):
+        client.get(f"/movies/{id}")
+    client.get("/movies/batch?ids=1,2,3")
+    client.get("/movies/batch?ids=4,5")
+    client.get("/movies/export")
+
+    report = _admin_client(client, session).get("/auth/dashboard/queries?limit=1000").json()
+    by_id = _profiled(report, "WHERE movie.id = ?")
+    assert by_id["count"] == 3 and by_id["full_scan"] is False
+    assert any("USING INTEGER PRIMARY KEY" in step for step in by_id["plan"])
+    # Every batch size is one query shape
+    assert _profiled(report, "movie.id IN (?, ...)")["count"] == 2
+    export = _profiled(report, "FROM movie ORDER BY movie.id")
+    assert export["full_scan"] is True and export["plan"] == ["SCAN movie"]
+    assert report["slow"] and report["sampled"] >= len(report["statements"])
+    totals = [entry["total_ms"] for entry in report["statements"]]
+    assert totals == sorted(totals, reverse=True)
+
+def test_query_profile_is_bounded_and_admin_only(session: Session, client: TestClient, profile_everything, monkeypatch):
+    from src.config import settings
+    from src.profiler import normalize
+    assert normalize("SELECT * FROM movie WHERE title = 'It''s' AND year > 1999 LIMIT 10") == "SELECT * FROM movie WHERE title = ? AND year > ? LIMIT ?"
+    assert normalize("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)") == "INSERT INTO t (a, b) VALUES (?, ?), ..."
+
+    monkeypatch.setattr(settings, "QUERY_PROFILER_MAX_STATEMENTS", 3)
+    for id in range(5):
+        profile_everything.record(f"SELECT {id} AS n{id}", 0.001 * (id + 1))
+    assert sorted(entry.statement for entry in profile_everything.statements.values()) == ["SELECT ? AS n2", "SELECT ? AS n3", "SELECT ? AS n4"]
+
+    assert client.get("/auth/dashboard/queries").status_code == 401
+    payload = {"username": "usuario_test_queries", "password": "password_seguro_123"}
+    client.post("/auth/register", json=payload)
+    client.cookies = client.post("/auth/login", data=payload).cookies
+    assert client.get("/auth/dashboard/queries").status_code == 403
+
+def test_async_query_profile_explains_through_aiosqlite(async_client: TestClient, profile_everything):
+    movie = {"title": "Profiled", "overview": "An overview served by aiosqlite.", "year": 2024, "rating": 8, "category": "Action"}
+    movie_id = async_client.post("/movies/", json=movie).json()["id"]
+    async_client.get(f"/movies/{movie_id}")
+    by_id = _profiled(profile_everything.report(100, "count"), "WHERE movie.id = ?")
+    assert by_id["full_scan"] is False and any("USING INTEGER PRIMARY KEY" in step for step in by_id["plan"])
+
+
+# ----------------------
+     # CATALOG SNAPSHOT
+# ----------------------
+
+CATALOG_URLS = [
+    f"/movies/?size=7&page=2&sort={sort}&order={order}{filters}"
+    for sort in ("id", "title", "year", "rating")
+    for order in ("asc", "desc")
+    for filters in ("", "&category=Drama", "&year_from=1990&year_to=2010", "&min_rating=7.5", "&category=Comedy&min_rating=5")
+] + [f"/movies/by_category?category={text}" for text in ("drama", "sci", "fiction", "science fic", "zzz")]
+
+def _catalog_responses(client: TestClient, urls: list[str], snapshot: bool, monkeypatch) -> list:
+    """Status, body and next cursor of `urls`, then of the pages their cursors lead to."""
+    from src.config import settings
+    monkeypatch.setattr(settings, "CATALOG_SNAPSHOT", snapshot)
+    results = []
+    for url in urls:
+        response_cache.clear()
+        response = client.get(url)
+        for _ in range(3):
+            results.append((url, response.status_code, response.json(), response.headers.get("X-Next-Cursor")))
+            if "X-Next-Cursor" not in response.headers:
+                break
+            # With a cursor the page number is ignored
+            response = client.get(f"{url}&cursor={response.headers['X-Next-Cursor']}")
+    return results
+
+def test_catalog_snapshot_matches_sql(session: Session, client: TestClient, monkeypatch):
+    from benchmarks.dataset import generate_movies
+    from src.config import settings
+    from src.catalog import catalog_store
+    monkeypatch.setattr(settings, "CATALOG_SNAPSHOT_MAX_LAG_SECONDS", 0)
+    # Few words and one decimal of rating: many equal titles, years and ratings to break ties on
+    session.add_all(MovieDB(**movie) for movie in generate_movies(300))
+    session.commit()
+    assert _catalog_responses(client, CATALOG_URLS, True, monkeypatch) == _catalog_responses(client, CATALOG_URLS, False, monkeypatch)
+    assert len(catalog_store(session.get_bind()).snapshot) == 300
+
+    # Writes through the API, and one behind its back
+    monkeypatch.setattr(settings, "CATALOG_SNAPSHOT", True)
+    created = _create_movie(client, title="Zebra Crossing", year=2001, rating=9.9, category="Drama")
+    client.put("/movies/5", json={"title": "Aardvark", "rating": 1.0, "category": "Science Fiction"})
+    client.delete("/movies/7")
+    session.connection().exec_driver_sql("UPDATE movie SET year = 1901 WHERE id = 9")
+    session.commit()
+    assert _catalog_responses(client, CATALOG_URLS, True, monkeypatch) == _catalog_responses(client, CATALOG_URLS, False, monkeypatch)
+    assert client.get("/movies/?sort=title&size=1").json()[0]["id"] == 5
+    assert created["id"] in [movie["id"] for movie in client.get("/movies/?min_rating=9.9&size=100").json()]
+
+def test_catalog_snapshot_serves_without_sql_and_follows_other_writers(session: Session, client: TestClient, monkeypatch):
+    from sqlalchemy import event as sa_event
+    from src.config import settings
+    monkeypatch.setattr(settings, "CATALOG_SNAPSHOT", True)
+    _add_movies(session, 12)
+    assert len(client.get("/movies/?size=100").json()) == 12
+
+    statements = []
+    count = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(session.get_bind(), "before_cursor_execute", count)
+    try:
+        client.get("/movies/?sort=rating&min_rating=5")
+        client.get("/movies/by_category?category=dra")
+        assert statements == []
+        # Another worker's write shows up once the snapshot is CATALOG_SNAPSHOT_MAX_LAG_SECONDS old
+        session.connection().exec_driver_sql("DELETE FROM movie WHERE id = 1")
+        session.commit()
+        response_cache.clear()
+        assert len(client.get("/movies/?size=100").json()) == 12
+        response_cache.clear()
+        monkeypatch.setattr(settings, "CATALOG_SNAPSHOT_MAX_LAG_SECONDS", 0)
+        assert len(client.get("/movies/?size=100").json()) == 11
+    finally:
+        sa_event.remove(session.get_bind(), "before_cursor_execute", count)
+
+def test_async_catalog_snapshot(async_client: TestClient, monkeypatch):
+    from src.config import settings
+    monkeypatch.setattr(settings, "CATALOG_SNAPSHOT", True)
+    movie = {"overview": "An overview served by aiosqlite.", "year": 2024, "rating": 8, "category": "Action"}
+    ids = [async_client.post("/movies/", json={**movie, "title": f"Async {i}", "rating": i}).json()["id"] for i in range(1, 4)]
+    assert [movie["id"] for movie in async_client.get("/movies/?sort=rating&order=desc").json()] == ids[::-1]
+    async_client.delete(f"/movies/{ids[2]}")  # invalidates the cached lists
+    assert [movie["id"] for movie in async_client.get("/movies/by_category?category=act").json()] == ids[:2]
+
+
+def test_async_catalog_snapshot_is_built_off_the_event_loop(async_client: TestClient, monkeypatch):
+    import asyncio
+    import json
+    from src.columnar import ColumnarCatalog
+    from src.config import settings
+    monkeypatch.setattr(settings, "CATALOG_SNAPSHOT", True)
+    calls = []
+    def on_loop() -> bool:
+        try:
+            return asyncio.get_running_loop() is not None
+        except RuntimeError:
+            return False
+    init, apply = ColumnarCatalog.__init__, ColumnarCatalog.apply
+    def recorded_init(snapshot, *args):
+        calls.append(("load", on_loop()))
+        init(snapshot, *args)
+    def recorded_apply(snapshot, *args):
+        calls.append(("apply", on_loop()))
+        apply(snapshot, *args)
+    monkeypatch.setattr(ColumnarCatalog, "__init__", recorded_init)
+    monkeypatch.setattr(ColumnarCatalog, "apply", recorded_apply)
+
+    async_client.post("/movies/", json={"title": "Async 1", "overview": "An overview served by aiosqlite.", "year": 2024})
+    assert len(async_client.get("/movies/").json()) == 1  # no preload: the first list builds the snapshot
+    body = "\n".join(json.dumps({"title": f"Async Bulk {i}", "overview": "An overview that is long enough.", "year": 2010}) for i in range(3))
+    assert async_client.post("/movies/bulk", content=body.encode()).json()["inserted"] == 3
+    assert len(async_client.get("/movies/").json()) == 4
+    assert ("load", False) in calls and ("apply", False) in calls
+    assert all(not loop for _, loop in calls), calls
+
+# ----------------------
+     # JOB QUEUE
+# ----------------------
+
+def test_jobs_are_queued_by_admins_only(session: Session, client: TestClient):
+    assert client.post("/auth/dashboard/jobs", json={"type": "vacuum"}).status_code == 401
+    admin = _admin_client(client, session)
+    queued = admin.post("/auth/dashboard/jobs", json={"type": "vacuum", "delay_seconds": 60})
+    assert queued.status_code == 202
+    assert queued.json() == {"id": queued.json()["id"], "status": "queued", "deduplicated": False}
+    assert admin.post("/auth/dashboard/jobs", json={"type": "defragment"}).status_code == 400
+
+    job = admin.get(f"/auth/dashboard/jobs/{queued.json()['id']}").json()
+    assert (job["type"], job["status"], job["attempts"]) == ("vacuum", "queued", 0)
+    assert admin.get("/auth/dashboard/jobs/999").status_code == 404
+    overview = admin.get("/auth/dashboard/jobs").json()
+    assert overview["queue"]["vacuum"]["queued"] == 1
+    assert overview["depth"] == 0  # delayed: not due yet
+
+def test_pending_jobs_are_deduplicated(session: Session, client: TestClient):
+    from src.jobs import JobWorker
+    admin = _admin_client(client, session)
+    first = admin.post("/auth/dashboard/jobs", json={"type": "optimize", "dedup_key": "optimize"}).json()
+    again = admin.post("/auth/dashboard/jobs", json={"type": "optimize", "dedup_key": "optimize"}).json()
+    assert again == {"id": first["id"], "status": "queued", "deduplicated": True}
+
+    worker = JobWorker(session.get_bind())
+    worker.run(worker.claim())
+    assert admin.get(f"/auth/dashboard/jobs/{first['id']}").json()["status"] == "done"
+    # Finished jobs no longer hold the key
+    assert admin.post("/auth/dashboard/jobs", json={"type": "optimize", "dedup_key": "optimize"}).json()["deduplicated"] is False
+
+def test_bulk_import_queues_one_optimize_job(session: Session, client: TestClient):
+    from src.jobs import job_stats
+    row = '{"title": "Queued", "overview": "Imported before the optimize job.", "year": 2001, "rating": 5.0, "category": "Drama"}\n'
+    client.post("/movies/bulk", content=row)
+    client.post("/movies/bulk", content=row)
+    assert job_stats(session.connection())["queue"] == {"optimize": {"queued": 1, "running": 0, "done": 0, "failed": 0}}
+
+def test_failing_jobs_retry_with_backoff_then_fail(session: Session, monkeypatch):
+    import time
+    from functools import partial
+    from src.config import settings
+    from src.database import write_queue
+    from src.jobs import JOB_TYPES, JobType, JobWorker, enqueue_job, read_job
+    calls = []
+    def flaky(engine, payload):
+        calls.append(payload)
+        raise RuntimeError("disk on fire")
+    monkeypatch.setitem(JOB_TYPES, "vacuum", JobType(flaky))
+    monkeypatch.setattr(settings, "JOBS_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "JOBS_RETRY_BASE_SECONDS", 30)
+    engine = session.get_bind()
+    id = write_queue(engine).submit(partial(enqueue_job, type="vacuum", payload={"n": 1})).result()["id"]
+    worker = JobWorker(engine)
+
+    worker.run(worker.claim())
+    job = read_job(session.connection(), id)
+    assert (job["status"], job["attempts"], job["error"]) == ("queued", 1, "RuntimeError('disk on fire')")
+    assert 15 <= job["run_at"] - time.time() <= 30  # backoff with jitter
+    assert worker.claim() is None  # not due yet
+
+    session.connection().exec_driver_sql("UPDATE job SET run_at = 0")
+    session.commit()
+    worker.run(worker.claim())
+    assert read_job(session.connection(), id)["status"] == "failed"
+    assert calls == [{"n": 1}, {"n": 1}]
+
+def test_concurrency_limit_per_job_type(session: Session, monkeypatch):
+    from functools import partial
+    from src.config import settings
+    from src.database import write_queue
+    from src.jobs import JobWorker, enqueue_job
+    monkeypatch.setattr(settings, "JOBS_WORKER_THREADS", 4)
+    monkeypatch.setattr(settings, "JOBS_CONCURRENCY", {"check_stats": 2})
+    engine = session.get_bind()
+    for type in ("optimize", "optimize", "check_stats", "check_stats", "check_stats"):
+        write_queue(engine).submit(partial(enqueue_job, type=type)).result()
+    worker = JobWorker(engine)
+    claimed = [worker.claim() for _ in range(4)]
+    assert sorted(job["type"] for job in claimed if job) == ["check_stats", "check_stats", "optimize"]
+    assert worker.running == {"optimize": 1, "check_stats": 2}
+
+    # A worker that died mid-job: the next one runs those jobs again
+    restarted = JobWorker(engine)
+    assert restarted.recover() == 3
+    assert len(list(iter(restarted.claim, None))) == 3
+
+def test_unfinished_jobs_are_retried_then_requeued_after_their_lease(session: Session, monkeypatch):
+    import time
+    from functools import partial
+    from sqlalchemy.exc import OperationalError
+    from src import jobs
+    from src.database import write_queue
+    monkeypatch.setattr(jobs, "FINISH_RETRY_SECONDS", 0)
+    monkeypatch.setitem(jobs.JOB_TYPES, "optimize", jobs.JobType(lambda engine, payload: {"ok": True}))
+    engine = session.get_bind()
+    enqueue = lambda: write_queue(engine).submit(partial(jobs.enqueue_job, type="optimize")).result()["id"]
+    write = jobs.run_write
+    failures = []
+    def locked(engine, op, times):
+        if len(failures) < times:
+            failures.append(op)
+            raise OperationalError("UPDATE job", (), Exception("database is locked"))
+        return write(engine, op)
+    worker = jobs.JobWorker(engine)
+
+    # A locked database for a moment: the outcome is written by a retry
+    id = enqueue()
+    job = worker.claim()
+    monkeypatch.setattr(jobs, "run_write", partial(locked, times=2))
+    worker.run(job)
+    assert jobs.read_job(session.connection(), id)["status"] == "done" and len(failures) == 2
+
+    # For longer: the job stays running until its lease expires, unless this worker still runs it
+    failures.clear()
+    monkeypatch.setattr(jobs, "run_write", write)
+    id = enqueue()
+    job = worker.claim()
+    monkeypatch.setattr(jobs, "run_write", partial(locked, times=jobs.FINISH_ATTEMPTS))
+    worker.run(job)
+    assert jobs.read_job(session.connection(), id)["status"] == "running"
+    monkeypatch.setattr(jobs, "run_write", write)
+    other = enqueue()
+    assert worker.claim()["id"] == other
+    assert worker.recover(started_before=time.time() - 60) == 0
+    assert worker.recover(started_before=time.time() + 1) == 1
+    assert jobs.read_job(session.connection(), id)["status"] == "queued"
+    assert jobs.read_job(session.connection(), other)["status"] == "running"
+
+def test_worker_process_runs_queued_jobs(tmp_path):
+    import time
+    from functools import partial
+    from sqlalchemy import create_engine
+    from src.changes import run_with_connection
+    from src.jobs import enqueue_job, read_job, run_write
+    from src.migrations import run_migrations
+    url = f"sqlite:///{tmp_path / 'jobs.db'}"
+    engine = create_engine(url)
+    run_migrations(engine)
+    id = run_write(engine, partial(enqueue_job, type="check_stats"))["id"]
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parent), "JOBS_POLL_SECONDS": "0.1"}
+    worker = subprocess.Popen([sys.executable, "-m", "src.jobs", "--db-url", url], cwd=tmp_path, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        assert "serving" in worker.stdout.readline()  # holds the lock from here on
+        # Another worker for the same database stands by while the first one serves it
+        second = subprocess.Popen([sys.executable, "-m", "src.jobs", "--db-url", url], cwd=tmp_path, env=env, stdout=subprocess.PIPE, text=True)
+        deadline = time.monotonic() + 60
+        while run_with_connection(engine, read_job, id)["status"] != "done" and time.monotonic() < deadline:
+            time.sleep(0.1)
+        job = run_with_connection(engine, read_job, id)
+        assert job["status"] == "done" and job["result"]["consistent"] is True
+        assert job["started_at"] >= job["run_at"] and job["finished_at"] >= job["started_at"]
+        assert second.poll() is None
+        worker.terminate()
+        assert worker.wait(30) == 0
+        assert "serving" in second.stdout.readline()  # takes over once the first one is gone
+    finally:
+        for process in (worker, second):
+            process.terminate()
+            assert process.wait(30) == 0
+        engine.dispose()